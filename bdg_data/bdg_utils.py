@@ -11,8 +11,7 @@ except ImportError:
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     import cost_data.rsmeans_utils as rsmeans_utils
 import logging
-import threading
-import inspect
+from tracing import start_span, get_caller
 
 material_export_csv_filename = "material_data_export.csv"
 material_export_csv_filepath = os.path.join("bdg_data", material_export_csv_filename)
@@ -172,17 +171,10 @@ def get_project_data_context_from_query(message, request_id=None):
         f"Please filter the following descriptions based on the user's message: {message}. "
         "Return only the most relevant descriptions."
     )
-    import logging
-    import threading
-    import inspect
-    thread_id = threading.get_ident()
-    parent_thread_id = getattr(threading.current_thread(), '_parent_ident', None)
-    caller = inspect.stack()[1].function
-    thread_id_str = str(thread_id)
-    parent_thread_str = str(parent_thread_id) if parent_thread_id else "main"
-    log_prefix = f"[id={request_id}] [thread={thread_id_str}] [parent={parent_thread_str}] [function=get_project_data_context_from_query] [called_by={caller}]"
-    logging.info(f"{log_prefix} [description=Calling run_llm_query to filter project data based on user message: {message}]")
-    response = run_llm_query(system_prompt, user_prompt, large_model=False)
+    with start_span("get_project_data_context_from_query", caller=get_caller(), request_id=request_id) as span:
+        logging.info("[id=%s] [span=%s] [function=get_project_data_context_from_query] [called_by=%s] [description=Calling run_llm_query to filter project data based on user message]", span.request_id, span.span_id, span.caller)
+        # No chat history: this runs on context worker threads, which cannot read session state
+        response = run_llm_query(system_prompt, user_prompt, large_model=False, conversation_history=[])
     confidence_threshold = 0.5  # Set a confidence threshold for filtering
     filtered_descriptions = []
     for item in response.split('||'):
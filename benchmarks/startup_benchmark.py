@@ -0,0 +1,112 @@
+"""
+Startup benchmark: cold import time of the app's modules and latency of the first LLM request.
+
+Every measurement runs in a fresh interpreter, so nothing is already imported or constructed.
+The first-request measurement runs against the offline mock server (server/mock_llm.py) with
+zero latency, so it measures client construction and the request path, not a provider.
+
+Usage, from the repository root:
+    python benchmarks/startup_benchmark.py --repeat 5 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    "server.config",
+    "llm_query",
+    "project_utils.rag_utils",
+    "intent_router",
+    "llm_calls",
+]
+
+IMPORT_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{"seconds": time.perf_counter() - start}}))
+"""
+
+FIRST_REQUEST_SCRIPT = """
+import json, os, time
+from server.mock_llm import start_mock_server
+mock = start_mock_server(port=0)
+os.environ["MOCK_LLM_URL"] = mock.base_url
+
+start = time.perf_counter()
+import server.config as config
+from llm_query import run_llm_query
+imported = time.perf_counter()
+config.set_mode("mock")
+
+def timed_request():
+    start = time.perf_counter()
+    run_llm_query("You are a benchmark.", "Say hello.", max_tokens=16, conversation_history=[], use_cache=False)
+    return time.perf_counter() - start
+
+first = timed_request()
+second = timed_request()
+print(json.dumps({"import_seconds": imported - start, "first_request_seconds": first, "warm_request_seconds": second}))
+mock.shutdown()
+"""
+
+
+def run_child(script: str) -> dict:
+    """Run script in a fresh interpreter from the repository root and parse the JSON it prints."""
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONPATH": REPO_ROOT},
+    )
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()
+        return {"error": error[-1] if error else f"exit code {result.returncode}"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples: list, key: str) -> dict:
+    values = [sample[key] for sample in samples if key in sample]
+    errors = [sample["error"] for sample in samples if "error" in sample]
+    if not values:
+        return {"error": errors[0] if errors else "no samples"}
+    return {"median": statistics.median(values), "min": min(values), "max": max(values), "samples": len(values)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import time and first-request latency")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {"imports": {}, "first_request": {}}
+    for module in MODULES:
+        samples = [run_child(IMPORT_SCRIPT.format(module=module)) for _ in range(args.repeat)]
+        results["imports"][module] = summarize(samples, "seconds")
+
+    samples = [run_child(FIRST_REQUEST_SCRIPT) for _ in range(args.repeat)]
+    for key in ("import_seconds", "first_request_seconds", "warm_request_seconds"):
+        results["first_request"][key] = summarize(samples, key)
+
+    for section, measurements in results.items():
+        print(section)
+        for name, summary in measurements.items():
+            if "error" in summary:
+                print(f"  {name:<28} error: {summary['error']}")
+            else:
+                print(f"  {name:<28} median {summary['median'] * 1000:8.1f} ms  (min {summary['min'] * 1000:.1f}, max {summary['max'] * 1000:.1f})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Local preselection of BIM model categories for a scope of work.
+
+Instead of sending all ~260 categories to the LLM, every scope item is matched against the
+category list locally, by embedding similarity and shared words, and only the shortlist is
+sent for confirmation. Confirmed lists are memoized by a content hash of the scope of work,
+so an unchanged scope is answered without any LLM call.
+"""
+
+import logging
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+import server.config as config
+from intent_router import embed_texts
+from llm_cache import content_hash
+from tracing import start_span
+
+CANDIDATES_PER_ITEM = 6
+# Minimum combined score for a category to be shortlisted for a scope item
+MIN_CANDIDATE_SCORE = 0.35
+EMBEDDING_WEIGHT = 0.7
+LEXICAL_WEIGHT = 0.3
+MEMO_SIZE = 64
+
+STOPWORDS = {"and", "the", "for", "with", "of", "to", "in", "on", "a", "an", "or", "by", "all", "other", "others"}
+
+
+def _tokens(text: str) -> set:
+    # Crude stemming so "Walls" matches "wall" and "Structural" matches "structure"
+    return {word[:6] for word in re.findall(r"[a-z]+", str(text).lower()) if word not in STOPWORDS and len(word) > 2}
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def scope_queries(scope_of_work: dict) -> list:
+    """One query per scope item, prefixed with its discipline, e.g. "Structural: Framing plans"."""
+    queries = []
+    for disciplines in (scope_of_work or {}).values():
+        if not isinstance(disciplines, dict):
+            continue
+        for discipline, items in disciplines.items():
+            for item in items:
+                query = f"{discipline}: {item}"
+                if query not in queries:
+                    queries.append(query)
+    return queries
+
+
+class CategoryIndex:
+    """Embedding and lexical index over a fixed list of categories."""
+
+    def __init__(self, categories, embed_fn=embed_texts):
+        self.categories = list(categories)
+        self.embed_fn = embed_fn
+        self._tokens = [_tokens(category) for category in self.categories]
+        self._vectors = None
+        self._vectors_model = None
+        self._lock = threading.Lock()
+
+    def _get_vectors(self):
+        """Embed the categories once per embedding model."""
+        model = config.get_runtime_config().embedding_model
+        with self._lock:
+            if self._vectors is None or self._vectors_model != model:
+                self._vectors = _normalize(self.embed_fn(self.categories))
+                self._vectors_model = model
+            return self._vectors
+
+    def _lexical_scores(self, query: str):
+        query_tokens = _tokens(query)
+        if not query_tokens:
+            return np.zeros(len(self.categories), dtype=np.float32)
+        return np.array(
+            [len(query_tokens & tokens) / len(tokens) if tokens else 0.0 for tokens in self._tokens],
+            dtype=np.float32,
+        )
+
+    def shortlist(self, queries, per_query: int = CANDIDATES_PER_ITEM, min_score: float = MIN_CANDIDATE_SCORE) -> list:
+        """
+        Return the categories that match any query, in category list order.
+        Uses lexical scores alone if the embedding endpoint is unavailable.
+        """
+        if not queries:
+            return []
+        try:
+            similarities = _normalize(self.embed_fn(queries)) @ self._get_vectors().T
+            embedding_weight, lexical_weight = EMBEDDING_WEIGHT, LEXICAL_WEIGHT
+        except Exception as e:
+            logging.warning("[function=CategoryIndex.shortlist] [description=Embedding failed, using lexical scores only: %s]", e)
+            similarities = np.zeros((len(queries), len(self.categories)), dtype=np.float32)
+            embedding_weight, lexical_weight = 0.0, 1.0
+
+        selected = set()
+        for row, query in zip(similarities, queries):
+            scores = embedding_weight * row + lexical_weight * self._lexical_scores(query)
+            for index in np.argsort(scores)[::-1][:per_query]:
+                if scores[index] < min_score:
+                    break
+                selected.add(int(index))
+        return [self.categories[index] for index in sorted(selected)]
+
+
+@lru_cache(maxsize=2)
+def get_category_index(categories: tuple) -> CategoryIndex:
+    """Process-wide index per category list; category embeddings are computed on first use."""
+    return CategoryIndex(categories)
+
+
+class CategoryMemo:
+    """Bounded memo of confirmed category lists keyed by the scope and category list hashes."""
+
+    def __init__(self, max_size: int = MEMO_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(self._entries[key])
+            self.misses += 1
+            return None
+
+    def set(self, key, categories: list):
+        with self._lock:
+            self._entries[key] = tuple(categories)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+category_memo = CategoryMemo()
+
+
+def preselect_categories(scope_of_work: dict, categories) -> list:
+    """Shortlist the categories the scope of work is likely to need."""
+    queries = scope_queries(scope_of_work)
+    with start_span("preselect_categories", queries=len(queries), categories=len(categories)) as span:
+        candidates = get_category_index(tuple(categories)).shortlist(queries)
+        span.set(candidates=len(candidates))
+    return candidates
@@ -0,0 +1,130 @@
+"""
+Context providers for routed chat messages.
+
+Each provider turns a user message into a block of reference text for the handler's prompt.
+SpeculativeContext starts every provider at the same time as routing, so a turn costs roughly
+the slowest stage instead of the sum of all of them. Providers the route does not need are
+cancelled, or their results are discarded if they have already started.
+"""
+
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from tracing import start_span
+
+CONTEXT_TIMEOUT_SECONDS = 20
+MAX_CONTEXT_WORKERS = 8
+
+_context_executor = ThreadPoolExecutor(max_workers=MAX_CONTEXT_WORKERS, thread_name_prefix="context")
+
+
+def get_knowledge_base_context(message: str) -> str:
+    """Reranked passages from the shared RAG database."""
+    from project_utils import rag_utils
+    return rag_utils.get_rag_context_from_query(message)
+
+
+def get_project_cost_context(message: str) -> str:
+    """Quantities and costs from the project's BDG export filtered to the message."""
+    from bdg_data import bdg_utils
+    return bdg_utils.get_project_data_context_from_query(message)
+
+
+# Data source name -> provider. Names match llm_calls.DATA_SOURCES.
+CONTEXT_PROVIDERS = {
+    "knowledge_base": get_knowledge_base_context,
+    "project_cost_data": get_project_cost_context,
+}
+
+# Data sources each prompt type always uses, in addition to what the router asked for
+PROMPT_TYPE_DATA_SOURCES = {
+    "contract_language": ["knowledge_base"],
+    "scope_of_work_question": ["knowledge_base", "project_cost_data"],
+    "complete_contract_draft": [],
+    "scope_of_work_change": [],
+    "assumptions_and_exclusions_change": [],
+}
+
+
+def _run_provider(name, provider, message):
+    with start_span("context_provider", provider=name) as span:
+        try:
+            context = provider(message) or ""
+        except Exception as e:
+            # Missing databases or data files should degrade to no context, not fail the turn
+            logging.warning("[function=context_provider] [description=Context provider %s failed: %s]", name, e)
+            context = ""
+        span.set(context_chars=len(context))
+    return context
+
+
+def _submit(name, message, providers):
+    # Copy the context so provider spans nest under the caller's span
+    ctx = contextvars.copy_context()
+    return _context_executor.submit(ctx.run, _run_provider, name, providers[name], message)
+
+
+def needed_data_sources(route: dict) -> list:
+    """Data sources a routing decision needs: those the router flagged plus the prompt type's defaults."""
+    needed = [name for name, wanted in route.get("data_sources", {}).items() if wanted]
+    for name in PROMPT_TYPE_DATA_SOURCES.get(route.get("prompt_type"), []):
+        if name not in needed:
+            needed.append(name)
+    return needed
+
+
+class SpeculativeContext:
+    """Start every context provider immediately; keep only the results the route turns out to need."""
+
+    def __init__(self, message: str, providers: dict = CONTEXT_PROVIDERS):
+        self.message = message
+        self.providers = providers
+        self.futures = {name: _submit(name, message, providers) for name in providers}
+
+    def resolve(self, needed, timeout=CONTEXT_TIMEOUT_SECONDS) -> dict:
+        """
+        Cancel the providers that are not needed and wait for the rest.
+        Returns {data_source: context} for the needed sources that produced context.
+        """
+        for name, future in self.futures.items():
+            if name not in needed:
+                future.cancel()
+        results = {}
+        for name in needed:
+            future = self.futures.get(name)
+            if future is None:
+                continue
+            try:
+                context = future.result(timeout=timeout)
+            except FutureTimeoutError:
+                logging.warning("[function=SpeculativeContext.resolve] [description=Context provider %s timed out]", name)
+                future.cancel()
+                continue
+            if context:
+                results[name] = context
+        return results
+
+    def cancel(self):
+        for future in self.futures.values():
+            future.cancel()
+
+
+def fetch_context(message: str, needed, providers: dict = CONTEXT_PROVIDERS, timeout=CONTEXT_TIMEOUT_SECONDS) -> dict:
+    """Non-speculative path: run only the needed providers, concurrently, after routing."""
+    futures = {name: _submit(name, message, providers) for name in needed if name in providers}
+    results = {}
+    for name, future in futures.items():
+        try:
+            context = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            continue
+        if context:
+            results[name] = context
+    return results
+
+
+def format_context(contexts: dict) -> str:
+    """Join provider results into one block for a prompt, labelled by data source."""
+    return "\n\n".join(f"[{name}]\n{context}" for name, context in contexts.items())
@@ -0,0 +1,203 @@
+"""
+Section-parallel contract drafting.
+
+The contract template is split into its articles. A short call to the small model decides
+which articles the scope of work and the user's request affect; only those are redrafted,
+each in its own call on a bounded worker pool, and the draft is streamed back in template
+order. Every call sees one article instead of the whole template, and the slowest article
+sets the wall-clock time instead of the sum of all of them.
+"""
+
+import contextvars
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from prompt_builder import PromptBuilder
+from structured_output import parse_structured, StructuredOutputError
+from tracing import start_span
+
+CONTRACT_TEMPLATE_PATH = "./template/contact-template-short.md"
+
+MAX_DRAFT_WORKERS = 4
+SECTION_MAX_TOKENS = 2000
+SELECTION_MAX_TOKENS = 100
+
+# Sections are split at this heading level ("## ARTICLE 3: ...")
+SECTION_HEADING = re.compile(r"^## +(.+?)\s*$", re.MULTILINE)
+
+# Lexical fallback: sections whose heading contains one of these always depend on the scope of work
+SCOPE_SECTION_KEYWORDS = ("INITIAL INFORMATION", "SCOPE", "SERVICES", "COMPENSATION")
+
+_draft_executor = ThreadPoolExecutor(max_workers=MAX_DRAFT_WORKERS, thread_name_prefix="contract-draft")
+
+
+class TemplateSection:
+    """One article of the contract template."""
+
+    __slots__ = ("number", "heading", "text")
+
+    def __init__(self, number: int, heading: str, text: str):
+        self.number = number
+        self.heading = heading
+        self.text = text
+
+    def __repr__(self):
+        return f"TemplateSection({self.number}, {self.heading!r})"
+
+
+def split_sections(template: str) -> list:
+    """
+    Split a markdown template into sections at its level-2 headings.
+    Text before the first heading becomes section 0 with the document title as its heading.
+    """
+    matches = list(SECTION_HEADING.finditer(template))
+    sections = []
+    preamble = template[:matches[0].start()] if matches else template
+    if preamble.strip():
+        title = preamble.strip().splitlines()[0].lstrip("# ").strip()
+        sections.append(TemplateSection(0, title, preamble.strip()))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(template)
+        text = template[match.start():end].strip().removesuffix("---").strip()
+        sections.append(TemplateSection(len(sections), match.group(1), text))
+    return sections
+
+
+@lru_cache(maxsize=1)
+def load_template_sections(path: str = CONTRACT_TEMPLATE_PATH) -> tuple:
+    """Read and split the contract template once per process."""
+    with open(path, "r") as f:
+        return tuple(split_sections(f.read()))
+
+
+def _words(text: str) -> set:
+    # Crude stemming so "copyright" matches "COPYRIGHTS"
+    return {word[:6] for word in re.findall(r"[a-z]{4,}", str(text).lower())}
+
+
+def select_sections_lexically(message: str, sections) -> list:
+    """Fallback selection: scope-dependent sections plus any section sharing vocabulary with the request."""
+    message_words = _words(message)
+    selected = []
+    for section in sections:
+        heading = section.heading.upper()
+        if any(keyword in heading for keyword in SCOPE_SECTION_KEYWORDS) or message_words & _words(section.heading):
+            selected.append(section.number)
+    return selected
+
+
+def select_sections(message: str, scope_of_work, sections, request_id: str = None) -> list:
+    """
+    Ask the small model which sections the scope of work and the request affect.
+    Returns a sorted list of section numbers. Falls back to lexical selection if the reply is unusable.
+    """
+    from llm_query import run_llm_query
+
+    system_prompt = PromptBuilder("contract_section_selection").static(
+        "You plan edits to an Architect Owner Agreement drafted from a template.",
+        "Given the project's scope of work and the user's request, decide which numbered template sections must be edited.",
+        "Sections that describe the project, its program, the architect's services, deliverables or compensation usually depend on the scope of work.",
+        "Respond only with a JSON list of section numbers, for example [1, 3, 11].",
+        "Do not include any explanations or additional text.",
+        "Template sections:",
+        *[f"{section.number}. {section.heading}" for section in sections],
+    ).session(
+        f"Project Scope of Work:\n{scope_of_work}",
+    ).build()
+
+    with start_span("select_contract_sections", request_id=request_id) as span:
+        response = run_llm_query(
+            system_prompt=system_prompt,
+            user_input=message,
+            max_tokens=SELECTION_MAX_TOKENS,
+            large_model=False,
+            request_id=request_id,
+            conversation_history=[],
+        )
+        numbers = {section.number for section in sections}
+        try:
+            selected = sorted(set(parse_structured(response, "section_numbers")) & numbers)
+        except StructuredOutputError as e:
+            logging.warning("[function=select_sections] [description=Invalid section selection, using lexical fallback: %s]", e)
+            selected = []
+        if not selected:
+            selected = select_sections_lexically(message, sections)
+            span.set(fallback=True)
+        span.set(selected=len(selected), sections=len(sections))
+    return selected
+
+
+def draft_section(section: TemplateSection, message: str, scope_of_work, context_lines=(), conversation_history=None, request_id: str = None) -> str:
+    """Redraft one template section for the project. Returns the section as markdown."""
+    from llm_query import run_llm_query
+
+    system_prompt = PromptBuilder("contract_section_draft").static(
+        "You are drafting one section of an Architect Owner Agreement from a contract template.",
+        "Edit the section so it reflects the user's requirements and the project's scope of work.",
+        "Keep the section's heading and structure. Use markdown formatting, and show edited text in bold red.",
+        "Add a short notation after each edit indicating what changed.",
+        "Respond only with the edited section.",
+    ).session(
+        f"Project Scope of Work:\n{scope_of_work}",
+        "",
+    ).volatile(
+        f"Template section:\n{section.text}",
+        *context_lines,
+    ).build()
+
+    with start_span("draft_contract_section", request_id=request_id, section=section.number) as span:
+        response = run_llm_query(
+            system_prompt=system_prompt,
+            user_input=message,
+            max_tokens=SECTION_MAX_TOKENS,
+            request_id=request_id,
+            conversation_history=conversation_history or [],
+        )
+        span.set(response_chars=len(response))
+    return response
+
+
+def unchanged_section(section: TemplateSection) -> str:
+    return f"## {section.heading}\n\n*Unchanged.*"
+
+
+def draft_contract(message: str, scope_of_work, context_lines=(), conversation_history=None, request_id: str = None):
+    """
+    Draft the contract section by section.
+    Returns a generator of markdown chunks in template order. Affected sections are drafted
+    concurrently on the drafting pool; each chunk is yielded as soon as it and every section
+    before it are ready. conversation_history is passed through explicitly because session
+    state is not reachable from the worker threads.
+    """
+    sections = load_template_sections()
+    selected = set(select_sections(message, scope_of_work, sections, request_id=request_id))
+
+    futures = {}
+    for section in sections:
+        if section.number in selected:
+            # Copy the context so section spans nest under the caller's span
+            ctx = contextvars.copy_context()
+            futures[section.number] = _draft_executor.submit(
+                ctx.run, draft_section, section, message, scope_of_work, tuple(context_lines), conversation_history, request_id
+            )
+
+    def generate():
+        try:
+            for section in sections:
+                future = futures.get(section.number)
+                if future is None:
+                    yield unchanged_section(section) + "\n\n"
+                    continue
+                try:
+                    yield future.result().strip() + "\n\n"
+                except Exception as e:
+                    logging.error("[function=draft_contract] [description=Drafting section %s failed: %s]", section.number, e)
+                    yield f"## {section.heading}\n\n*This section could not be drafted: {e}*\n\n"
+        finally:
+            # Stop queued sections if the consumer goes away early
+            for future in futures.values():
+                future.cancel()
+
+    return generate()
@@ -0,0 +1,162 @@
+"""
+Token-budgeted conversation context with rolling summaries.
+
+The most recent turns are sent verbatim as long as they fit in the token budget.
+Older turns are folded into a running summary by a background worker, so the prompt
+stays roughly the same size however long the session runs and the user's turn never
+waits on the summarisation call.
+"""
+
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+HISTORY_TOKEN_BUDGET = 2000  # Tokens of verbatim history sent with each request
+MIN_RECENT_TURNS = 2  # Always keep at least the last exchange, even if it exceeds the budget
+SUMMARY_MAX_TOKENS = 400
+
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-summary")
+
+_encoding = None
+_encoding_loaded = False
+
+
+def count_tokens(text) -> int:
+    """Count tokens with tiktoken when it is installed, otherwise estimate ~4 characters per token."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = None
+        _encoding_loaded = True
+    text = str(text)
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def summarize_turns(previous_summary: str, turns: list) -> str:
+    """Fold turns into the previous summary with a call to the small model."""
+    from llm_query import run_llm_query
+
+    transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+    system_prompt = "\n".join(
+        [
+            "You maintain a running summary of a conversation between an architect and an AI assistant about an AEC contract and its scope of work.",
+            "Update the summary with the new turns below.",
+            "Keep every decision, requirement, project fact and open question. Drop pleasantries and repetition.",
+            f"Keep the summary under {SUMMARY_MAX_TOKENS} tokens. Respond only with the updated summary.",
+            "",
+            f"Current summary:\n{previous_summary or '(empty)'}",
+        ]
+    )
+    return run_llm_query(
+        system_prompt=system_prompt,
+        user_input=f"New turns:\n{transcript}",
+        max_tokens=SUMMARY_MAX_TOKENS,
+        large_model=False,
+        conversation_history=[],
+    )
+
+
+class ConversationContext:
+    """
+    Selects which parts of an append-only conversation history to send with a request.
+    One instance is kept per session (see get_session_context).
+    """
+
+    def __init__(self, token_budget=HISTORY_TOKEN_BUDGET, summarizer=summarize_turns):
+        self.token_budget = token_budget
+        self.summarizer = summarizer
+        self.summary = ""
+        self.summarized_upto = 0  # history[:summarized_upto] is covered by self.summary
+        self._token_counts = []
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def _update_token_counts(self, history, token_counts=None):
+        """Count tokens for turns appended since the last call, unless token_counts are given. History is append-only."""
+        if len(history) < len(self._token_counts):
+            # History was reset; start over
+            self._token_counts = []
+            with self._lock:
+                self.summary = ""
+                self.summarized_upto = 0
+        if token_counts is not None:
+            self._token_counts.extend(token_counts[len(self._token_counts):len(history)])
+            return
+        for turn in history[len(self._token_counts):]:
+            self._token_counts.append(count_tokens(turn.get("content", "")))
+
+    def select(self, history, token_counts=None):
+        """
+        Return (recent_turns, summary) for a request.
+        recent_turns are the newest turns that fit in the token budget; summary covers older turns
+        and may lag behind by the turns still being summarised in the background.
+        token_counts, if given, are the turns' precounted token counts (see MessageStore.history_tokens).
+        """
+        self._update_token_counts(history, token_counts)
+
+        split = len(history)
+        used = 0
+        while split > 0:
+            turn_tokens = self._token_counts[split - 1]
+            kept = len(history) - split
+            if used + turn_tokens > self.token_budget and kept >= MIN_RECENT_TURNS:
+                break
+            used += turn_tokens
+            split -= 1
+
+        with self._lock:
+            summary = self.summary
+            if split > self.summarized_upto:
+                self._schedule_summary(history[self.summarized_upto:split], split)
+        return list(history[split:]), summary
+
+    def _schedule_summary(self, turns, upto):
+        """Start a background fold of turns into the summary unless one is already running. Caller holds the lock."""
+        if self._pending is not None and not self._pending.done():
+            return
+        previous_summary = self.summary
+        turns = [dict(turn) for turn in turns]
+
+        def fold():
+            try:
+                new_summary = self.summarizer(previous_summary, turns)
+            except Exception as e:
+                logging.warning("[function=ConversationContext.fold] [description=History summary failed: %s]", e)
+                return
+            with self._lock:
+                # Ignore results made stale by a history reset
+                if self.summarized_upto < upto and self.summary == previous_summary:
+                    self.summary = new_summary
+                    self.summarized_upto = upto
+
+        # Run with the caller's context so the summary uses the session's backend
+        self._pending = _summary_executor.submit(contextvars.copy_context().run, fold)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "history_turns": len(self._token_counts),
+                "history_tokens": sum(self._token_counts),
+                "summarized_turns": self.summarized_upto,
+                "summary_tokens": count_tokens(self.summary) if self.summary else 0,
+                "summary_pending": self._pending is not None and not self._pending.done(),
+            }
+
+
+def get_session_context() -> ConversationContext:
+    """Return the ConversationContext stored in the current Streamlit session, creating it on first use."""
+    import streamlit as st
+    return st.session_state.setdefault("conversation_context", ConversationContext())
+
+
+def with_summary(system_prompt: str, summary: str) -> str:
+    """Append the rolling summary to the end of a system prompt, keeping the static part first."""
+    if not summary:
+        return system_prompt
+    return f"{system_prompt}\n\nSummary of the earlier conversation:\n{summary}"
@@ -0,0 +1,197 @@
+"""
+On-demand exports of the scope of work and the assumptions and exclusions.
+
+Nothing is built during a rerun unless it is asked for. Built exports are cached by the
+document kind, the format and a content hash of the document, so asking again for an
+unchanged document returns the cached bytes, whichever session asks.
+"""
+
+import io
+import logging
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from llm_cache import content_hash
+from tracing import start_span
+
+SCOPE = "scope_of_work"
+ASSUMPTIONS = "ASSUMPTIONS_AND_EXCLUSIONS"
+
+CACHE_SIZE = 64
+
+DOCUMENT_LABELS = {SCOPE: "scope of work", ASSUMPTIONS: "assumptions and exclusions"}
+FILE_NAMES = {SCOPE: "scope_of_work", ASSUMPTIONS: "assumptions_and_exclusions"}
+MIME_TYPES = {
+    "csv": "text/csv",
+    "md": "text/markdown",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+FOOTER = "\\* This scope of work was generated with the assistance of ContractCadence, an AI-powered AEC contract assistant."
+
+
+class Export(NamedTuple):
+    kind: str
+    fmt: str
+    digest: str
+    data: bytes
+    file_name: str
+    mime: str
+
+
+def scope_markdown(scope_of_work) -> str:
+    markdown_lines = []
+    try:
+        for phase, disciplines in scope_of_work.items():
+            markdown_lines.append(f"##### {phase}")
+            try:
+                for discipline, items in disciplines.items():
+                    markdown_lines.append(f"###### {discipline}")
+                    for item in items:
+                        markdown_lines.append(f"- {item}")
+            except Exception as e:
+                continue
+    except Exception as e:
+        markdown_lines.append("No scope items yet.")
+    markdown_lines.append("\n")
+    markdown_lines.append(FOOTER)
+    return "\n".join(markdown_lines)
+
+
+def scope_csv(scope_of_work) -> str:
+    import pandas as pd
+    return pd.DataFrame(scope_of_work).to_csv(index=False)
+
+
+def scope_docx(scope_of_work) -> bytes:
+    from docx import Document
+    doc = Document()
+    try:
+        for phase, disciplines in scope_of_work.items():
+            doc.add_heading(phase, level=1)
+            try:
+                for discipline, items in disciplines.items():
+                    doc.add_heading(discipline, level=2)
+                    for item in items:
+                        doc.add_paragraph(item, style='List Bullet')
+            except Exception as e:
+                continue
+    except Exception as e:
+        pass
+    docx_content = io.BytesIO()
+    doc.save(docx_content)
+    return docx_content.getvalue()
+
+
+def assumptions_markdown(assumptions_and_exclusions) -> str:
+    markdown_lines = []
+    for discipline, items in assumptions_and_exclusions.items():
+        markdown_lines.append(f"##### {discipline}")
+        for item in items:
+            markdown_lines.append(f"- {item}")
+    return "\n".join(markdown_lines)
+
+
+def assumptions_csv(assumptions_and_exclusions) -> str:
+    import pandas as pd
+    discipline_col_rows = []
+    item_col_rows = []
+    for discipline, items in assumptions_and_exclusions.items():
+        for item in items:
+            discipline_col_rows.append(discipline)
+            item_col_rows.append(item)
+    return pd.DataFrame({
+        "Discipline": discipline_col_rows,
+        "Assumptions & Exclusions": item_col_rows
+    }).to_csv(index=False)
+
+
+def assumptions_docx(assumptions_and_exclusions) -> bytes:
+    from docx import Document
+    doc = Document()
+    doc.add_heading("Assumptions and Exclusions", level=0)
+    for discipline, items in assumptions_and_exclusions.items():
+        doc.add_heading(discipline, level=1)
+        for item in items:
+            doc.add_paragraph(item, style='List Bullet')
+    docx_content = io.BytesIO()
+    doc.save(docx_content)
+    return docx_content.getvalue()
+
+
+BUILDERS = {
+    (SCOPE, "md"): scope_markdown,
+    (SCOPE, "csv"): scope_csv,
+    (SCOPE, "docx"): scope_docx,
+    (ASSUMPTIONS, "md"): assumptions_markdown,
+    (ASSUMPTIONS, "csv"): assumptions_csv,
+    (ASSUMPTIONS, "docx"): assumptions_docx,
+}
+
+
+class ExportCache:
+    """Bounded LRU of built exports keyed by (kind, format, content hash). Safe to share between threads."""
+
+    def __init__(self, max_size: int = CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, export: Export):
+        with self._lock:
+            self._entries[key] = export
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+export_cache = ExportCache()
+
+
+def export(kind: str, fmt: str, document, digest: str = None) -> Export:
+    """
+    Build, or fetch from the cache, one export of a document.
+    Pass digest if the document's content_hash is already known.
+    """
+    if (kind, fmt) not in BUILDERS:
+        raise ValueError(f"Unsupported export: {kind} as {fmt}")
+    digest = digest or content_hash(document)
+    key = (kind, fmt, digest)
+    cached = export_cache.get(key)
+    if cached is not None:
+        return cached
+
+    with start_span("export", kind=kind, fmt=fmt) as span:
+        data = BUILDERS[(kind, fmt)](document)
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        span.set(size=len(data))
+    logging.info("[function=export] [description=Built %s export of %s (%d bytes)]", fmt, kind, len(data))
+
+    built = Export(kind, fmt, digest, data, f"{FILE_NAMES[kind]}.{fmt}", MIME_TYPES[fmt])
+    export_cache.set(key, built)
+    return built
+
+
+def markdown(kind: str, document, digest: str = None) -> str:
+    """Markdown view of a document, cached like the other exports."""
+    return export(kind, "md", document, digest).data.decode("utf-8")
+
+
+def export_stats() -> dict:
+    return export_cache.stats()
@@ -0,0 +1,178 @@
+"""
+Local embedding-based intent router for chat messages.
+
+Each prompt type is described by a handful of labelled example utterances. Their embeddings
+are averaged into one centroid per prompt type, and a message is routed to the nearest centroid
+by cosine similarity. The router only answers when it is confident; otherwise the caller falls
+back to the LLM classifier.
+"""
+
+import logging
+import threading
+import time
+
+import numpy as np
+
+import server.config as config
+from tracing import start_span
+
+# Routing is accepted only if the best centroid is at least this similar...
+MIN_SIMILARITY = 0.55
+# ...and beats the runner-up by at least this margin
+MIN_MARGIN = 0.04
+# After the examples fail to embed, route everything to the LLM router for this long before trying again
+EMBEDDING_RETRY_SECONDS = 60.0
+
+PROMPT_TYPE_EXAMPLES = {
+    "contract_language": [
+        "What are the standard clauses in an Architect Owner Agreement?",
+        "How should the limitation of liability clause be worded?",
+        "Suggest indemnification language that protects the architect.",
+        "What does the standard of care clause mean for us?",
+        "Is the termination for convenience clause favorable to the architect?",
+        "How should we word the copyright and license provisions?",
+        "What insurance requirements are typical in an AIA B101?",
+    ],
+    "complete_contract_draft": [
+        "Generate the full contract draft.",
+        "Draft the complete agreement using the template.",
+        "Write up the contract based on our scope of work.",
+        "Can you produce the owner architect agreement now?",
+        "Fill in the B101 template for this project.",
+        "Prepare a draft contract I can send to the owner.",
+    ],
+    "scope_of_work_question": [
+        "What is included in the schematic design phase?",
+        "Does the scope cover structural engineering?",
+        "Which deliverables are in construction documents?",
+        "Are renderings part of our current scope?",
+        "What assumptions have we made about existing conditions?",
+        "Summarize the current scope of work.",
+        "Is MEP coordination excluded?",
+    ],
+    "scope_of_work_change": [
+        "Add landscape design to the design development phase.",
+        "Remove renderings from schematic design.",
+        "Add a construction administration phase with site visits.",
+        "We also need a civil engineering discipline.",
+        "Move the building sections to construction documents.",
+        "Include interior design in the scope.",
+        "Expand the scope to cover a parking garage.",
+    ],
+    "assumptions_and_exclusions_change": [
+        "Add an exclusion for hazardous materials surveys.",
+        "Assume the owner provides a geotechnical report.",
+        "Remove the assumption about one site visit.",
+        "Exclude LEED certification from our services.",
+        "Add an assumption that existing drawings are accurate.",
+        "Exclude permit expediting fees.",
+    ],
+}
+
+
+def embed_texts(texts, model=None):
+    """Embed a batch of texts with the configured embedding model. Returns an (n, d) array."""
+    runtime_config = config.get_runtime_config()
+    model = model or runtime_config.embedding_model
+    response = runtime_config.client.embeddings.create(input=list(texts), model=model)
+    return np.array([item.embedding for item in response.data], dtype=np.float32)
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class IntentRouter:
+    """Nearest-centroid classifier over embedded example utterances."""
+
+    def __init__(self, examples=PROMPT_TYPE_EXAMPLES, embed_fn=embed_texts, min_similarity=MIN_SIMILARITY, min_margin=MIN_MARGIN):
+        self.examples = examples
+        self.embed_fn = embed_fn
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self._labels = list(examples.keys())
+        self._centroids = None
+        self._centroids_model = None
+        self._unavailable_until = {}  # embedding model -> time.monotonic() before which embedding is not retried
+        self._lock = threading.Lock()
+
+        self.routed = 0
+        self.fallbacks = 0
+
+    def _get_centroids(self):
+        """
+        Embed the examples once per embedding model and cache their normalized centroids.
+        Returns None without embedding anything while a recent failure for the model is cached.
+        """
+        model = config.get_runtime_config().embedding_model
+        with self._lock:
+            if self._centroids is None or self._centroids_model != model:
+                if time.monotonic() < self._unavailable_until.get(model, 0.0):
+                    return None
+                try:
+                    centroids = []
+                    for label in self._labels:
+                        vectors = _normalize(self.embed_fn(self.examples[label]))
+                        centroids.append(vectors.mean(axis=0))
+                except Exception:
+                    # Don't make every session wait behind a failing backend on each message
+                    self._unavailable_until[model] = time.monotonic() + EMBEDDING_RETRY_SECONDS
+                    raise
+                self._unavailable_until.pop(model, None)
+                self._centroids = _normalize(np.stack(centroids))
+                self._centroids_model = model
+            return self._centroids
+
+    def scores(self, message: str):
+        """
+        Return the cosine similarity between the message and every prompt type centroid,
+        or None if the centroids are unavailable (see _get_centroids).
+        """
+        centroids = self._get_centroids()
+        if centroids is None:
+            return None
+        vector = _normalize(self.embed_fn([message]))[0]
+        similarities = centroids @ vector
+        return {label: float(similarity) for label, similarity in zip(self._labels, similarities)}
+
+    def route(self, message: str):
+        """
+        Return (prompt_type, confidence) if the router is confident, otherwise (None, confidence).
+        Confidence is the cosine similarity of the best-matching centroid.
+        """
+        with start_span("intent_router.route") as span:
+            try:
+                scores = self.scores(message)
+            except Exception as e:
+                logging.warning("[function=IntentRouter.route] [description=Embedding failed, deferring to LLM classifier: %s]", e)
+                self.fallbacks += 1
+                span.set(routed=False, error_reason=str(e))
+                return None, 0.0
+            if scores is None:
+                self.fallbacks += 1
+                span.set(routed=False, error_reason="embedding unavailable")
+                return None, 0.0
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            best_label, best_score = ranked[0]
+            margin = best_score - ranked[1][1] if len(ranked) > 1 else best_score
+            confident = best_score >= self.min_similarity and margin >= self.min_margin
+            span.set(prompt_type=best_label, similarity=best_score, margin=margin, routed=confident)
+        if confident:
+            self.routed += 1
+            return best_label, best_score
+        self.fallbacks += 1
+        return None, best_score
+
+    def stats(self) -> dict:
+        total = self.routed + self.fallbacks
+        return {
+            "routed_locally": self.routed,
+            "fallbacks": self.fallbacks,
+            "local_rate": self.routed / total if total else 0.0,
+        }
+
+
+# Process-wide router; centroids are computed on first use
+intent_router = IntentRouter()
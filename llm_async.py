@@ -0,0 +1,136 @@
+"""
+Shared asyncio runtime for LLM calls.
+
+A single background event loop serves every Streamlit session in the process, so
+pending requests are coroutines on that loop instead of blocked OS threads.
+Each model gets a semaphore that caps how many of its requests are in flight at once.
+Requests made from worker threads (run_llm_query) take the model's slot through
+model_slot_sync, which applies the same per-model limit.
+"""
+
+import asyncio
+import contextvars
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+MAX_CONCURRENT_REQUESTS_PER_MODEL = 4
+
+_loop = None
+_loop_lock = threading.Lock()
+
+# (loop, model) -> asyncio.Semaphore. Semaphores are bound to the loop they are used on.
+_semaphores = {}
+# model -> threading.BoundedSemaphore for requests made from threads
+_thread_semaphores = {}
+_model_limits = {}
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def get_event_loop():
+    """Return the process-wide LLM event loop, starting its thread on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="llm-async-loop", daemon=True)
+            thread.start()
+            _loop = loop
+    return _loop
+
+
+def _in_caller_context(coro):
+    """Wrap coro so it runs with the caller's context variables (runtime config, current span)."""
+    ctx = contextvars.copy_context()
+
+    async def run():
+        for var, value in ctx.items():
+            var.set(value)
+        return await coro
+    return run()
+
+
+def submit(coro):
+    """
+    Schedule a coroutine on the shared loop from any thread.
+    Returns a concurrent.futures.Future.
+    """
+    return asyncio.run_coroutine_threadsafe(_in_caller_context(coro), get_event_loop())
+
+
+def run_sync(coro, timeout=None):
+    """
+    Run a coroutine on the shared loop and block the calling thread until it finishes.
+    Must not be called from the loop thread itself.
+    """
+    loop = get_event_loop()
+    if threading.current_thread().name == "llm-async-loop":
+        raise RuntimeError("run_sync cannot be called from the LLM event loop; await the coroutine instead.")
+    return asyncio.run_coroutine_threadsafe(_in_caller_context(coro), loop).result(timeout)
+
+
+def gather_sync(*coros, timeout=None):
+    """Run several coroutines concurrently on the shared loop and return their results in order."""
+    async def _gather():
+        return await asyncio.gather(*coros)
+    return run_sync(_gather(), timeout=timeout)
+
+
+def set_model_concurrency(model, limit):
+    """Override the in-flight request cap for a model. Applies to semaphores created afterwards."""
+    _model_limits[model] = limit
+    for key in [key for key in _semaphores if key[1] == model]:
+        del _semaphores[key]
+    _thread_semaphores.pop(model, None)
+
+
+def get_model_semaphore(model):
+    """Return the semaphore for a model on the running loop, creating it on first use."""
+    key = (asyncio.get_running_loop(), model)
+    semaphore = _semaphores.get(key)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(_model_limits.get(model, MAX_CONCURRENT_REQUESTS_PER_MODEL))
+        _semaphores[key] = semaphore
+    return semaphore
+
+
+def _count_in_flight(model, delta):
+    with _in_flight_lock:
+        _in_flight[model] = _in_flight.get(model, 0) + delta
+
+
+@asynccontextmanager
+async def model_slot(model):
+    """Hold one of the model's in-flight slots for the duration of the block."""
+    async with get_model_semaphore(model):
+        _count_in_flight(model, 1)
+        try:
+            yield
+        finally:
+            _count_in_flight(model, -1)
+
+
+def get_thread_semaphore(model):
+    """Return the semaphore limiting a model's requests made from threads, creating it on first use."""
+    with _in_flight_lock:
+        semaphore = _thread_semaphores.get(model)
+        if semaphore is None:
+            semaphore = threading.BoundedSemaphore(_model_limits.get(model, MAX_CONCURRENT_REQUESTS_PER_MODEL))
+            _thread_semaphores[model] = semaphore
+        return semaphore
+
+
+@contextmanager
+def model_slot_sync(model):
+    """Blocking counterpart of model_slot for requests made from threads."""
+    with get_thread_semaphore(model):
+        _count_in_flight(model, 1)
+        try:
+            yield
+        finally:
+            _count_in_flight(model, -1)
+
+
+def in_flight_requests() -> dict:
+    """Return the number of requests currently in flight per model."""
+    return {model: count for model, count in _in_flight.items() if count}
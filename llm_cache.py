@@ -0,0 +1,204 @@
+"""
+Two-tier response cache for LLM queries.
+
+Responses are keyed on everything that determines a completion (model, system prompt,
+conversation history, user input, temperature and max_tokens). Lookups go to an
+in-process LRU first and then to an on-disk SQLite store that survives restarts.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_DIR = "cache"
+CACHE_DB_FILE = "llm_responses.sqlite3"
+
+MEMORY_CAPACITY = 256  # Number of responses kept in the in-process tier
+DISK_MAX_ENTRIES = 5000  # Number of responses kept in the SQLite tier
+TTL_SECONDS = 7 * 24 * 60 * 60  # Entries older than this are treated as misses and pruned
+PRUNE_EVERY_N_WRITES = 100
+
+
+def make_cache_key(model, system_prompt, conversation_history, user_input, temperature, max_tokens) -> str:
+    """
+    Build a stable cache key from the inputs that determine an LLM completion.
+    Returns a hex sha256 digest.
+    """
+    payload = json.dumps(
+        {
+            "model": model,
+            "system_prompt": system_prompt,
+            "conversation_history": conversation_history or [],
+            "user_input": user_input,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def content_hash(value) -> str:
+    """Stable hash of a JSON-like value, independent of dictionary key order."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    LRU memory tier in front of a SQLite disk tier, with size and TTL eviction on both.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path=None, memory_capacity=MEMORY_CAPACITY, max_entries=DISK_MAX_ENTRIES, ttl_seconds=TTL_SECONDS):
+        self.path = path or os.path.join(CACHE_DIR, CACHE_DB_FILE)
+        self.memory_capacity = memory_capacity
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._memory = OrderedDict()  # key -> (value, stored_at)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disk_disabled = False
+        self._writes_since_prune = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def _connect(self):
+        """Open the SQLite database on first use. Returns None if the disk tier is unavailable."""
+        if self._conn is not None or self._disk_disabled:
+            return self._conn
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+            conn.commit()
+            self._conn = conn
+        except (sqlite3.Error, OSError) as e:
+            logging.warning(f"[function=ResponseCache._connect] [description=Disk cache unavailable, using memory tier only: {e}]")
+            self._disk_disabled = True
+        return self._conn
+
+    def _remember(self, key, value, stored_at):
+        """Insert into the memory tier, evicting the least recently used entry if full."""
+        self._memory[key] = (value, stored_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_capacity:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key):
+        """Return the cached response for key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return value
+                del self._memory[key]
+
+            conn = self._connect()
+            if conn is not None:
+                try:
+                    row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+                    if row is not None:
+                        value, created_at = row
+                        if now - created_at <= self.ttl_seconds:
+                            conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                            conn.commit()
+                            self._remember(key, value, created_at)
+                            self.disk_hits += 1
+                            return value
+                        conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                        conn.commit()
+                except sqlite3.Error as e:
+                    logging.warning(f"[function=ResponseCache.get] [description=Disk cache read failed: {e}]")
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        """Store a response in both tiers."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self.writes += 1
+
+            conn = self._connect()
+            if conn is None:
+                return
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                conn.commit()
+                self._writes_since_prune += 1
+                if self._writes_since_prune >= PRUNE_EVERY_N_WRITES:
+                    self._prune(conn, now)
+            except sqlite3.Error as e:
+                logging.warning(f"[function=ResponseCache.set] [description=Disk cache write failed: {e}]")
+
+    def _prune(self, conn, now):
+        """Drop expired rows, then the least recently accessed rows above max_entries."""
+        self._writes_since_prune = 0
+        expired = conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        overflow = conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        conn.commit()
+        self.evictions += max(expired, 0) + max(overflow, 0)
+
+    def clear(self):
+        """Empty both tiers. Counters are kept."""
+        with self._lock:
+            self._memory.clear()
+            conn = self._connect()
+            if conn is not None:
+                try:
+                    conn.execute("DELETE FROM responses")
+                    conn.commit()
+                except sqlite3.Error as e:
+                    logging.warning(f"[function=ResponseCache.clear] [description=Disk cache clear failed: {e}]")
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and current tier sizes."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "memory_size": len(self._memory),
+            }
+
+
+# Process-wide cache shared by every session
+response_cache = ResponseCache()
@@ -2,25 +2,57 @@ import server.config as config
 
 # import concurrent.futures
 import logging
-import inspect
-import threading
-from logger_setup import get_request_id, set_request_id
-
-import ast, re
+from tracing import start_span, get_caller
+from prompt_builder import PromptBuilder
+from intent_router import intent_router
+from scope_patch import SCOPE_OPERATIONS, ASSUMPTIONS_OPERATIONS, describe_operations, parse_operations, apply_scope_patch, apply_assumptions_patch
+from context_providers import SpeculativeContext, needed_data_sources, fetch_context, format_context
+from reconciler import queue_reconciliation, changed_scope_disciplines, changed_assumption_disciplines
+from contract_drafting import draft_contract
+from structured_output import parse_structured, StructuredOutputError
+from singleflight import coalesce_async, classifier_flight
+from category_index import preselect_categories, category_memo, content_hash
+from message_store import add_message, select_history
+
+import re, json
 # import urllib.parse
 
-# Routing Functions Below
-# from project_utils import rag_utils
-
-# import json
-
-from llm_query import run_llm_query
+from llm_query import run_llm_query, run_llm_query_async
+from llm_async import run_sync
 
 import streamlit as st
 import base64
 
 import pandas as pd
 
+# Prompt types used to route chat messages to a handler
+PROMPT_TYPES = {
+    "contract_language": "This is a typical Architect Owner Agreement contract template, including scope of work, deliverables, payment terms, and legal clauses.",
+    # "scope_of_work": "This is a detailed scope with assumptions and exclusions for the project the architect is working on, including deliverables, tasks, and timelines.",
+    "complete_contract_draft": "This a request to generate a complete contract draft based on previous conservation and a template.",
+    "scope_of_work_question": "This is for questions about the scope of work or assumptions and exclusions for the current project.",
+    "scope_of_work_change": "The user wants to modify or expand the current scope of work for the project.",
+    "assumptions_and_exclusions_change": "The user wants to modify or expand the current assumptions and exclusions for the project.",
+}
+
+# Data sources a message may need context from
+DATA_SOURCES = {
+    "knowledge_base": "Reference documents on AEC contracts, cost estimating and construction practice.",
+    "project_cost_data": "Quantities and unit costs for the current project's building model.",
+}
+
+# Decisions below this confidence are sent to default_query, which asks the user to clarify
+ROUTE_MIN_CONFIDENCE = 0.5
+ROUTE_MAX_TOKENS = 200
+
+# Edit operations are short; a dozen of them fit comfortably
+PATCH_MAX_TOKENS = 1500
+
+# Fetch context from every data source while routing, instead of after it
+SPECULATIVE_CONTEXT = True
+# Handlers that answer in prose and can use retrieved context; default_query is used for None
+PROSE_PROMPT_TYPES = {"contract_language", "scope_of_work_question", "complete_contract_draft", None}
+
 def auto_download_csv(csv_data, filename="categories_list.csv"):
     b64 = base64.b64encode(csv_data.encode()).decode()
     href = f'''
@@ -31,369 +63,421 @@ def auto_download_csv(csv_data, filename="categories_list.csv"):
     '''
     st.components.v1.html(href, height=0)
 
-def classify_data_sources(message: str, data_sources: dict, request_id: str = None) -> dict:
-    """
-    Classify the user message into one of the five core data sources.
-    Returns a dictionary with boolean values indicating which data sources are relevant.
-    """
-    system_prompt = (
-        "You are a data source classification agent for a building project assistant.\n"
-        "Classify the user's query into one or more of the following data sources:\n"
-        + "\n".join([f"{key}: {value}" for key, value in data_sources.items()]) + "\n"
-        "Return ONLY a comma-separated list of the relevant data sources, or 'None' if none apply.\n\n"
-        "Examples:\n"
-        "Query: What is the typical cost per sqft for concrete in NYC?\nOutput: rsmeans\n"
-        "Query: What is the value of this building based on its size and type?\nOutput: value model\n"
-        "Query: How can I reduce construction costs without changing the layout?\nOutput: knowledge base\n"
-        "Query: What is the total concrete cost for this project?\nOutput: ifc\n"
-        "Query: What is the estimated valuation of this 3 bedroom, 1 bathroom unit? \n Output: valuation model\n"
-        "Remember, return ONLY the comma-separated list of the relevant data sources."
-    )
-
-    thread_id = threading.get_ident()
-    parent_thread_id = getattr(threading.current_thread(), '_parent_ident', None)
-    caller = inspect.stack()[1].function
-    thread_id_str = str(thread_id)
-    parent_thread_str = str(parent_thread_id) if parent_thread_id else "main"
-    log_prefix = f"[id={request_id}] [thread={thread_id_str}] [parent={parent_thread_str}] [function=classify_data_sources] [called_by={caller}]"
-    # logging.info(f"{log_prefix} [description=Classifying message: {message}]")
-    response = config.client.chat.completions.create(
-        model=config.completion_model,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": message}
-        ],
-        temperature=0.0,
+def routing_system_prompt(prompt_types: dict, data_sources: dict) -> str:
+    """Build the system prompt for the structured routing call."""
+    return "\n".join(
+        [
+            "You are the request router for an assistant that helps architects with AEC contracts and scopes of work.",
+            "Decide which prompt type the user's message is, which data sources it needs, and extract any parameters it mentions.",
+            "Prompt types:",
+            *[f"- {key}: {value}" for key, value in prompt_types.items()],
+            "Data sources:",
+            *[f"- {key}: {value}" for key, value in data_sources.items()],
+            "Respond with ONLY a JSON object, no code fences or other text, in exactly this form:",
+            '{"prompt_type": "<one prompt type>", "confidence": <0.0-1.0>, '
+            '"data_sources": {"<data source>": <0.0-1.0 relevance>, ...}, '
+            '"parameters": {"phase": "<phase or null>", "discipline": "<discipline or null>", "topic": "<short topic or null>"}}',
+            "Include every data source in data_sources.",
+        ]
     )
 
-
-
-    classification = response.choices[0].message.content.strip()
-    
-    logging.info(f"{log_prefix} [description=Classification result: {classification}] [usage={response.usage}]")
-    if classification.lower() == "none":
-        return {key: False for key in data_sources.keys()}
-    
-    # Split the classification into a list and create a dictionary with boolean values
-    classified_sources = classification.split(", ")
-    return {key: (key in classified_sources) for key in data_sources.keys()}
-
-def classify_prompt_type(message: str, prompt_types: dict):
+def validate_route(route, prompt_types: dict = PROMPT_TYPES, data_sources: dict = DATA_SOURCES) -> dict:
     """
-    Classify the user message into one of the prompt types.
-    Returns the prompt type as a string.
+    Validate a routing decision against the routing schema and normalise it.
+    Returns {"prompt_type", "confidence", "data_sources": {name: bool}, "data_source_confidence": {name: float}, "parameters"}.
+    Raises ValueError if the decision does not match the schema.
     """
-    system_prompt = (
-        "You are a prompt classification agent to assist an architect.\n"
-        "Classify the user's query into one of the following prompt types:\n"
-        + "\n".join([f"{key}: {value}" for key, value in prompt_types.items()]) + "\n"
-        "Return ONLY the prompt type that best matches the user's query.\n\n"
-        "Examples:\n"
-        "Query: Please provide the scope of work for an architectural design contract.\nOutput: scope_of_work\n"
-        "Query: What are the standard clauses in an Architect Owner Agreement?\nOutput: contract_language\n"
-        "Remember, return ONLY the prompt type."
-    )
-
-    thread_id = threading.get_ident()
-    parent_thread_id = getattr(threading.current_thread(), '_parent_ident', None)
-    caller = inspect.stack()[1].function
-    thread_id_str = str(thread_id)
-    parent_thread_str = str(parent_thread_id) if parent_thread_id else "main"
-    log_prefix = f"[id={get_request_id()}] [thread={thread_id_str}] [parent={parent_thread_str}] [function=classify_prompt_type] [called_by={caller}]"
-    # logging.info(f"{log_prefix} [description=Classifying message: {message}]")
-    response = config.client.chat.completions.create(
-        model=config.completion_model,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": message}
-        ],
-        temperature=0.0,
-    )
+    if not isinstance(route, dict):
+        raise ValueError("routing decision must be a JSON object")
+    prompt_type = route.get("prompt_type")
+    if prompt_type not in prompt_types:
+        raise ValueError(f"unknown prompt_type: {prompt_type!r}")
+    confidence = route.get("confidence")
+    if not isinstance(confidence, (int, float)) or not 0 <= confidence <= 1:
+        raise ValueError(f"confidence must be a number between 0 and 1, got {confidence!r}")
+
+    source_confidence = route.get("data_sources") or {}
+    if not isinstance(source_confidence, dict):
+        raise ValueError("data_sources must be an object")
+    data_source_confidence = {}
+    for key in data_sources:
+        value = source_confidence.get(key, 0.0)
+        if isinstance(value, bool):
+            value = 1.0 if value else 0.0
+        if not isinstance(value, (int, float)):
+            raise ValueError(f"data source {key!r} must have a numeric relevance, got {value!r}")
+        data_source_confidence[key] = min(max(float(value), 0.0), 1.0)
+
+    parameters = route.get("parameters") or {}
+    if not isinstance(parameters, dict):
+        raise ValueError("parameters must be an object")
+    parameters = {key: value for key, value in parameters.items() if isinstance(key, str) and isinstance(value, str) and value.strip() and value.lower() != "null"}
+
+    return {
+        "prompt_type": prompt_type,
+        "confidence": float(confidence),
+        "data_sources": {key: value >= ROUTE_MIN_CONFIDENCE for key, value in data_source_confidence.items()},
+        "data_source_confidence": data_source_confidence,
+        "parameters": parameters,
+    }
 
-    classification = response.choices[0].message.content.strip()
-    
-    logging.info(f"{log_prefix} [description=Prompt type classification result: {classification}] [usage={response.usage}]")
-    return classification
+def parse_route(response: str) -> dict:
+    """Extract the JSON object from a routing response. Raises ValueError if there is none."""
+    return parse_structured(response, "route")
+
+def invalid_route() -> dict:
+    """Zero-confidence decision, so the caller falls back to default_query."""
+    return {
+        "prompt_type": None,
+        "confidence": 0.0,
+        "data_sources": {key: False for key in DATA_SOURCES},
+        "data_source_confidence": {key: 0.0 for key in DATA_SOURCES},
+        "parameters": {},
+    }
 
-def ask_contract_language_prompt(message: str):
+@coalesce_async(classifier_flight, ignore=("request_id", "caller"))
+async def route_message_async(message: str, request_id: str = None, caller: str = None) -> dict:
+    """
+    Decide prompt type, data sources and parameters for a message with one structured call to the small model,
+    made on the shared LLM event loop (see llm_async.py). Replaces the separate prompt type and data source classifiers.
+    Returns a validated routing decision (see validate_route). If the response cannot be parsed or validated,
+    returns a zero-confidence decision so the caller falls back to default_query.
+    """
+    with start_span("route_message", caller=caller, request_id=request_id) as span:
+        response = await run_llm_query_async(
+            system_prompt=routing_system_prompt(PROMPT_TYPES, DATA_SOURCES),
+            user_input=message,
+            max_tokens=ROUTE_MAX_TOKENS,
+            large_model=False,
+            request_id=request_id,
+            conversation_history=[],
+        )
+        try:
+            route = validate_route(parse_route(response))
+        except ValueError as e:
+            logging.warning("[id=%s] [span=%s] [function=route_message] [description=Invalid routing response: %s]", span.request_id, span.span_id, e)
+            route = invalid_route()
+        span.set(prompt_type=route["prompt_type"], confidence=route["confidence"])
+    return route
+
+def route_message(message: str, request_id: str = None) -> dict:
+    """Blocking form of route_message_async for the script thread; the call itself runs on the shared LLM event loop."""
+    return run_sync(route_message_async(message, request_id=request_id, caller=get_caller()))
+
+def route_request(message: str) -> dict:
+    """
+    Route a chat message. The local embedding router answers when it is confident;
+    otherwise one structured call to the small model decides.
+    Returns a routing decision dictionary (see validate_route) with an added "router" key.
+    """
+    prompt_type, similarity = intent_router.route(message)
+    if prompt_type is not None:
+        logging.info("[function=route_request] [description=Routed locally to %s (similarity %.3f)]", prompt_type, similarity)
+        return {
+            "prompt_type": prompt_type,
+            "confidence": similarity,
+            "data_sources": {key: False for key in DATA_SOURCES},
+            "data_source_confidence": {key: 0.0 for key in DATA_SOURCES},
+            "parameters": {},
+            "router": "local",
+        }
+    logging.info("[function=route_request] [description=Low local routing confidence (%.3f), using structured routing call]", similarity)
+    route = route_message(message)
+    route["router"] = "llm"
+    return route
+
+def reference_context_lines(context: str) -> list:
+    """Prompt lines for retrieved reference context, or none if there is no context."""
+    if not context:
+        return []
+    return [
+        "Reference context retrieved for this request (cite it where relevant, ignore it if unrelated):",
+        context,
+    ]
+
+def ask_contract_language_prompt(message: str, stream: bool = False, context: str = ""):
     """
     Ask the LLM a contract language related prompt.
-    Returns the LLM response as a string.
+    Returns the LLM response as a string, or a generator of chunks if stream is True.
     """
-    system_prompt = "\n".join(
-        [
-            "You are an AI assistant helping architects with contract language for AEC contracts. ",
-            "Be helpful, professional, and detail-oriented.",
-            "Pretend you are a legal expert in architecture contracts.",
-            "Assume the user is a Senior Architect with 10+ years of experience.",
-            "Make suggestions regarding contract language that is favorable to the architect.",
-            "The current project scope of work is as follows:",
-            f"{st.session_state.get('scope_of_work')}",
-            ""
-        ]
-    )
-    response = run_llm_query(system_prompt=system_prompt, user_input=message)
+    system_prompt = PromptBuilder("contract_language").static(
+        "You are an AI assistant helping architects with contract language for AEC contracts. ",
+        "Be helpful, professional, and detail-oriented.",
+        "Pretend you are a legal expert in architecture contracts.",
+        "Assume the user is a Senior Architect with 10+ years of experience.",
+        "Make suggestions regarding contract language that is favorable to the architect.",
+        "The current project scope of work is as follows:",
+    ).session(
+        f"{st.session_state.get('scope_of_work')}",
+        "",
+    ).volatile(
+        *reference_context_lines(context),
+    ).build()
+    response = run_llm_query(system_prompt=system_prompt, user_input=message, stream=stream)
     return response
 
-def ask_scope_of_work_prompt(message: str):
+def ask_scope_of_work_prompt(message: str, stream: bool = False, context: str = ""):
     """
     Ask the LLM a scope of work related prompt.
-    Returns the LLM response as a string.
+    Returns the LLM response as a string, or a generator of chunks if stream is True.
     """
     current_scope_of_work = st.session_state.get("scope_of_work")
 
     current_scope_of_work = str(current_scope_of_work)
     
-    system_prompt = "\n".join(
-        [
-            "You are helping define a comprehensive scope of work for an Architect Owner Agreement.",
-            "Here is a dictionary of deliverables and associated scope items defined so far:",
-            f"{current_scope_of_work}",
-            "Here is the corresponding assumptions and exclusions for the project:",
-            f"{st.session_state.get('ASSUMPTIONS_AND_EXCLUSIONS')}",
-        ]
-    )
-    response = run_llm_query(system_prompt=system_prompt, user_input=message)
+    system_prompt = PromptBuilder("scope_of_work_question").static(
+        "You are helping define a comprehensive scope of work for an Architect Owner Agreement.",
+        "Below are the dictionary of deliverables and associated scope items defined so far, followed by the corresponding assumptions and exclusions for the project.",
+    ).session(
+        "Scope of work:",
+        f"{current_scope_of_work}",
+        "Assumptions and exclusions:",
+        f"{st.session_state.get('ASSUMPTIONS_AND_EXCLUSIONS')}",
+    ).volatile(
+        *reference_context_lines(context),
+    ).build()
+    response = run_llm_query(system_prompt=system_prompt, user_input=message, stream=stream)
+    return response
+
+def patch_result_message(document: str, applied: list, errors: list) -> str:
+    """Assistant message summarising the outcome of a patch."""
+    if not applied:
+        response = f"I'm sorry, I could not process the changes to the {document}. Please ensure your request is clear."
+    else:
+        response = f"{document[0].upper()}{document[1:]} updated successfully ({len(applied)} change{'s' if len(applied) != 1 else ''} applied)."
+    if errors:
+        response += "\n\nSkipped changes:\n" + "\n".join(f"- {error}" for error in errors)
     return response
 
 def ask_scope_of_work_change_prompt(message: str, update_assumptions: bool = True):
     """
-    Ask the LLM a scope of work change related prompt.
-    Returns the LLM response as a string.
+    Ask the LLM for the edit operations that implement a scope of work change, and apply them.
+    Returns the assistant's status message as a string.
     """
     current_scope_of_work = st.session_state.get("scope_of_work")
 
-    current_scope_of_work = str(current_scope_of_work)
-    print(f"Current Scope of Work: {current_scope_of_work}")
-
-    system_prompt = "\n".join(
-        [
-            "You are helping modify a comprehensive scope of work for an Architect Owner Agreement.",
-            "Here is a dictionary of deliverables and associated scope items defined so far:",
-            f"{current_scope_of_work}",
-            "The dictionary is structured as {phase: {discipline: [items]}}.",
-            "The structure must be preserved in your response, but the content can be modified as needed.",
-            "You may need to add new phases or disciplines based on the user's request.",
-            "Respond only with an updated dictionary including the requested changes.",
-            "Focus on accuracy and completeness.",
-            "Do not include any explanations or additional text.",
-            ""
-        ]
-    )
-    print(f"System Prompt: {system_prompt}")
-    modified_dictionary = run_llm_query(system_prompt=system_prompt, user_input=message, temp=0.2)
+    system_prompt = PromptBuilder("scope_of_work_change").static(
+        "You are helping modify a comprehensive scope of work for an Architect Owner Agreement.",
+        "The dictionary of deliverables and associated scope items defined so far is given at the end of this prompt.",
+        "The dictionary is structured as {phase: {discipline: [items]}}.",
+        "Do not repeat the dictionary. Respond only with a JSON list of the edit operations that implement the user's request.",
+        "Use names exactly as they appear in the dictionary when referring to existing phases, disciplines and items.",
+        "You may need to add new phases or disciplines based on the user's request.",
+        "Available operations:",
+        describe_operations(SCOPE_OPERATIONS),
+        "Do not include any explanations or additional text.",
+    ).session(
+        "Current scope of work:",
+        f"{current_scope_of_work}",
+        "",
+    ).build()
+    response_text = run_llm_query(system_prompt=system_prompt, user_input=message, temp=0.2, max_tokens=PATCH_MAX_TOKENS)
 
-    # Check if the response is a valid dictionary
     try:
-        updated_scope_of_work = ast.literal_eval(modified_dictionary)
-
-        # Clean the string representation of the dictionary
-        updated_scope_of_work = str(updated_scope_of_work).replace("\n", " ").replace("\r", " ").strip()
-
-        # Check that the string starts with '{' and add if missing
-        if not updated_scope_of_work.startswith("{"):
-            updated_scope_of_work = "{" + updated_scope_of_work
-
-        # Check that the string ends with '}' and add if missing
-        if not updated_scope_of_work.endswith("}"):
-            updated_scope_of_work = updated_scope_of_work + "}"
-
-        if isinstance(updated_scope_of_work, dict):
-            # Update the session state with the new scope of work
-            st.session_state["scope_of_work"] = updated_scope_of_work
-            print(f"Updated Scope of Work: {updated_scope_of_work}")
-            response = "Scope of work updated successfully."
-
-            if update_assumptions:
-                # Also update the assumptions and exclusions 
-                message = f"Update the assumptions and exclusions to be consistent with the following scope of work: {updated_scope_of_work}. Here is the current assumptions and exclusions: {st.session_state.get('ASSUMPTIONS_AND_EXCLUSIONS')}. Respond only with the updated assumptions and exclusions dictionary."
-                ask_assumptions_and_exclusions_change_prompt(message, update_scope=False)
-            
-        else:
-            print("LLM response is not a valid dictionary.")
-            print(f"LLM Response for Scope of Work Update: {modified_dictionary}")
-            response = "I'm sorry, I could not process the changes to the scope of work. Please ensure your request is clear."
-
-    except (ValueError, SyntaxError) as e:
+        operations = parse_operations(response_text)
+    except ValueError as e:
         print(f"Error parsing LLM response: {e}")
-        print(f"LLM Response for Scope of Work Update: {modified_dictionary}")
-        response = "I'm sorry, I could not process the changes to the scope of work. Please ensure your request is clear."
+        print(f"LLM Response for Scope of Work Update: {response_text}")
+        operations = []
+
+    updated_scope_of_work, applied, errors = apply_scope_patch(current_scope_of_work, operations)
+    if applied:
+        # Update the session state with the new scope of work
+        st.session_state["scope_of_work"] = updated_scope_of_work
+        print(f"Applied {len(applied)} scope of work operations: {applied}")
+
+        if update_assumptions:
+            # Reconcile the assumptions and exclusions in the background, for the changed disciplines only
+            queue_reconciliation("ASSUMPTIONS_AND_EXCLUSIONS", changed_scope_disciplines(current_scope_of_work, updated_scope_of_work))
+    if errors:
+        print(f"Skipped scope of work operations: {errors}")
+    response = patch_result_message("scope of work", applied, errors)
 
     print("Adding scope of work assistant message to session state.")
-    st.session_state.messages.append({
-        "role": "assistant",
-        "content": response
-    })
+    add_message("assistant", response)
     # print("Rerunning Streamlit app to reflect updated scope of work.")
     # st.rerun()
     return response
 
-def complete_contact_draft(message: str):
-    with open("./template/contact-template-short.md", "r") as f:
-        contract_template = f.read()
-
-    system_prompt = "\n".join(
-        [
-            "The content below is a contract template for an Architect Owner Agreement. ",
-            "Use the template to generate a complete contract draft based on the user's requirements and the project's scope of work.",
-            f"Contract Template:\n{contract_template}",
-            f"Project Scope of Work:\n{st.session_state.get('scope_of_work')}",
-            "Provide only the edited sections and add notations to indicate where changes were made.",
-            "Use markdown formatting, and show edited text in bold red.",
-            "Do not show unchanged sections of the contract, just indicate they are unchanged.",
-            ""
-        ]
+def complete_contact_draft(message: str, stream: bool = False, context: str = ""):
+    """
+    Draft the contract from the template and the current scope of work, redrafting only the
+    sections the request affects, concurrently (see contract_drafting).
+    Returns the draft as a string, or a generator of chunks in section order if stream is True.
+    """
+    # Session state is not reachable from the drafting workers, so resolve the history here
+    conversation_history, history_summary = select_history()
+    context_lines = reference_context_lines(context)
+    if history_summary:
+        context_lines.append(f"Summary of the earlier conversation:\n{history_summary}")
+
+    chunks = draft_contract(
+        message,
+        st.session_state.get("scope_of_work"),
+        context_lines=context_lines,
+        conversation_history=conversation_history,
     )
-    system_prompt += f"\n\nContract Template:\n{contract_template}"
-
-    response = run_llm_query(system_prompt=system_prompt, user_input=message)
-    return response
+    if stream:
+        return chunks
+    return "".join(chunks)
 
 def update_categories_list():
     """
-    Update the categories list in the sidebar based on the current scope of work, using an llm call
+    Update the categories list in the sidebar based on the current scope of work.
+    Candidate categories are shortlisted locally (see category_index) and confirmed with an llm call;
+    the result is memoized by the content of the scope of work.
     """
     full_categories_list = st.session_state.get("FULL_CATEGORIES_LIST")
 
     current_scope_of_work = st.session_state.get("scope_of_work")
 
-    # Call LLM to update categories list
-    system_prompt = "\n".join(
-        [
+    memo_key = (content_hash(current_scope_of_work), content_hash(full_categories_list))
+    updated_categories = category_memo.get(memo_key)
+    if updated_categories is None:
+        candidates = preselect_categories(current_scope_of_work, full_categories_list)
+        if not candidates:
+            # Nothing matched locally; let the LLM choose from the full list
+            candidates = list(full_categories_list)
+        print(f"Shortlisted {len(candidates)} of {len(full_categories_list)} categories.")
+
+        # Call LLM to confirm the shortlisted categories
+        system_prompt = PromptBuilder("update_categories_list").static(
             "You are an AI assistant that creates a list of categories that should be expected in a BIM design model based on the scope of work for an architectural project.",
-            "Given the scope of work dictionary, generate a comprehensive list of categories that should be included by selecting from the provided categories list.",
-            f"Scope of Work:\n{current_scope_of_work}",
-            f"Available Categories:\n{full_categories_list}",
+            "Given the scope of work dictionary, select the categories that should be included from the provided candidate categories.",
             "Return ONLY a Python list of the selected categories that match the scope of work.",
             "All categories must be selected from the provided list.",
             "Response should start with '[' and end with ']'.",
-            ""
-        ]
-    )
-    print(f"System Prompt for Categories Update: {system_prompt}")
-    llm_response = run_llm_query(system_prompt=system_prompt, user_input="Generate the categories list.")
-    print(f"LLM Response for Categories Update: {llm_response}")
-    # Parse the LLM response to get the list
-    try:
-        updated_categories = ast.literal_eval(llm_response)
-        if isinstance(updated_categories, list):
-            # Update the session state with the new categories list
-            st.session_state["categories_list"] = updated_categories
-            print(f"Updated Categories List: {updated_categories}")
-            auto_download_csv(",".join(updated_categories), filename="categories_list.csv")
-        else:
-            print("LLM response is not a valid list.")
-            print(f"LLM Response for Categories Update: {llm_response}")
-    except (ValueError, SyntaxError) as e:
-        print(f"Error parsing LLM response: {e}")
+        ).session(
+            f"Candidate Categories:\n{candidates}",
+            f"Scope of Work:\n{current_scope_of_work}",
+            "",
+        ).build()
+        llm_response = run_llm_query(system_prompt=system_prompt, user_input="Generate the categories list.", conversation_history=[])
         print(f"LLM Response for Categories Update: {llm_response}")
-
-def default_query(message: str):
+        # Parse the LLM response to get the list
+        try:
+            updated_categories = parse_structured(llm_response, "categories")
+        except StructuredOutputError as e:
+            print(f"Error parsing LLM response: {e}")
+            return
+        # Keep only categories that were offered
+        updated_categories = [category for category in updated_categories if category in candidates]
+        category_memo.set(memo_key, updated_categories)
+
+    # Update the session state with the new categories list
+    st.session_state["categories_list"] = updated_categories
+    print(f"Updated Categories List: {updated_categories}")
+    auto_download_csv(",".join(updated_categories), filename="categories_list.csv")
+
+def default_query(message: str, stream: bool = False, context: str = ""):
     """
     Default LLM query when no specific classification is made.
-    Returns the LLM response as a string.
+    Returns the LLM response as a string, or a generator of chunks if stream is True.
     """
-    system_prompt = "\n".join(
-        [
-            "You are a helpful AI assistant for architects working on AEC contracts and scopes of work.",
-            "The question the user asked is not specifically about contract language or scope of work.",
-            "Prompt the user to clarify their request or provide more details so you can assist them better.",
-            "If possible, use their query to help improve the scope of work being developed.",
-        ]
-    )
-    response = run_llm_query(system_prompt=system_prompt, user_input=message)
+    system_prompt = PromptBuilder("default_query").static(
+        "You are a helpful AI assistant for architects working on AEC contracts and scopes of work.",
+        "The question the user asked is not specifically about contract language or scope of work.",
+        "Prompt the user to clarify their request or provide more details so you can assist them better.",
+        "If possible, use their query to help improve the scope of work being developed.",
+    ).volatile(
+        *reference_context_lines(context),
+    ).build()
+    response = run_llm_query(system_prompt=system_prompt, user_input=message, stream=stream)
     return response
 
 def ask_assumptions_and_exclusions_change_prompt(message: str, update_scope: bool = True):
     """
-    Ask the LLM an assumptions and exclusions change related prompt.
-    Returns the LLM response as a string.
+    Ask the LLM for the edit operations that implement an assumptions and exclusions change, and apply them.
+    Returns the assistant's status message as a string.
     """
     current_assumptions_and_exclusions = st.session_state.get("ASSUMPTIONS_AND_EXCLUSIONS")
-    current_assumptions_and_exclusions = str(current_assumptions_and_exclusions)
-
-    system_prompt = "\n".join(
-        [
-            "You are helping modify a comprehensive assumptions and exclusions list for an Architect Owner Agreement.",
-            "These assumptions and exclusions should not conflict with the current scope of work, and in fact should protect the designer from liability.",
-            "Here is a dictionary of disciplines and associated assumptions and exclusions defined so far:",
-            f"{current_assumptions_and_exclusions}",
-            "The dictionary is structured as {discipline: [items]}.",
-            "The structure must be preserved in your response, but the content can be modified as needed.",
-            "Here is the corresponding scope of work for the project:",
-            f"{st.session_state.get('scope_of_work')}",
-            "Respond only with an updated dictionary including the requested changes to the assumptions and exclusions.",
-            "Focus on accuracy and completeness.",
-            "Do not include any explanations or additional text.",
-            ""
-        ]
-    )
-    print(f"System Prompt: {system_prompt}")
-    modified_dictionary = run_llm_query(system_prompt=system_prompt, user_input=message)
 
-    response = "I'm sorry, I could not process the changes to the assumptions and exclusions. Please ensure your request is clear."
+    system_prompt = PromptBuilder("assumptions_and_exclusions_change").static(
+        "You are helping modify a comprehensive assumptions and exclusions list for an Architect Owner Agreement.",
+        "These assumptions and exclusions should not conflict with the current scope of work, and in fact should protect the designer from liability.",
+        "The dictionary of disciplines and associated assumptions and exclusions defined so far is given at the end of this prompt, after the scope of work.",
+        "The dictionary is structured as {discipline: [items]}.",
+        "Do not repeat the dictionary. Respond only with a JSON list of the edit operations that implement the requested changes to the assumptions and exclusions.",
+        "Use names exactly as they appear in the dictionary when referring to existing disciplines and items.",
+        "Available operations:",
+        describe_operations(ASSUMPTIONS_OPERATIONS),
+        "Do not include any explanations or additional text.",
+    ).session(
+        "Here is the corresponding scope of work for the project:",
+        f"{st.session_state.get('scope_of_work')}",
+        "Current assumptions and exclusions:",
+        f"{current_assumptions_and_exclusions}",
+        "",
+    ).build()
+    response_text = run_llm_query(system_prompt=system_prompt, user_input=message, max_tokens=PATCH_MAX_TOKENS)
 
-    # Check if the response is a valid dictionary
     try:
-        updated_assumptions_and_exclusions = ast.literal_eval(modified_dictionary)
-        if isinstance(updated_assumptions_and_exclusions, dict):
-            # Update the session state with the new assumptions and exclusions
-            st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"] = updated_assumptions_and_exclusions
-            response = "Assumptions and exclusions updated successfully."
-            if update_scope:
-                # Also update the scope of work 
-                message = f"Update the scope of work to be consistent with the following assumptions and exclusions: {updated_assumptions_and_exclusions}. Here is the current scope of work: {st.session_state.get('scope_of_work')}. Respond only with the updated scope of work dictionary."
-                ask_scope_of_work_change_prompt(message, update_assumptions=False)
-
-        else:
-            print("LLM response is not a valid dictionary.")
-            print(f"LLM Response for Assumptions and Exclusions Update: {modified_dictionary}")
-    except (ValueError, SyntaxError) as e:
+        operations = parse_operations(response_text)
+    except ValueError as e:
         print(f"Error parsing LLM response: {e}")
-        print(f"LLM Response for Assumptions and Exclusions Update: {modified_dictionary}")
+        print(f"LLM Response for Assumptions and Exclusions Update: {response_text}")
+        operations = []
+
+    updated_assumptions_and_exclusions, applied, errors = apply_assumptions_patch(current_assumptions_and_exclusions, operations)
+    if applied:
+        # Update the session state with the new assumptions and exclusions
+        st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"] = updated_assumptions_and_exclusions
+        print(f"Applied {len(applied)} assumptions and exclusions operations: {applied}")
+        if update_scope:
+            # Reconcile the scope of work in the background, for the changed disciplines only
+            queue_reconciliation("scope_of_work", changed_assumption_disciplines(current_assumptions_and_exclusions, updated_assumptions_and_exclusions))
+    if errors:
+        print(f"Skipped assumptions and exclusions operations: {errors}")
+    response = patch_result_message("assumptions and exclusions", applied, errors)
 
     print("Adding assumptions and exclusions assistant message to session state.")
-    st.session_state.messages.append({
-        "role": "assistant",
-        "content": response
-    })
+    add_message("assistant", response)
     # print("Rerunning Streamlit app to reflect updated assumptions and exclusions.")
     # st.rerun()
     return response
 
-def classify_and_get_context(message: str):
+def classify_and_get_context(message: str, stream: bool = False, speculative: bool = SPECULATIVE_CONTEXT):
     """
-    Classify the user message and retrieve the relevant context from all data sources.
-    Returns a dictionary with the classification result and the context from each data source.
+    Classify the user message, gather context from the data sources it needs and route it to the matching handler.
+    Returns the handler's response as a string. If stream is True, returns an iterable of
+    text chunks instead: handlers that answer in prose stream tokens as they are generated,
+    while handlers that edit the scope or assumptions yield their status message as one chunk.
+    If speculative is True, every context provider starts while the message is still being routed,
+    and the ones the route does not need are cancelled.
     """
-    prompt_types = {
-        "contract_language": "This is a typical Architect Owner Agreement contract template, including scope of work, deliverables, payment terms, and legal clauses.",
-        # "scope_of_work": "This is a detailed scope with assumptions and exclusions for the project the architect is working on, including deliverables, tasks, and timelines.",
-        "complete_contract_draft": "This a request to generate a complete contract draft based on previous conservation and a template.",
-        "scope_of_work_question": "This is for questions about the scope of work or assumptions and exclusions for the current project.",
-        "scope_of_work_change": "The user wants to modify or expand the current scope of work for the project.",
-        "assumptions_and_exclusions_change": "The user wants to modify or expand the current assumptions and exclusions for the project.",
-    }
+    speculative_context = SpeculativeContext(message) if speculative else None
 
     # Classify the user prompt for routing
-    prompt_type = classify_prompt_type(message, prompt_types)
-
-    print(f"Classified prompt type: {prompt_type}")
-    st.session_state.messages.append({
-        "role": "assistant",
-        "content": f"I think your request is related to {prompt_type}. Let me process that for you."
-    })
-    if "contract_language" in prompt_type:
-        response = ask_contract_language_prompt(message)
-    elif "scope_of_work_question" in prompt_type:
-        response = ask_scope_of_work_prompt(message)
-    elif "scope_of_work_change" in prompt_type:
+    try:
+        route = route_request(message)
+    except Exception:
+        if speculative_context:
+            speculative_context.cancel()
+        raise
+    prompt_type = route["prompt_type"] if route["confidence"] >= ROUTE_MIN_CONFIDENCE else None
+
+    needed = needed_data_sources(route) if prompt_type in PROSE_PROMPT_TYPES else []
+    if speculative_context:
+        contexts = speculative_context.resolve(needed)
+    else:
+        contexts = fetch_context(message, needed)
+    context = format_context(contexts)
+
+    print(f"Classified prompt type: {prompt_type} (confidence {route['confidence']:.2f}, router {route['router']})")
+    add_message("assistant", f"I think your request is related to {prompt_type or 'a general question'}. Let me process that for you.")
+    if prompt_type == "contract_language":
+        response = ask_contract_language_prompt(message, stream=stream, context=context)
+    elif prompt_type == "scope_of_work_question":
+        response = ask_scope_of_work_prompt(message, stream=stream, context=context)
+    elif prompt_type == "scope_of_work_change":
         response = ask_scope_of_work_change_prompt(message)
-    elif "complete_contract_draft" in prompt_type:
-        response = complete_contact_draft(message)
-    elif "assumptions_and_exclusions_change" in prompt_type:
+    elif prompt_type == "complete_contract_draft":
+        response = complete_contact_draft(message, stream=stream, context=context)
+    elif prompt_type == "assumptions_and_exclusions_change":
         response = ask_assumptions_and_exclusions_change_prompt(message)
     else:
-        response = default_query(message)
+        response = default_query(message, stream=stream, context=context)
 
+    if stream and isinstance(response, str):
+        return iter([response])
     return response
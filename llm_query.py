@@ -2,94 +2,389 @@ import server.config as config
 
 import time
 import logging
-import inspect
-import threading
-from logger_setup import get_request_id, set_request_id
+from logger_setup import set_request_id
+from llm_cache import make_cache_key, response_cache
+from singleflight import llm_flight
 
-import streamlit as st
+import asyncio
+from llm_async import model_slot, model_slot_sync
+from llm_rate_limit import get_rate_limiter, estimate_tokens, is_rate_limit_error, get_retry_after, backoff_delay
+from tracing import start_span, get_caller
+from conversation_context import with_summary
+from message_store import select_history
 
-def run_llm_query(system_prompt: str, user_input: str, stream: bool = False, max_tokens: int = 6000, max_retries: int = 15, retry_delay: int = 2, request_id: str = None, large_model=True, temp=0.0) -> str:
+
+# Truncate and format long/multiline strings for logging
+def format_log_string(label, value):
+    if not isinstance(value, str):
+        value = str(value)
+    # Replace newlines for log readability
+    value = value.replace('\n', '\\n')
+    return f"{label}={value}"
+
+def log_prompt(span, system_prompt, user_input):
+    """Log the full prompt at DEBUG level. Nothing is formatted unless DEBUG is enabled."""
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("[id=%s] [span=%s] [function=%s] [called_by=%s] [description=Prompt | %s | %s]",
+                      span.request_id, span.span_id, span.name, span.caller,
+                      format_log_string('system_prompt', system_prompt), format_log_string('user_input', user_input))
+
+# Ask for a final usage chunk on streams; without it OpenAI-compatible servers report no token counts
+STREAM_OPTIONS = {"include_usage": True}
+# Models whose backend rejected stream_options; their streams are requested without it
+_no_stream_options = set()
+
+def stream_request_options(model) -> dict:
+    """Extra create() arguments for a streaming request to model."""
+    return {} if model in _no_stream_options else {"stream_options": STREAM_OPTIONS}
+
+def rejected_stream_options(model, span, error) -> bool:
+    """
+    If error looks like the backend (or an older client) rejecting stream_options, stop sending it
+    to this model and return True, so the caller retries once without it.
+    """
+    if model in _no_stream_options:
+        return False
+    if not (isinstance(error, TypeError) or getattr(error, "status_code", None) in (400, 422)):
+        return False
+    _no_stream_options.add(model)
+    logging.warning("[id=%s] [span=%s] [function=%s] [called_by=%s] [description=Backend rejected stream_options for %s, streaming without usage: %s]",
+                    span.request_id, span.span_id, span.name, span.caller, model, error)
+    return True
+
+def usage_attributes(usage) -> dict:
+    """Extract token counts from a provider usage object for span attributes."""
+    if not usage:
+        return {}
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+    }
+
+def run_llm_query(system_prompt: str, user_input: str, stream: bool = False, max_tokens: int = 6000, max_retries: int = 8, retry_delay: float = 1, request_id: str = None, large_model=True, temp=0.0, conversation_history: list = None, use_cache: bool = None) -> str:
     """ Run a query against the LLM with a system prompt and user input.
     If stream is True, returns a generator for streaming output.
     If stream is False, returns the full response as a string.
-    If the LLM call fails, it will retry up to max_retries times with a delay of retry_delay seconds between retries.
+    Every attempt first acquires from the model's shared rate limiter (see llm_rate_limit.py).
+    If the LLM call fails, it will retry up to max_retries times with exponential backoff and jitter,
+    starting from retry_delay seconds and honouring any Retry-After header from the provider.
+    Each call is recorded as a "run_llm_query" tracing span (see tracing.py).
+    Identical cacheable non-streaming calls that are in flight at the same time share one
+    upstream call (see singleflight.py).
     
     Args:
         conversation_history: Optional list of previous messages in format [{"role": "user"/"assistant", "content": "..."}, ...]
                             System prompt should NOT be included in conversation_history.
+                            Defaults to the session's conversation history (see message_store.py), trimmed to the session's
+                            token budget with older turns summarised (see conversation_context.py).
+        use_cache: Serve and store the response in the shared response cache.
+                   Defaults to True for deterministic (temp=0.0) calls.
     """
-
-    print("\n")
-    print("Running LLM query...")
-    print(f"System prompt: {system_prompt}")
-    print(f"User input: {user_input}")
-    print("\n")
-
-    attempt = 0
-    caller = inspect.stack()[1].function
-    thread_id = threading.get_ident()
-    parent_thread_id = getattr(threading.current_thread(), '_parent_ident', None)
-    thread_id_str = str(thread_id)
-    parent_thread_str = str(parent_thread_id) if parent_thread_id else "main"
-    log_prefix = f"[id={request_id}] [thread={thread_id_str}] [parent={parent_thread_str}] [function=run_llm_query] [called_by={caller}]"
-    # Truncate and format long/multiline strings for logging
-    def format_log_string(label, value):
-        if not isinstance(value, str):
-            value = str(value)
-        # Replace newlines for log readability
-        value = value.replace('\n', '\\n')
-        return f"{label}={value}"
+    # Resolve the session's configuration once, so the whole call uses one backend
+    runtime_config = config.get_runtime_config()
     if large_model:
-        model = config.completion_model
+        model = runtime_config.completion_model
     else:
-        model = config.completion_model_sml
+        model = runtime_config.completion_model_sml
     if request_id:
         set_request_id(request_id)
     
+    if conversation_history is None:
+        # Send only the recent turns that fit the token budget; older turns arrive as a rolling summary
+        conversation_history, history_summary = select_history()
+        system_prompt = with_summary(system_prompt, history_summary)
+
     # Build messages list with conversation history
     messages = [{"role": "system", "content": system_prompt}]
-    messages.extend(st.session_state.conversation_history)
+    messages.extend(conversation_history)
     messages.append({"role": "user", "content": user_input})
-    
+
+    span = start_span("run_llm_query", caller=get_caller(), request_id=request_id, model=model, stream=stream, temperature=temp, max_tokens=max_tokens)
+    log_prompt(span, system_prompt, user_input)
+
+    if use_cache is None:
+        use_cache = temp == 0.0
+    cache_key = None
+    if use_cache:
+        cache_key = make_cache_key(model, system_prompt, conversation_history, user_input, temp, max_tokens)
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            span.set(cache_hit=True, retry_count=0).finish()
+            logging.info("[id=%s] [span=%s] [function=run_llm_query] [called_by=%s] [description=LLM query served from response cache]", span.request_id, span.span_id, span.caller)
+            if stream:
+                return iter([cached_response])
+            return cached_response
+    span.set(cache_hit=False)
+
+    def query():
+        return _query_with_retries(runtime_config.client, span, model, messages, stream, temp, max_tokens, max_retries, retry_delay, cache_key)
+
+    if stream or cache_key is None:
+        return query()
+    # Identical deterministic requests that are in flight at the same time share one upstream call
+    try:
+        content, leader = llm_flight.do(cache_key, query)
+    except Exception as e:
+        # The leader finishes its own span; a follower that shared its failure finishes this one
+        if span.end is None:
+            span.set(coalesced=True).finish(error=e)
+        raise
+    if not leader:
+        span.set(coalesced=True, retry_count=0).finish()
+        logging.info("[id=%s] [span=%s] [function=run_llm_query] [called_by=%s] [description=LLM query coalesced with an identical in-flight request]", span.request_id, span.span_id, span.caller)
+    return content
+
+def _retry_delay(function, span, error, attempt, max_retries, retry_delay, rate_limiter):
+    """Log a failed attempt and return how long to wait before the next one."""
+    retry_after = get_retry_after(error)
+    delay = backoff_delay(attempt, retry_after, base=retry_delay)
+    if is_rate_limit_error(error):
+        if retry_after is not None:
+            # Pause every caller of this model, not just this one
+            rate_limiter.block_for(retry_after)
+        logging.warning("[id=%s] [span=%s] [function=%s] [called_by=%s] [description=Rate limit hit, retrying in %.2f seconds... (attempt %d/%d)] [queue_depth=%d]",
+                        span.request_id, span.span_id, function, span.caller, delay, attempt + 1, max_retries, rate_limiter.queue_depth)
+    else:
+        logging.error("[id=%s] [span=%s] [function=%s] [called_by=%s] [description=Error in LLM call: %s. Retrying in %.2f seconds... (attempt %d/%d)]",
+                      span.request_id, span.span_id, function, span.caller, error, delay, attempt + 1, max_retries)
+    return delay
+
+def _retries_exhausted(function, span, attempt, max_retries):
+    error = RuntimeError(f"LLM call failed after {max_retries} attempts due to repeated errors or rate limits.")
+    span.set(retry_count=attempt)
+    logging.critical("[id=%s] [span=%s] [function=%s] [called_by=%s] [description=LLM call failed after %d attempts.]", span.request_id, span.span_id, function, span.caller, max_retries)
+    return error
+
+def _query_with_retries(client, span, model, messages, stream, temp, max_tokens, max_retries, retry_delay, cache_key):
+    """Provider call with rate limiting, per-model concurrency cap, retries and backoff for run_llm_query. Finishes span."""
+    if stream:
+        return _stream_with_retries(client, span, model, messages, temp, max_tokens, max_retries, retry_delay, cache_key)
+    rate_limiter = get_rate_limiter(model)
+    estimated_tokens = estimate_tokens(messages, max_tokens)
+    queue_time = 0.0
+    attempt = 0
     while attempt < max_retries:
         try:
-            if not stream:
-                response = config.client.chat.completions.create(
+            queue_time += rate_limiter.acquire(estimated_tokens)
+            span.set(queue_time=queue_time, retry_count=attempt)
+            with model_slot_sync(model):
+                response = client.chat.completions.create(
                     model=model,
                     messages=messages,
                     temperature=temp,
                     max_tokens=max_tokens,
                 )
-                logging.info(f"{log_prefix} [description=LLM query successful on attempt {attempt+1} | {format_log_string('system_prompt', system_prompt)} | {format_log_string('user_input', user_input)} | response={str(response.choices[0].message.content).strip()}] [usage={response.usage}]")
-                return str(response.choices[0].message.content).strip()
-            else:
-                response = config.client.chat.completions.create(
-                    model=config.completion_model,
+            content = str(response.choices[0].message.content).strip()
+            span.mark("time_to_first_token").set(**usage_attributes(response.usage)).finish()
+            logging.info("[id=%s] [span=%s] [function=run_llm_query] [called_by=%s] [description=LLM query successful on attempt %d] [duration=%.3f] [usage=%s]",
+                         span.request_id, span.span_id, span.caller, attempt + 1, span.duration, response.usage)
+            if cache_key:
+                response_cache.set(cache_key, content)
+            return content
+        except Exception as e:
+            time.sleep(_retry_delay("run_llm_query", span, e, attempt, max_retries, retry_delay, rate_limiter))
+            attempt += 1
+    error = _retries_exhausted("run_llm_query", span, attempt, max_retries)
+    span.finish(error=error)
+    raise error
+
+def _stream_with_retries(client, span, model, messages, temp, max_tokens, max_retries, retry_delay, cache_key):
+    """
+    Streaming provider call for run_llm_query. The request is made, and the model's slot held,
+    only while the generator is consumed. Failures before the first token are retried. Finishes span.
+    """
+    rate_limiter = get_rate_limiter(model)
+    estimated_tokens = estimate_tokens(messages, max_tokens)
+    queue_time = 0.0
+    full_message = ""
+    usage_data = None
+    error = None
+    attempt = 0
+    try:
+        while True:
+            if attempt >= max_retries:
+                raise _retries_exhausted("run_llm_query", span, attempt, max_retries)
+            try:
+                queue_time += rate_limiter.acquire(estimated_tokens)
+                span.set(queue_time=queue_time, retry_count=attempt)
+                with model_slot_sync(model):
+                    response = client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temp,
+                        max_tokens=max_tokens,
+                        stream=True,
+                        **stream_request_options(model),
+                    )
+                    for chunk in response:
+                        delta = getattr(chunk.choices[0], 'delta', None) if chunk.choices else None
+                        if delta and getattr(delta, 'content', None):
+                            if not full_message:
+                                span.mark("time_to_first_token")
+                            full_message += delta.content
+                            yield delta.content
+                        if getattr(chunk, 'usage', None):
+                            usage_data = chunk.usage
+                break
+            except Exception as e:
+                if full_message:
+                    # Part of the answer has been shown already, so it cannot be retried
+                    raise
+                if rejected_stream_options(model, span, e):
+                    continue
+                time.sleep(_retry_delay("run_llm_query", span, e, attempt, max_retries, retry_delay, rate_limiter))
+                attempt += 1
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        span.set(**usage_attributes(usage_data)).finish(error=error)
+    logging.info("[id=%s] [span=%s] [function=run_llm_query] [called_by=%s] [description=LLM streaming query finished on attempt %d] [duration=%.3f] [usage=%s]",
+                 span.request_id, span.span_id, span.caller, attempt + 1, span.duration, usage_data)
+    if cache_key and full_message:
+        response_cache.set(cache_key, full_message.strip())
+
+async def run_llm_query_async(system_prompt: str, user_input: str, stream: bool = False, max_tokens: int = 6000, max_retries: int = 8, retry_delay: float = 1, request_id: str = None, large_model=True, temp=0.0, conversation_history: list = None, use_cache: bool = None):
+    """ Async counterpart of run_llm_query, built on the session's async client.
+    Each request holds one of the model's in-flight slots (see llm_async.model_slot),
+    so independent calls can be awaited concurrently without exceeding the per-model cap.
+    If stream is True, returns an async generator for streaming output.
+
+    Args:
+        conversation_history: List of previous messages. Session state is not reachable from
+                            the shared event loop, so callers must pass it explicitly; None means no history.
+    """
+    runtime_config = config.get_runtime_config()
+    model = runtime_config.completion_model if large_model else runtime_config.completion_model_sml
+    conversation_history = conversation_history or []
+
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.extend(conversation_history)
+    messages.append({"role": "user", "content": user_input})
+
+    span = start_span("run_llm_query_async", caller=get_caller(), request_id=request_id, model=model, stream=stream, temperature=temp, max_tokens=max_tokens)
+    log_prompt(span, system_prompt, user_input)
+
+    if use_cache is None:
+        use_cache = temp == 0.0
+    cache_key = None
+    if use_cache:
+        cache_key = make_cache_key(model, system_prompt, conversation_history, user_input, temp, max_tokens)
+        cached_response = response_cache.get(cache_key)
+        if cached_response is not None:
+            span.set(cache_hit=True, retry_count=0).finish()
+            logging.info("[id=%s] [span=%s] [function=run_llm_query_async] [called_by=%s] [description=Async LLM query served from response cache]", span.request_id, span.span_id, span.caller)
+            if stream:
+                async def cached_generator():
+                    yield cached_response
+                return cached_generator()
+            return cached_response
+    span.set(cache_hit=False)
+
+    async def query():
+        return await _query_with_retries_async(runtime_config.async_client, span, model, messages, stream, temp, max_tokens, max_retries, retry_delay, cache_key)
+
+    if stream or cache_key is None:
+        return await query()
+    # Identical deterministic requests that are in flight at the same time share one upstream call
+    try:
+        content, leader = await llm_flight.do_async(cache_key, query)
+    except Exception as e:
+        # The leader finishes its own span; a follower that shared its failure finishes this one
+        if span.end is None:
+            span.set(coalesced=True).finish(error=e)
+        raise
+    if not leader:
+        span.set(coalesced=True, retry_count=0).finish()
+        logging.info("[id=%s] [span=%s] [function=run_llm_query_async] [called_by=%s] [description=Async LLM query coalesced with an identical in-flight request]", span.request_id, span.span_id, span.caller)
+    return content
+
+async def _query_with_retries_async(client, span, model, messages, stream, temp, max_tokens, max_retries, retry_delay, cache_key):
+    """Provider call with rate limiting, per-model concurrency cap, retries and backoff for run_llm_query_async. Finishes span."""
+    if stream:
+        return _stream_with_retries_async(client, span, model, messages, temp, max_tokens, max_retries, retry_delay, cache_key)
+    rate_limiter = get_rate_limiter(model)
+    estimated_tokens = estimate_tokens(messages, max_tokens)
+    queue_time = 0.0
+    attempt = 0
+    while attempt < max_retries:
+        try:
+            queue_time += await rate_limiter.acquire_async(estimated_tokens)
+            span.set(queue_time=queue_time, retry_count=attempt)
+            async with model_slot(model):
+                response = await client.chat.completions.create(
+                    model=model,
                     messages=messages,
                     temperature=temp,
                     max_tokens=max_tokens,
-                    stream=True,
                 )
-                def generator():
-                    full_message = ""
-                    usage_data = None
-                    for chunk in response:
-                        delta = getattr(chunk.choices[0], 'delta', None)
-                        if delta and hasattr(delta, 'content') and delta.content:
+            content = str(response.choices[0].message.content).strip()
+            span.mark("time_to_first_token").set(**usage_attributes(response.usage)).finish()
+            logging.info("[id=%s] [span=%s] [function=run_llm_query_async] [called_by=%s] [description=Async LLM query successful on attempt %d] [duration=%.3f] [usage=%s]",
+                         span.request_id, span.span_id, span.caller, attempt + 1, span.duration, response.usage)
+            if cache_key:
+                response_cache.set(cache_key, content)
+            return content
+        except Exception as e:
+            await asyncio.sleep(_retry_delay("run_llm_query_async", span, e, attempt, max_retries, retry_delay, rate_limiter))
+            attempt += 1
+    error = _retries_exhausted("run_llm_query_async", span, attempt, max_retries)
+    span.finish(error=error)
+    raise error
+
+async def _stream_with_retries_async(client, span, model, messages, temp, max_tokens, max_retries, retry_delay, cache_key):
+    """
+    Streaming provider call for run_llm_query_async. The model's slot is taken with async with
+    inside the generator, so a generator that is never consumed holds no slot, and one that is
+    closed early releases it. Failures before the first token are retried. Finishes span.
+    """
+    rate_limiter = get_rate_limiter(model)
+    estimated_tokens = estimate_tokens(messages, max_tokens)
+    queue_time = 0.0
+    full_message = ""
+    usage_data = None
+    error = None
+    attempt = 0
+    try:
+        while True:
+            if attempt >= max_retries:
+                raise _retries_exhausted("run_llm_query_async", span, attempt, max_retries)
+            try:
+                queue_time += await rate_limiter.acquire_async(estimated_tokens)
+                span.set(queue_time=queue_time, retry_count=attempt)
+                async with model_slot(model):
+                    response = await client.chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        temperature=temp,
+                        max_tokens=max_tokens,
+                        stream=True,
+                        **stream_request_options(model),
+                    )
+                    async for chunk in response:
+                        delta = getattr(chunk.choices[0], 'delta', None) if chunk.choices else None
+                        if delta and getattr(delta, 'content', None):
+                            if not full_message:
+                                span.mark("time_to_first_token")
                             full_message += delta.content
                             yield delta.content
-                        if hasattr(chunk, 'usage') and chunk.usage:
+                        if getattr(chunk, 'usage', None):
                             usage_data = chunk.usage
-                    logging.info(f"{log_prefix} [description=LLM streaming query finished on attempt {attempt+1} | {format_log_string('system_prompt', system_prompt)} | {format_log_string('user_input', user_input)} | full_message={full_message}] [usage={usage_data}]")
-                return generator()
-        except Exception as e:
-            if hasattr(e, "status_code") and e.status_code == 429 or "rate limit" in str(e).lower():
-                logging.warning(f"{log_prefix} [description=Rate limit hit, retrying in {retry_delay} seconds... (attempt {attempt+1}/{max_retries})]")
-            else:
-                logging.error(f"{log_prefix} [description=Error in LLM call: {e}. Retrying in {retry_delay} seconds... (attempt {attempt+1}/{max_retries}) | {format_log_string('system_prompt', system_prompt)} | {format_log_string('user_input', user_input)}]")
-                logging.error(f"{log_prefix} [description=System prompt: {system_prompt}]")
-                logging.error(f"{log_prefix} [description=User input: {user_input}]")
-            time.sleep(retry_delay)
-            attempt += 1
-    logging.critical(f"{log_prefix} [description=LLM call failed after {max_retries} attempts. | {format_log_string('system_prompt', system_prompt)} | {format_log_string('user_input', user_input)}]")
-    raise RuntimeError(f"LLM call failed after {max_retries} attempts due to repeated errors or rate limits.")
\ No newline at end of file
+                break
+            except Exception as e:
+                if full_message:
+                    # Part of the answer has been delivered already, so it cannot be retried
+                    raise
+                if rejected_stream_options(model, span, e):
+                    continue
+                await asyncio.sleep(_retry_delay("run_llm_query_async", span, e, attempt, max_retries, retry_delay, rate_limiter))
+                attempt += 1
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        span.set(**usage_attributes(usage_data)).finish(error=error)
+    logging.info("[id=%s] [span=%s] [function=run_llm_query_async] [called_by=%s] [description=Async LLM streaming query finished] [duration=%.3f] [usage=%s]",
+                 span.request_id, span.span_id, span.caller, span.duration, usage_data)
+    if cache_key and full_message:
+        response_cache.set(cache_key, full_message.strip())
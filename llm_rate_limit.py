@@ -0,0 +1,195 @@
+"""
+Process-wide rate limiting and retry backoff for LLM calls.
+
+Every LLM call acquires from a per-model pair of token buckets (requests per minute and
+tokens per minute) before it is sent. When the provider still answers 429, the caller
+backs off exponentially with full jitter, honouring any Retry-After header.
+"""
+
+import asyncio
+import random
+import threading
+import time
+
+DEFAULT_REQUESTS_PER_MINUTE = 300
+DEFAULT_TOKENS_PER_MINUTE = 1000000
+
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+# Per-model overrides: {model: {"requests_per_minute": int, "tokens_per_minute": int}}
+MODEL_BUDGETS = {}
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at rate per second, holding at most capacity."""
+
+    def __init__(self, capacity, rate):
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount tokens are available. Amounts above capacity are clamped."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+
+class ModelRateLimiter:
+    """Request and token budgets for a single model, shared by every thread and event loop."""
+
+    def __init__(self, model, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+        self.model = model
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+        self.blocked_until = 0.0  # Set from Retry-After so every caller pauses together
+        self.queue_depth = 0
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, estimated_tokens):
+        """Take from both buckets if possible. Returns 0.0 on success, otherwise seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(
+                self.blocked_until - now,
+                self.requests.wait_time(1, now),
+                self.tokens.wait_time(estimated_tokens, now),
+            )
+            if wait <= 0:
+                self.requests.take(1)
+                self.tokens.take(estimated_tokens)
+                return 0.0
+            return wait
+
+    def acquire(self, estimated_tokens=1):
+        """Block until the request fits in the model's budget. Returns the seconds spent queued."""
+        started = time.monotonic()
+        with self._lock:
+            self.queue_depth += 1
+        try:
+            while True:
+                wait = self._try_acquire(estimated_tokens)
+                if wait <= 0:
+                    return time.monotonic() - started
+                time.sleep(min(wait, 1.0))
+        finally:
+            with self._lock:
+                self.queue_depth -= 1
+
+    async def acquire_async(self, estimated_tokens=1):
+        """Async counterpart of acquire; waits on the event loop instead of blocking a thread."""
+        started = time.monotonic()
+        with self._lock:
+            self.queue_depth += 1
+        try:
+            while True:
+                wait = self._try_acquire(estimated_tokens)
+                if wait <= 0:
+                    return time.monotonic() - started
+                await asyncio.sleep(min(wait, 1.0))
+        finally:
+            with self._lock:
+                self.queue_depth -= 1
+
+    def block_for(self, seconds):
+        """Pause all callers for this model, e.g. after a 429 with Retry-After."""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            self.requests._refill(now)
+            self.tokens._refill(now)
+            return {
+                "queue_depth": self.queue_depth,
+                "requests_available": int(self.requests.tokens),
+                "tokens_available": int(self.tokens.tokens),
+                "blocked_for": max(0.0, self.blocked_until - now),
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model) -> ModelRateLimiter:
+    """Return the shared limiter for a model, creating it from MODEL_BUDGETS on first use."""
+    with _limiters_lock:
+        limiter = _limiters.get(model)
+        if limiter is None:
+            limiter = ModelRateLimiter(model, **MODEL_BUDGETS.get(model, {}))
+            _limiters[model] = limiter
+        return limiter
+
+
+def queue_depth(model=None) -> int:
+    """Number of callers currently waiting for a budget, for one model or all of them."""
+    with _limiters_lock:
+        limiters = [_limiters[model]] if model in _limiters else ([] if model else list(_limiters.values()))
+    return sum(limiter.queue_depth for limiter in limiters)
+
+
+def rate_limit_stats() -> dict:
+    """Return limiter stats for every model seen so far."""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.model: limiter.stats() for limiter in limiters}
+
+
+def estimate_tokens(messages, max_tokens) -> int:
+    """Rough token estimate for budgeting: ~4 characters per prompt token plus the completion cap."""
+    prompt_chars = sum(len(str(message.get("content", ""))) for message in messages)
+    return prompt_chars // 4 + max_tokens
+
+
+def is_rate_limit_error(e) -> bool:
+    return getattr(e, "status_code", None) == 429 or "rate limit" in str(e).lower()
+
+
+def get_retry_after(e):
+    """Return the Retry-After delay in seconds from a provider error, or None if absent."""
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        # HTTP-date form
+        from email.utils import parsedate_to_datetime
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def backoff_delay(attempt, retry_after=None, base=BACKOFF_BASE_SECONDS, cap=BACKOFF_MAX_SECONDS) -> float:
+    """
+    Exponential backoff with full jitter for the given zero-based attempt.
+    A Retry-After value from the provider is used as the lower bound.
+    """
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
@@ -6,303 +6,366 @@
 import pandas as pd
 import streamlit as st
 from llm_calls import classify_and_get_context, update_categories_list
+from reconciler import apply_finished_reconciliations, pending_reconciliations, RECONCILE_POLL_SECONDS
+import server.config as config
+import seed_data
+from message_store import get_message_store
+from session_store import open_session, save_session, restore_version, session_store
+from upload_ingestion import queue_uploads, ingestion_jobs, pending_ingestions, activate_session_uploads, INGEST_POLL_SECONDS
 from scope_visualizer import display_scope_of_work
 from ui_styles import apply_custom_styles
-from docx import Document
-import io
+import exports
+from llm_cache import content_hash
+from tracing import start_span, span_stats
+import time
 
 HEIGHT = 500
-
-default_scope_of_work_dict_file = "default_scope_of_work.txt"
-default_scope_of_work_string = open(default_scope_of_work_dict_file, "r").read()
-default_scope_of_work = eval(default_scope_of_work_string)
-
-default_categories_list_file = "default_categories_list.txt"
-default_categories_list_string = open(default_categories_list_file, "r").read()
-st.session_state["FULL_CATEGORIES_LIST"] = eval(default_categories_list_string)
-
-default_assumptions_and_exclusions_file = "default_assumptions_and_exclusions.txt"
-default_assumptions_and_exclusions_string = open(default_assumptions_and_exclusions_file, "r").read()
-default_assumptions_and_exclusions = eval(default_assumptions_and_exclusions_string)
-st.session_state.setdefault("ASSUMPTIONS_AND_EXCLUSIONS", default_assumptions_and_exclusions)
+STREAM_REFRESH_SECONDS = 0.1  # Bounds how often the streaming chat message is re-rendered
+CHAT_WINDOW = 30  # Messages drawn in the chat pane; older ones are loaded on demand
+
+
+def activate_session():
+    """Make this session's backend and uploaded documents current for the calls made during this run."""
+    config.activate_session_config()
+    activate_session_uploads()
+
+
+def load_older_messages():
+    st.session_state.chat_window += CHAT_WINDOW
+
+
+def prepare_export(kind, fmt):
+    """Button callback: build one export of a document before the rerun that shows its download button."""
+    st.session_state[f"export_{kind}_{fmt}"] = exports.export(kind, fmt, st.session_state[kind])
+
+
+def export_buttons(kind, formats, columns, digest):
+    """
+    One column per format: a download button if the export is built for the current document,
+    otherwise a button that builds it. Nothing is built until asked for.
+    """
+    label = exports.DOCUMENT_LABELS[kind]
+    for fmt, column in zip(formats, columns):
+        prepared = st.session_state.get(f"export_{kind}_{fmt}")
+        with column:
+            if prepared is not None and prepared.digest == digest:
+                st.download_button(
+                    label=f"Download {label} as {fmt.upper()}",
+                    data=prepared.data,
+                    file_name=prepared.file_name,
+                    mime=prepared.mime,
+                    width="stretch",
+                )
+            else:
+                st.button(
+                    label=f"Prepare {label} as {fmt.upper()}",
+                    key=f"prepare_{kind}_{fmt}",
+                    on_click=prepare_export,
+                    args=(kind, fmt),
+                    width="stretch",
+                )
+
+# Resume the session named in the URL before anything is seeded with defaults
+session_id = open_session()
+
+# Seed datasets are parsed once per process and shared; sessions get their own editable copies
+st.session_state["FULL_CATEGORIES_LIST"] = seed_data.default_categories_list()
+if "ASSUMPTIONS_AND_EXCLUSIONS" not in st.session_state:
+    st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"] = seed_data.thaw(seed_data.default_assumptions_and_exclusions())
 
 print("\n" * 5)
 print("Starting AEC Contract Assistant...")
 
-st.set_page_config(
-    page_title="ContractCadence",
-    page_icon="🤖",
-    layout="wide",
-    initial_sidebar_state="collapsed",
-)
+# Times the full script run; each pane fragment also times its own runs (see the sidebar).
+# st.rerun() ends a run by raising, so the span is finished in finally
+run_span = start_span("rerun", scope="app")
+try:
+    st.set_page_config(
+        page_title="ContractCadence",
+        page_icon="🤖",
+        layout="wide",
+        initial_sidebar_state="collapsed",
+    )
 
-# Apply custom CSS styling
-# apply_custom_styles()
+    # Apply custom CSS styling
+    # apply_custom_styles()
 
-# Build the chat interface
-st.title("ContractCadence 🤖")
-doc_column, chat_column = st.columns([3, 3])
+    # Build the chat interface
+    st.title("ContractCadence 🤖")
+    doc_column, chat_column = st.columns([3, 3])
 
-# The chat window allows the user to have a conversation with the AI assistant
-# This conversation would generate a dictionary of deliverables, and associated lists of scope items
+    # The chat window allows the user to have a conversation with the AI assistant
+    # This conversation would generate a dictionary of deliverables, and associated lists of scope items
 
-st.session_state.setdefault("messages", [])
-st.session_state.setdefault("scope_of_work", default_scope_of_work)
-st.session_state.setdefault("conversation_history", [])
+    if "scope_of_work" not in st.session_state:
+        st.session_state["scope_of_work"] = seed_data.thaw(seed_data.default_scope_of_work())
+    st.session_state.setdefault("chat_window", CHAT_WINDOW)
 
-st.session_state.setdefault("first_run", True)
+    st.session_state.setdefault("first_run", True)
 
-print("Streamlit session state initialized.")
-print(f"Scope of work: {st.session_state.scope_of_work}")
-print(f"Assumptions and Exclusions: {st.session_state['ASSUMPTIONS_AND_EXCLUSIONS']}")
+    # Use this session's backend, models and uploads for every call made during this run
+    activate_session()
 
-with st.sidebar:
-    st.markdown("##### Upload Reference Documents 📄")
-    uploaded_files = st.file_uploader(
-        "Upload architectural plans, contracts, or other reference documents to assist the AI in understanding your project requirements. Note: This feature is currently disabled.",
-        accept_multiple_files=True,
-        type=["pdf", "docx", "txt"],
-    )
-    if uploaded_files:
-        st.markdown("**Uploaded Files:**")
-        for uploaded_file in uploaded_files:
-            st.markdown(f"- {uploaded_file.name}")
-            
-# The scope window displays the current scope of work being developed
-# It shows a list of deliverables, each with associated scope items
-with doc_column:
-    scope_tab, exclusions_tab = st.tabs(["Scope of Work 📋", "Assumptions and Exclusions ❌"])
-
-    with scope_tab:
-        tabs = st.tabs(["Markdown View", "Table View (Manual Edit)"])
-        
-        with tabs[1]:
-            # Use DEFAULT_SCOPE_OF_WORK for testing
-            scope_to_display = st.session_state.scope_of_work
-            display_scope_of_work(scope_to_display, height=HEIGHT)
-
-        with tabs[0]:
-            with st.container(height=HEIGHT, border=True):
-                # Display the scope of work in markdown format
-                scope_of_work = st.session_state.scope_of_work
-
-                markdown_lines = []
-                try:
-                    for phase, disciplines in scope_of_work.items():
-                        markdown_lines.append(f"##### {phase}")
-                        try:
-                            for discipline, items in disciplines.items():
-                                markdown_lines.append(f"###### {discipline}")
-                                for item in items:
-                                    markdown_lines.append(f"- {item}")
-                        except Exception as e:
-                            continue
-                except Exception as e:
-                    markdown_lines.append("No scope items yet.")
-                markdown_lines.append("\n")
-                markdown_lines.append("\* This scope of work was generated with the assistance of ContractCadence, an AI-powered AEC contract assistant.")
-
-                markdown_text = "\n".join(markdown_lines)
-                st.markdown(markdown_text)
-
-        cols = st.columns(3)
-        with cols[0]:
-            # Add a download button for the scope of work
-            scope_of_work_df = pd.DataFrame(st.session_state.scope_of_work)
-            download_button = st.download_button(
-                label="Download scope of work as CSV",
-                data=scope_of_work_df.to_csv(index=False),
-                file_name="scope_of_work.csv",
-                mime="text/csv",
-                width="stretch",
-            )
-        with cols[1]:
-            # Add a button to download the markdown view of the scope of work as a .md file
-            doc = Document()
-            scope_of_work = st.session_state.scope_of_work
-            try:
-                for phase, disciplines in scope_of_work.items():
-                    doc.add_heading(phase, level=1)
-                    try:
-                        for discipline, items in disciplines.items():
-                            doc.add_heading(discipline, level=2)
-                            for item in items:
-                                doc.add_paragraph(item, style='List Bullet')
-                    except Exception as e:
-                        continue
-            except Exception as e:
-                pass
-            docx_content = io.BytesIO()
-            doc.save(docx_content)
-            docx_content.seek(0)
-
-            download_button = st.download_button(
-                label="Download scope of work as DOCX",
-                data=docx_content,
-                file_name="scope_of_work.docx",
-                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                width="stretch",
-            )
-        with cols[2]:
-            download_button = st.button(
-                label="Download categories list as CSV",
-                width="stretch",
-            )
-
-            if download_button:
-                with st.spinner("Updating categories list, this may take a moment..."):
-                    update_categories_list()
-
-    with exclusions_tab:        
-        tabs = st.tabs(["Markdown View", "Table View (Manual Edit)"])
-        with tabs[1]:
-            # Display the assumptions and exclusions in a table view for manual editing
-            assumptions_and_exclusions = st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"]
+    # Apply background reconciliations that finished since the last run, before the documents are drawn
+    apply_finished_reconciliations()
+
+    print("Streamlit session state initialized.")
+    print(f"Scope of work: {st.session_state.scope_of_work}")
+    print(f"Assumptions and Exclusions: {st.session_state['ASSUMPTIONS_AND_EXCLUSIONS']}")
+
+    with st.sidebar:
+        st.markdown("##### Upload Reference Documents 📄")
+        uploaded_files = st.file_uploader(
+            "Upload architectural plans, contracts, or other reference documents to assist the AI in understanding your project requirements.",
+            accept_multiple_files=True,
+            type=["pdf", "docx", "txt"],
+        )
+        # Files are read and embedded in the background; the chat stays usable meanwhile
+        queue_uploads(uploaded_files)
+        st.session_state["ingestion_polling"] = bool(pending_ingestions())
+
+        # Poll only while files are being ingested; the run after the last one finishes stops the polling
+        @st.fragment(run_every=INGEST_POLL_SECONDS if st.session_state.ingestion_polling else None)
+        def upload_status():
+            jobs = ingestion_jobs()
+            for job in jobs:
+                if job.status == "failed":
+                    st.caption(f"❌ {job.file_name}: {job.error}")
+                elif job.status == "done":
+                    st.caption(f"✅ {job.file_name} ({job.chunks_total} passages)")
+                else:
+                    st.progress(job.progress, text=f"{job.file_name}: {job.status}…")
+            if st.session_state.ingestion_polling and not pending_ingestions():
+                save_session()
+                st.rerun()
+
+        upload_status()
+
+        with st.expander("Versions ↩️"):
+            # Every change to the documents is saved as a version; restoring one saves it again as the newest
+            versions = session_store.versions(session_id)
+            if versions:
+                version = st.selectbox(
+                    "Scope and assumptions version",
+                    [number for number, _ in versions],
+                    format_func=lambda number: f"Version {number} ({time.strftime('%Y-%m-%d %H:%M', time.localtime(dict(versions)[number]))})",
+                )
+                if st.button("Restore this version", width="stretch", disabled=version == versions[0][0]):
+                    if restore_version(version):
+                        save_session()
+                        st.rerun()
+            else:
+                st.caption("No saved versions yet.")
+
+        with st.expander("Rerun timing ⏱️"):
+            # Recent full script runs ("app") and fragment-only runs of each pane
+            for scope, timing in sorted(span_stats("rerun", group_by="scope").items()):
+                st.caption(f"{scope}: median {timing['median'] * 1000:.0f} ms, p95 {timing['p95'] * 1000:.0f} ms over {timing['count']} runs")
             
-            disciplines = assumptions_and_exclusions.keys()
-            discipline_col_rows = []
-            assumptions_and_exclusions_col_rows = []
-            for discipline in disciplines:
-                items = assumptions_and_exclusions[discipline]
-                for item in items:
-                    discipline_col_rows.append(discipline)
-                    assumptions_and_exclusions_col_rows.append(item)
-
-            df_ae = pd.DataFrame({
-                "Discipline": discipline_col_rows,
-                "Assumptions & Exclusions": assumptions_and_exclusions_col_rows
-            })
-
-            edited_df_ae = st.data_editor(df_ae, height=HEIGHT, width="stretch", hide_index=True, num_rows="dynamic")
-            edited_dict_ae = edited_df_ae.to_dict(orient='records')
-            # Convert back to nested dictionary
-            st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"] = {}
-            for row in edited_dict_ae:
-                discipline = row["Discipline"]
-                item = row["Assumptions & Exclusions"]
-                if discipline not in st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"]:
-                    st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"][discipline] = []
-                st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"][discipline].append(item)
-
-        with tabs[0]:
-            with st.container(height=HEIGHT, border=True):
-                # Display the assumptions and exclusions in a markdown view
-                markdown_lines_ae = []
-                for discipline, items in st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"].items():
-                    markdown_lines_ae.append(f"##### {discipline}")
+    # Each pane is a fragment: interacting with a pane reruns only that pane, and a chat turn
+    # reruns the whole app only when it changed one of the documents (see chat_pane)
+    @st.fragment
+    def scope_pane():
+        """The scope of work: markdown and table views, exports and the categories list."""
+        with start_span("rerun", scope="scope_pane"):
+            tabs = st.tabs(["Markdown View", "Table View (Manual Edit)"])
+
+            with tabs[1]:
+                # Use DEFAULT_SCOPE_OF_WORK for testing
+                scope_to_display = st.session_state.scope_of_work
+                display_scope_of_work(scope_to_display, height=HEIGHT)
+
+            # Exports and markdown views are cached by this hash, so an unchanged document is not rebuilt
+            scope_digest = content_hash(st.session_state.scope_of_work)
+            with tabs[0]:
+                with st.container(height=HEIGHT, border=True):
+                    # Display the scope of work in markdown format
+                    st.markdown(exports.markdown(exports.SCOPE, st.session_state.scope_of_work, scope_digest))
+
+            cols = st.columns(3)
+            export_buttons(exports.SCOPE, ["csv", "docx"], cols[:2], scope_digest)
+            with cols[2]:
+                download_button = st.button(
+                    label="Download categories list as CSV",
+                    width="stretch",
+                )
+
+                if download_button:
+                    with st.spinner("Updating categories list, this may take a moment..."):
+                        update_categories_list()
+
+            # A table edit reruns only this pane, so persist it here; unchanged reruns cost no query
+            save_session()
+
+
+    @st.fragment
+    def assumptions_pane():
+        """The assumptions and exclusions: markdown and table views and exports."""
+        with start_span("rerun", scope="assumptions_pane"):
+            tabs = st.tabs(["Markdown View", "Table View (Manual Edit)"])
+            with tabs[1]:
+                # Display the assumptions and exclusions in a table view for manual editing
+                assumptions_and_exclusions = st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"]
+
+                disciplines = assumptions_and_exclusions.keys()
+                discipline_col_rows = []
+                assumptions_and_exclusions_col_rows = []
+                for discipline in disciplines:
+                    items = assumptions_and_exclusions[discipline]
                     for item in items:
-                        markdown_lines_ae.append(f"- {item}")
-                markdown_text_ae = "\n".join(markdown_lines_ae)
-                st.markdown(markdown_text_ae)
-        
-        cols = st.columns(2)
-        with cols[0]:
-            # Add a download button for the assumptions and exclusions as CSV
-            ae_discipline_col_rows = []
-            ae_item_col_rows = []
-            for discipline, items in st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"].items():
-                for item in items:
-                    ae_discipline_col_rows.append(discipline)
-                    ae_item_col_rows.append(item)
-
-            ae_df = pd.DataFrame({
-                "Discipline": ae_discipline_col_rows,
-                "Assumptions & Exclusions": ae_item_col_rows
-            })
-
-            download_button_ae = st.download_button(
-                label="Download assumptions and exclusions as CSV",
-                data=ae_df.to_csv(index=False),
-                file_name="assumptions_and_exclusions.csv",
-                mime="text/csv",
-                width="stretch",
-            )
-        with cols[1]:
-            # Add a button to download the assumptions and exclusions as a DOCX file
-            doc_ae = Document()
-            doc_ae.add_heading("Assumptions and Exclusions", level=0)
-            for discipline, items in st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"].items():
-                doc_ae.add_heading(discipline, level=1)
-                for item in items:
-                    doc_ae.add_paragraph(item, style='List Bullet')
-            docx_content_ae = io.BytesIO()
-            doc_ae.save(docx_content_ae)
-            docx_content_ae.seek(0)
-
-            download_button_ae = st.download_button(
-                label="Download assumptions and exclusions as DOCX",
-                data=docx_content_ae,
-                file_name="assumptions_and_exclusions.docx",
-                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                width="stretch",
-            )
-
-
-with chat_column:
-    st.markdown("##### Chat with your AEC Contract Assistant 💬")
-    message_container = st.container(height=HEIGHT + 90, border=True)
-
-    if st.session_state.messages == []:
-        st.session_state.messages.append(
-            {
-                "role": "assistant",
-                "content": "Hello! I'm your AEC Contract Assistant. Describe your project and requirements, and I'll help you build a comprehensive scope of work."
-            }
-        )
-
-    with message_container:
-        for message in st.session_state.messages:
-            with st.chat_message(message["role"]):
-                st.markdown(message["content"])
-
-    if prompt := st.chat_input("Describe your project and requirements..."):
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        with message_container:
-            with st.chat_message("user"):
-                st.markdown(prompt)
-
-            # Call LLM with conversation history for context, with streaming enabled
-            response_generator = classify_and_get_context(prompt)
-
-            # Display streaming response
-            with st.chat_message("assistant"):
-                response_placeholder = st.empty()
-                full_response = ""
-                
-                # Stream the response
-                for chunk in response_generator:
-                    full_response += chunk
-                    response_placeholder.markdown(full_response + "▌")
-                
-                # Final update without cursor
-                response_placeholder.markdown(full_response)
-
-        # Update conversation history with user message and assistant response
-        st.session_state.conversation_history.append({"role": "user", "content": prompt})
-        st.session_state.conversation_history.append({"role": "assistant", "content": full_response})
-
-        st.session_state.messages.append({"role": "assistant", "content": full_response})
-
-        print("Rerunning Streamlit app.")
-        st.rerun()
+                        discipline_col_rows.append(discipline)
+                        assumptions_and_exclusions_col_rows.append(item)
+
+                df_ae = pd.DataFrame({
+                    "Discipline": discipline_col_rows,
+                    "Assumptions & Exclusions": assumptions_and_exclusions_col_rows
+                })
+
+                edited_df_ae = st.data_editor(df_ae, height=HEIGHT, width="stretch", hide_index=True, num_rows="dynamic")
+                edited_dict_ae = edited_df_ae.to_dict(orient='records')
+                # Convert back to nested dictionary
+                st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"] = {}
+                for row in edited_dict_ae:
+                    discipline = row["Discipline"]
+                    item = row["Assumptions & Exclusions"]
+                    if discipline not in st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"]:
+                        st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"][discipline] = []
+                    st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"][discipline].append(item)
+
+            assumptions_digest = content_hash(st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"])
+            with tabs[0]:
+                with st.container(height=HEIGHT, border=True):
+                    # Display the assumptions and exclusions in a markdown view
+                    st.markdown(exports.markdown(exports.ASSUMPTIONS, st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"], assumptions_digest))
+
+            cols = st.columns(2)
+            export_buttons(exports.ASSUMPTIONS, ["csv", "docx"], cols, assumptions_digest)
+
+            # A table edit reruns only this pane, so persist it here; unchanged reruns cost no query
+            save_session()
+
+
+    def document_digests():
+        return content_hash(st.session_state.scope_of_work), content_hash(st.session_state["ASSUMPTIONS_AND_EXCLUSIONS"])
+
+
+    @st.fragment
+    def chat_pane():
+        """The transcript and chat input. A turn that leaves the documents unchanged redraws only this pane."""
+        with start_span("rerun", scope="chat_pane"):
+            # A fragment run does not run the top of the script, so activate the session here too
+            activate_session()
+            st.markdown("##### Chat with your AEC Contract Assistant 💬")
+            message_container = st.container(height=HEIGHT + 90, border=True)
+
+            store = get_message_store()
+            if len(store) == 0:
+                store.append(
+                    "assistant",
+                    "Hello! I'm your AEC Contract Assistant. Describe your project and requirements, and I'll help you build a comprehensive scope of work."
+                )
+
+            with message_container:
+                # Draw only the newest messages; older ones are paged in on request
+                window = store.window(st.session_state.chat_window)
+                if window and window[0][0] > 0:
+                    st.button(f"Load older messages ({window[0][0]} more)", key="load_older_messages", on_click=load_older_messages, width="stretch")
+                for message_id, message in window:
+                    with st.chat_message(message["role"]):
+                        st.markdown(message["content"])
+
+            if prompt := st.chat_input("Describe your project and requirements..."):
+                documents_before = document_digests()
+                prompt_id = store.append("user", prompt)
+                with message_container:
+                    with st.chat_message("user"):
+                        st.markdown(prompt)
+
+                    # Call LLM with conversation history for context, with streaming enabled
+                    response_generator = classify_and_get_context(prompt, stream=True)
+
+                    # Display streaming response
+                    with st.chat_message("assistant"):
+                        response_placeholder = st.empty()
+                        chunks = []
+                        last_refresh = 0.0
+
+                        # Stream the response, re-rendering the markdown at most once per STREAM_REFRESH_SECONDS
+                        for chunk in response_generator:
+                            chunks.append(chunk)
+                            now = time.monotonic()
+                            if now - last_refresh >= STREAM_REFRESH_SECONDS:
+                                response_placeholder.markdown("".join(chunks) + "▌")
+                                last_refresh = now
+
+                        # Final update without cursor
+                        full_response = "".join(chunks)
+                        response_placeholder.markdown(full_response)
+
+                # The prompt joins the conversation history once answered, followed by the response
+                store.add_to_history(prompt_id)
+                store.append("assistant", full_response, in_history=True)
+
+                save_session()
+
+                # Redraw the whole app if the turn changed a document, otherwise only the chat pane,
+                # to show the status messages the handlers added during the turn
+                if document_digests() != documents_before:
+                    print("Documents changed, rerunning Streamlit app.")
+                    st.rerun()
+                st.rerun(scope="fragment")
+
+
+    # The scope window displays the current scope of work being developed
+    # It shows a list of deliverables, each with associated scope items
+    with doc_column:
+        scope_tab, exclusions_tab = st.tabs(["Scope of Work 📋", "Assumptions and Exclusions ❌"])
+
+        with scope_tab:
+            scope_pane()
+
+        with exclusions_tab:
+            assumptions_pane()
+
+
+    with chat_column:
+        chat_pane()
+
+        # Poll only while a reconciliation is running; a finished one triggers a full rerun
+        # to redraw the documents and the transcript, which also stops the polling
+        @st.fragment(run_every=RECONCILE_POLL_SECONDS if pending_reconciliations() else None)
+        def reconciliation_status():
+            if apply_finished_reconciliations():
+                save_session()
+                st.rerun()
+            pending = pending_reconciliations()
+            if pending:
+                labels = " and ".join(sorted({job.label for job in pending}))
+                st.caption(f"⏳ Reconciling the {labels} with your last change…")
+
+        reconciliation_status()
             
-str_list = []
-str_list.append("This information should not be considered legal advice. Consult a qualified attorney for legal matters.\n")
-str_list.append("Github Repository: https://github.com/sclebow/aectech25-nyc-legal-chat/ \n")
-str_list.append("Contributers: ")
-contributers_list = ["Scott Lebow, https://www.linkedin.com/in/sclebow/",
-                     "Chu Ding, https://www.linkedin.com/in/chuding/",
-                     "Yufei Wang, https://www.linkedin.com/in/yufei-wang-faye/",
-                     "Douglas Kim, https://www.linkedin.com/in/dkim19/",
-                     "Janez Mikec, https://www.linkedin.com/in/janezmikec/"]
-
-# Randomize contributers order
-import random
-random.shuffle(contributers_list)
-
-for contributer in contributers_list:
-    str_list.append(f"- {contributer}")
-
-disclaimer_text = "\n".join(str_list)
-with st.expander("Disclaimer & Contributers"):
-    st.markdown(disclaimer_text)
\ No newline at end of file
+    str_list = []
+    str_list.append("This information should not be considered legal advice. Consult a qualified attorney for legal matters.\n")
+    str_list.append("Github Repository: https://github.com/sclebow/aectech25-nyc-legal-chat/ \n")
+    str_list.append("Contributers: ")
+    contributers_list = ["Scott Lebow, https://www.linkedin.com/in/sclebow/",
+                         "Chu Ding, https://www.linkedin.com/in/chuding/",
+                         "Yufei Wang, https://www.linkedin.com/in/yufei-wang-faye/",
+                         "Douglas Kim, https://www.linkedin.com/in/dkim19/",
+                         "Janez Mikec, https://www.linkedin.com/in/janezmikec/"]
+
+    # Randomize contributers order
+    import random
+    random.shuffle(contributers_list)
+
+    for contributer in contributers_list:
+        str_list.append(f"- {contributer}")
+
+    disclaimer_text = "\n".join(str_list)
+    with st.expander("Disclaimer & Contributers"):
+        st.markdown(disclaimer_text)
+
+    save_session()
+finally:
+    run_span.finish()
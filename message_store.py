@@ -0,0 +1,117 @@
+"""
+Compact, append-only store of a session's chat messages.
+
+One store per session holds every message shown in the chat, with its id (its position),
+role and token count. Messages that are part of the conversation sent to the LLM are also
+listed in the history, as references to the same message dictionaries, so the transcript and
+the conversation history no longer keep separate copies. The chat pane renders a window of
+the newest messages and pages back through older ones on demand.
+"""
+
+import threading
+from array import array
+
+from conversation_context import count_tokens, get_session_context
+
+
+class MessageStore:
+    """Append-only chat messages; ids are positions in the store. Safe to share between threads."""
+
+    def __init__(self):
+        self._messages = []  # {"role", "content"} dictionaries, as sent to the LLM
+        self._tokens = array("I")
+        self._history = []  # The messages that are part of the conversation, in order
+        self._history_tokens = array("I")
+        self._history_ids = array("I")
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._messages)
+
+    def append(self, role: str, content: str, in_history: bool = False) -> int:
+        """Add a message and return its id. in_history also adds it to the conversation history."""
+        tokens = count_tokens(content)
+        with self._lock:
+            message_id = len(self._messages)
+            self._messages.append({"role": role, "content": content})
+            self._tokens.append(tokens)
+            if in_history:
+                self._add_to_history(message_id)
+            return message_id
+
+    def _add_to_history(self, message_id: int):
+        self._history.append(self._messages[message_id])
+        self._history_tokens.append(self._tokens[message_id])
+        self._history_ids.append(message_id)
+
+    def add_to_history(self, message_id: int):
+        """Add an earlier message to the conversation history, e.g. the user's prompt once it has been answered."""
+        with self._lock:
+            self._add_to_history(message_id)
+
+    def window(self, count: int, end: int = None) -> list:
+        """Up to count (id, message) pairs ending before id end (default: the newest), oldest first."""
+        with self._lock:
+            end = len(self._messages) if end is None else min(end, len(self._messages))
+            start = max(0, end - count)
+            return list(zip(range(start, end), self._messages[start:end]))
+
+    def history(self) -> list:
+        """The conversation history as {"role", "content"} dictionaries. Do not modify them."""
+        with self._lock:
+            return list(self._history)
+
+    def history_tokens(self) -> list:
+        """Token counts of the history entries, in the same order."""
+        with self._lock:
+            return list(self._history_tokens)
+
+    def rows(self, start: int = 0) -> list:
+        """(id, role, content, tokens) of the messages from id start on, for persistence."""
+        with self._lock:
+            return [
+                (message_id, message["role"], message["content"], self._tokens[message_id])
+                for message_id, message in enumerate(self._messages[start:], start)
+            ]
+
+    def history_ids(self, start: int = 0) -> list:
+        """Ids of the history entries from position start on."""
+        with self._lock:
+            return list(self._history_ids[start:])
+
+    @classmethod
+    def restore(cls, rows, history_ids):
+        """Rebuild a store from persisted (role, content, tokens) rows and history ids, without recounting tokens."""
+        store = cls()
+        for role, content, tokens in rows:
+            store._messages.append({"role": role, "content": content})
+            store._tokens.append(tokens)
+        for message_id in history_ids:
+            store._add_to_history(message_id)
+        return store
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "messages": len(self._messages),
+                "tokens": sum(self._tokens),
+                "history_messages": len(self._history),
+                "history_tokens": sum(self._history_tokens),
+            }
+
+
+def get_message_store() -> MessageStore:
+    """Return the MessageStore stored in the current Streamlit session, creating it on first use."""
+    import streamlit as st
+    return st.session_state.setdefault("message_store", MessageStore())
+
+
+def add_message(role: str, content: str, in_history: bool = False) -> int:
+    """Append a message to the current session's store."""
+    return get_message_store().append(role, content, in_history=in_history)
+
+
+def select_history():
+    """(recent_turns, summary) for the current session's conversation, see ConversationContext.select."""
+    store = get_message_store()
+    return get_session_context().select(store.history(), store.history_tokens())
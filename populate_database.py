@@ -13,6 +13,7 @@ CHROMA_PATH = "chroma"
 SOURCE_DATA_DIR = "source_data"
 CHUNK_SIZE = 1200
 CHUNK_OVERLAP = 60
+SUPPORTED_EXTENSIONS = ('.pdf', '.md', '.markdown', '.docx', '.txt')
 
 def get_embedding_function():
     """Get the embedding function using local LM Studio server"""
@@ -50,12 +51,35 @@ def read_markdown(file_path):
                 text += f"{element.get_text()}\n\n"
         return text
 
+def read_docx(file_path):
+    """Extract text from Word file, marking headings like Markdown"""
+    from docx import Document
+    text = ""
+    for paragraph in Document(file_path).paragraphs:
+        if not paragraph.text.strip():
+            continue
+        style = paragraph.style.name if paragraph.style is not None else ""
+        if style.startswith('Heading') and style[-1:].isdigit():
+            text += f"{'#' * int(style[-1])} {paragraph.text}\n\n"
+        else:
+            text += f"{paragraph.text}\n\n"
+    return text
+
+def read_text(file_path):
+    """Read plain text file"""
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
+        return file.read()
+
 def read_document(file_path):
-    """Read content from either PDF or Markdown file"""
+    """Read content from a PDF, Markdown, Word or plain text file"""
     if file_path.lower().endswith('.pdf'):
         return read_pdf(file_path)
     elif file_path.lower().endswith(('.md', '.markdown')):
         return read_markdown(file_path)
+    elif file_path.lower().endswith('.docx'):
+        return read_docx(file_path)
+    elif file_path.lower().endswith('.txt'):
+        return read_text(file_path)
     else:
         raise ValueError(f"Unsupported file format: {file_path}")
 
@@ -115,7 +139,7 @@ def populate_database():
     # Process documents
     print("\nProcessing documents...")
     for filename in tqdm(os.listdir(SOURCE_DATA_DIR)):
-        if filename.endswith(('.pdf', '.md', '.markdown')):
+        if filename.lower().endswith(SUPPORTED_EXTENSIONS):
             file_path = os.path.join(SOURCE_DATA_DIR, filename)
             
             try:
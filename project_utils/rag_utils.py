@@ -1,26 +1,36 @@
-import chromadb
-from chromadb.config import Settings
-from server.config import *
+import os
+import threading
+import server.config as config
+from tracing import start_span, get_caller
 
-from flashrank import Ranker, RerankRequest
+# chromadb and flashrank are imported on first use; they dominate the import time of this module
 
 CHROMA_PATH = "chroma"
+UPLOAD_COLLECTION_PREFIX = "uploads-"  # Per-session collections of uploaded documents (see upload_ingestion.py)
 
 
 
 def get_chroma_client(mode="local"):
-    """Get ChromaDB client with embedding function based on mode (local, openai, cloudflare)"""
+    """Get ChromaDB client with embedding function based on mode (local, openai, cloudflare, mock)"""
+    import chromadb
+    from chromadb.config import Settings
     from chromadb.utils import embedding_functions
     if mode == "openai":
         embedding_fn = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=OPENAI_API_KEY,
-            model_name=openai_embedding_model
+            api_key=os.getenv("OPENAI_API_KEY"),
+            model_name=config.openai_embedding_model
         )
     elif mode == "cloudflare":
         embedding_fn = embedding_functions.OpenAIEmbeddingFunction(
-            api_base=f"https://api.cloudflare.com/client/v4/accounts/{CLOUDFLARE_ACCOUNT_ID}/ai/v1",
-            api_key=CLOUDFLARE_API_KEY,
-            model_name=cloudflare_embedding_model
+            api_base=config.backend_settings("cloudflare")["base_url"],
+            api_key=config.backend_settings("cloudflare")["api_key"],
+            model_name=config.cloudflare_embedding_model
+        )
+    elif mode == "mock":
+        embedding_fn = embedding_functions.OpenAIEmbeddingFunction(
+            api_base=config.backend_settings("mock")["base_url"],
+            api_key=config.backend_settings("mock")["api_key"],
+            model_name=config.mock_embedding_model
         )
     else:  # local
         embedding_fn = embedding_functions.OpenAIEmbeddingFunction(
@@ -35,19 +45,21 @@ def get_chroma_client(mode="local"):
     return client, embedding_fn
 # This script is only used as a RAG tool for other scripts.
 
-def get_embedding(text, model=embedding_model):
+def get_embedding(text, model=None):
     text = text.replace("\n", " ")
-    mode = get_mode()
-    if mode == "openai":
-        response = client.embeddings.create(input = [text], dimensions = 768, model=model)
+    runtime_config = config.get_runtime_config()
+    model = model or runtime_config.embedding_model
+    if runtime_config.mode == "openai":
+        response = runtime_config.client.embeddings.create(input = [text], dimensions = 768, model=model)
     else:
-        response = client.embeddings.create(input = [text], model=model)
+        response = runtime_config.client.embeddings.create(input = [text], model=model)
     vector = response.data[0].embedding
     return vector
 
-def rag_answer(question, prompt, model=completion_model):
-    completion = client.chat.completions.create(
-        model=model,
+def rag_answer(question, prompt, model=None):
+    runtime_config = config.get_runtime_config()
+    completion = runtime_config.client.chat.completions.create(
+        model=model or runtime_config.completion_model,
         messages=[
             {"role": "system", 
              "content": prompt
@@ -91,44 +103,89 @@ def rerank_results(results, question, max_length=4000):
     return selected_docs
 
 
-def init_rag(mode="local"):
-    print("Initiating RAG with flash reranking...")
-    client, embedding_fn = get_chroma_client(mode)
-    collections = client.list_collections()
-    if not collections:
-        raise ValueError("No collections found in the database.")
-    
-    # Get collection WITH embedding function
-    collection = client.get_collection(
-        name=collections[0].name,
-        embedding_function=embedding_fn
-    )
-
-    print(os.getcwd())
-
-    ranker = Ranker(model_name="ms-marco-MiniLM-L-12-v2", cache_dir=os.path.join(os.getcwd(), "models"))
+# mode -> (collection, ranker), shared by every session in the process
+_rag_resources = {}
+# mode -> (client, embedding function), and (collection name, mode) -> collection for session uploads
+_chroma_clients = {}
+_upload_collections = {}
+_rag_lock = threading.Lock()
+_ranker = None
+# Separate from _rag_lock, which init_rag already holds when it asks for the ranker
+_ranker_lock = threading.Lock()
 
-    return collection, ranker
+def _shared_chroma_client(mode):
+    """get_chroma_client, once per mode. Caller holds _rag_lock."""
+    if mode not in _chroma_clients:
+        _chroma_clients[mode] = get_chroma_client(mode)
+    return _chroma_clients[mode]
 
-def rag_call_alt(question, collection, ranker, agent_prompt=None, n_results=10, max_context_length=4000):
+def init_rag(mode="local"):
+    """Return the (collection, ranker) pair for a mode, opening the database and loading the ranker on first use."""
+    with _rag_lock:
+        if mode not in _rag_resources:
+            print("Initiating RAG with flash reranking...")
+            client, embedding_fn = _shared_chroma_client(mode)
+            collections = [c for c in client.list_collections() if not c.name.startswith(UPLOAD_COLLECTION_PREFIX)]
+            if not collections:
+                raise ValueError("No collections found in the database.")
+
+            # Get collection WITH embedding function
+            collection = client.get_collection(
+                name=collections[0].name,
+                embedding_function=embedding_fn
+            )
+            _rag_resources[mode] = (collection, get_ranker())
+        return _rag_resources[mode]
+
+def get_upload_collection(name, mode="local", create=True):
+    """A session's collection of uploaded documents, created on first use unless create is False (then missing raises)."""
+    with _rag_lock:
+        if (name, mode) not in _upload_collections:
+            client, embedding_fn = _shared_chroma_client(mode)
+            if create:
+                collection = client.get_or_create_collection(name=name, embedding_function=embedding_fn)
+            else:
+                collection = client.get_collection(name=name, embedding_function=embedding_fn)
+            _upload_collections[(name, mode)] = collection
+        return _upload_collections[(name, mode)]
+
+def get_ranker():
+    """The flashrank reranker, loaded once per process. It is the same for every mode."""
+    global _ranker
+    if _ranker is None:
+        with _ranker_lock:
+            if _ranker is None:
+                from flashrank import Ranker
+                _ranker = Ranker(model_name="ms-marco-MiniLM-L-12-v2", cache_dir=os.path.join(os.getcwd(), "models"))
+    return _ranker
+
+def rag_call_alt(question, collection, ranker, agent_prompt=None, n_results=10, max_context_length=4000, extra_collections=()):
+    """Reranked context for a question from a collection, plus any extra_collections (e.g. the session's uploads)."""
 
     # keywords = kw_model.extract_keywords(question, keyphrase_ngram_range=(1, 2), stop_words='english')
     # query_text = [keyword for keyword, _ in keywords] + question
 
-    results = collection.query(
-        query_texts=[question],
-        # query_texts = query_text,
-        n_results=n_results * 2,
-        include=['documents', 'metadatas']
-    )
-
     # passagedocs = [{'id': i, 'text': doc} for i, doc in enumerate(results['documents'][0])]
-    passagedocs = [{
-        'id': i,
-        'text': doc,
-        'metadata': meta
-    } for i, (doc, meta) in enumerate(zip(results['documents'][0], results['metadatas'][0]))]
+    passagedocs = []
+    for source_collection in [c for c in (collection, *extra_collections) if c is not None]:
+        available = source_collection.count()
+        if not available:
+            continue
+        results = source_collection.query(
+            query_texts=[question],
+            # query_texts = query_text,
+            n_results=min(n_results * 2, available),
+            include=['documents', 'metadatas']
+        )
+        # The generator runs while extend appends, so the id offset is read beforehand
+        offset = len(passagedocs)
+        passagedocs.extend({
+            'id': offset + i,
+            'text': doc,
+            'metadata': meta
+        } for i, (doc, meta) in enumerate(zip(results['documents'][0], results['metadatas'][0])))
     
+    from flashrank import RerankRequest
     rerankrequest = RerankRequest(query=question, passages=passagedocs)
     selected_docs = ranker.rerank(rerankrequest)
 
@@ -175,8 +232,24 @@ def get_rag_context_from_query(query) -> str:
     Returns a string containing the relevant context.
     """
 
-    # Initialize RAG collection and ranker
-    collection, ranker = init_rag(mode=get_mode())
-    # Use rag_call_alt to get the reranked context (second return value is the context string)
-    rag_context_string = rag_call_alt(query, collection, ranker)
+    from upload_ingestion import session_upload_collection
+
+    with start_span("get_rag_context_from_query", caller=get_caller()) as span:
+        mode = config.get_mode()
+        # The session's uploaded documents are searched next to the shared collection
+        upload_collection = session_upload_collection(mode)
+        # Initialize RAG collection and ranker
+        with start_span("init_rag"):
+            try:
+                collection, ranker = init_rag(mode=mode)
+            except ValueError:
+                # No shared collection yet; the uploads can still answer
+                if upload_collection is None:
+                    raise
+                collection, ranker = None, get_ranker()
+        # Use rag_call_alt to get the reranked context (second return value is the context string)
+        with start_span("rag_call_alt"):
+            rag_context_string = rag_call_alt(query, collection, ranker, extra_collections=[upload_collection] if upload_collection is not None else [])
+        span.set(uploads=upload_collection is not None)
+        span.set(context_chars=len(rag_context_string))
     return rag_context_string
\ No newline at end of file
@@ -0,0 +1,100 @@
+"""
+Stable-prefix system prompt assembly.
+
+Providers cache the key/value state of a prompt prefix they have seen recently, but only
+when the prefix is byte-for-byte identical. PromptBuilder orders segments from most static
+(instructions, templates, reference lists) to most volatile (session state), so every call
+of the same kind shares the longest possible prefix. The static prefix is fingerprinted to
+report how often it is reused.
+"""
+
+import hashlib
+import threading
+
+# Segment stability levels, from most to least stable
+STATIC = 0  # Instructions, templates and reference lists that never change
+SESSION = 1  # Session state that changes occasionally (scope of work, assumptions)
+VOLATILE = 2  # Data that changes on every call
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class PromptBuilder:
+    """
+    Collects system prompt segments and joins them in stability order.
+    Segments with the same stability keep the order they were added in.
+    """
+
+    def __init__(self, name: str, separator: str = "\n"):
+        self.name = name
+        self.separator = separator
+        self.segments = []
+
+    def add(self, text: str, stability: int = STATIC):
+        self.segments.append((stability, len(self.segments), str(text)))
+        return self
+
+    def static(self, *lines: str):
+        """Add lines that are identical on every call."""
+        for line in lines:
+            self.add(line, STATIC)
+        return self
+
+    def session(self, *lines: str):
+        """Add lines derived from session state."""
+        for line in lines:
+            self.add(line, SESSION)
+        return self
+
+    def volatile(self, *lines: str):
+        """Add lines that change on every call."""
+        for line in lines:
+            self.add(line, VOLATILE)
+        return self
+
+    def build(self) -> str:
+        """Join the segments most-static first and record prefix reuse statistics."""
+        ordered = sorted(self.segments)
+        static_prefix = self.separator.join(text for stability, _, text in ordered if stability == STATIC)
+        record_prefix(self.name, static_prefix)
+        return self.separator.join(text for _, _, text in ordered)
+
+
+def fingerprint(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def record_prefix(name: str, static_prefix: str):
+    """Count whether this prompt kind reused the same static prefix as its previous call."""
+    prefix_fingerprint = fingerprint(static_prefix)
+    with _stats_lock:
+        stats = _stats.setdefault(name, {
+            "calls": 0,
+            "prefix_reuses": 0,
+            "prefix_chars": 0,
+            "fingerprint": None,
+            "distinct_prefixes": set(),
+        })
+        stats["calls"] += 1
+        if stats["fingerprint"] == prefix_fingerprint:
+            stats["prefix_reuses"] += 1
+        stats["fingerprint"] = prefix_fingerprint
+        stats["prefix_chars"] = len(static_prefix)
+        stats["distinct_prefixes"].add(prefix_fingerprint)
+
+
+def prefix_cache_stats() -> dict:
+    """Return per-prompt-kind call counts, prefix reuse rate and static prefix size."""
+    with _stats_lock:
+        return {
+            name: {
+                "calls": stats["calls"],
+                "prefix_reuses": stats["prefix_reuses"],
+                "prefix_reuse_rate": stats["prefix_reuses"] / stats["calls"] if stats["calls"] else 0.0,
+                "prefix_chars": stats["prefix_chars"],
+                "fingerprint": stats["fingerprint"],
+                "distinct_prefixes": len(stats["distinct_prefixes"]),
+            }
+            for name, stats in _stats.items()
+        }
@@ -0,0 +1,187 @@
+"""
+Background reconciliation between the scope of work and the assumptions and exclusions.
+
+When one document is edited, the other may need a matching edit. Instead of blocking the
+user's turn on a second LLM call over both full dictionaries, the change handlers start a
+reconciliation job here. The job only sees the disciplines whose content actually changed,
+runs on a worker thread, and returns edit operations. The script thread applies finished
+jobs to whatever the session state holds at that point (see apply_finished_reconciliations).
+"""
+
+import contextvars
+import copy
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from scope_patch import SCOPE_OPERATIONS, ASSUMPTIONS_OPERATIONS, describe_operations, parse_operations, apply_scope_patch, apply_assumptions_patch
+from prompt_builder import PromptBuilder
+from tracing import start_span
+from message_store import add_message
+
+MAX_RECONCILIATION_WORKERS = 4
+RECONCILE_MAX_TOKENS = 1500
+RECONCILE_POLL_SECONDS = 1.0
+
+SCOPE = "scope_of_work"
+ASSUMPTIONS = "ASSUMPTIONS_AND_EXCLUSIONS"
+
+DOCUMENT_LABELS = {
+    SCOPE: "scope of work",
+    ASSUMPTIONS: "assumptions and exclusions",
+}
+
+_reconcile_executor = ThreadPoolExecutor(max_workers=MAX_RECONCILIATION_WORKERS, thread_name_prefix="reconcile")
+
+
+def scope_items_by_discipline(scope_of_work: dict) -> dict:
+    """Flatten {phase: {discipline: [items]}} into {discipline: [(phase, item), ...]}."""
+    by_discipline = {}
+    for phase, disciplines in (scope_of_work or {}).items():
+        if not isinstance(disciplines, dict):
+            continue
+        for discipline, items in disciplines.items():
+            by_discipline.setdefault(discipline, []).extend((phase, item) for item in items)
+    return by_discipline
+
+
+def changed_scope_disciplines(old_scope: dict, new_scope: dict) -> set:
+    """Disciplines whose scope items differ between two versions of the scope of work."""
+    old = scope_items_by_discipline(old_scope)
+    new = scope_items_by_discipline(new_scope)
+    return {discipline for discipline in set(old) | set(new) if old.get(discipline) != new.get(discipline)}
+
+
+def changed_assumption_disciplines(old_assumptions: dict, new_assumptions: dict) -> set:
+    """Disciplines whose assumptions and exclusions differ between two versions."""
+    old = old_assumptions or {}
+    new = new_assumptions or {}
+    return {discipline for discipline in set(old) | set(new) if old.get(discipline) != new.get(discipline)}
+
+
+def _scope_slice(scope_of_work: dict, disciplines: set) -> dict:
+    """The part of the scope of work that belongs to the given disciplines."""
+    return {
+        phase: {discipline: items for discipline, items in phase_disciplines.items() if discipline in disciplines}
+        for phase, phase_disciplines in (scope_of_work or {}).items()
+        if isinstance(phase_disciplines, dict) and any(discipline in disciplines for discipline in phase_disciplines)
+    }
+
+
+def _assumptions_slice(assumptions: dict, disciplines: set) -> dict:
+    return {discipline: items for discipline, items in (assumptions or {}).items() if discipline in disciplines}
+
+
+def _reconcile(target: str, disciplines: set, scope_of_work: dict, assumptions: dict) -> list:
+    """Worker: ask the LLM for the operations that bring the target in line for the changed disciplines."""
+    from llm_query import run_llm_query
+
+    if target == ASSUMPTIONS:
+        builder = PromptBuilder("reconcile_assumptions").static(
+            "You keep the assumptions and exclusions of an Architect Owner Agreement consistent with its scope of work.",
+            "The scope of work changed for the disciplines given at the end of this prompt. Decide which assumptions and exclusions must be added, removed or reworded so they do not conflict with the scope and protect the designer from liability.",
+            "Available operations:",
+            describe_operations(ASSUMPTIONS_OPERATIONS),
+        )
+    else:
+        builder = PromptBuilder("reconcile_scope").static(
+            "You keep the scope of work of an Architect Owner Agreement consistent with its assumptions and exclusions.",
+            "The assumptions and exclusions changed for the disciplines given at the end of this prompt. Decide which scope items must be added, removed or reworded so the scope does not contradict them.",
+            "Available operations:",
+            describe_operations(SCOPE_OPERATIONS),
+        )
+    system_prompt = builder.static(
+        "The scope is structured as {phase: {discipline: [items]}} and the assumptions as {discipline: [items]}.",
+        "Respond only with a JSON list of edit operations, or [] if nothing needs to change.",
+        "Use names exactly as they appear below when referring to existing phases, disciplines and items.",
+        "Do not include any explanations or additional text.",
+    ).session(
+        f"Changed disciplines: {sorted(disciplines)}",
+        f"Scope of work for these disciplines:\n{_scope_slice(scope_of_work, disciplines)}",
+        f"Assumptions and exclusions for these disciplines:\n{_assumptions_slice(assumptions, disciplines)}",
+    ).build()
+    with start_span("reconcile", target=target, disciplines=len(disciplines)):
+        response = run_llm_query(
+            system_prompt=system_prompt,
+            user_input=f"Reconcile the {DOCUMENT_LABELS[target]}.",
+            max_tokens=RECONCILE_MAX_TOKENS,
+            conversation_history=[],
+        )
+    return parse_operations(response)
+
+
+class ReconciliationJob:
+    """A reconciliation running in the background for one session."""
+
+    def __init__(self, target: str, disciplines: set, future):
+        self.target = target
+        self.disciplines = disciplines
+        self.future = future
+        self.started_at = time.time()
+
+    @property
+    def label(self) -> str:
+        return DOCUMENT_LABELS[self.target]
+
+    def done(self) -> bool:
+        return self.future.done()
+
+
+def start_reconciliation(target: str, disciplines: set, scope_of_work: dict, assumptions: dict):
+    """
+    Queue a background reconciliation of target for the changed disciplines.
+    Returns the job, or None if nothing changed.
+    """
+    if not disciplines:
+        return None
+    # Snapshot the documents, since the script thread may edit them while the job runs,
+    # and copy the context so the job uses the session's backend
+    future = _reconcile_executor.submit(contextvars.copy_context().run, _reconcile, target, set(disciplines), copy.deepcopy(scope_of_work), copy.deepcopy(assumptions))
+    return ReconciliationJob(target, set(disciplines), future)
+
+
+def queue_reconciliation(target: str, disciplines: set):
+    """Start a reconciliation from the current session state and track it in the session."""
+    import streamlit as st
+    job = start_reconciliation(target, disciplines, st.session_state.get(SCOPE), st.session_state.get(ASSUMPTIONS))
+    if job is not None:
+        st.session_state.setdefault("reconciliation_jobs", []).append(job)
+    return job
+
+
+def pending_reconciliations() -> list:
+    """Jobs of the current session that are still running."""
+    import streamlit as st
+    return [job for job in st.session_state.get("reconciliation_jobs", []) if not job.done()]
+
+
+def apply_finished_reconciliations() -> bool:
+    """
+    Apply the operations of every finished job to the current session state. Must run on the script thread.
+    Returns True if any job finished, so the caller knows the documents or the transcript may need redrawing.
+    """
+    import streamlit as st
+    jobs = st.session_state.get("reconciliation_jobs", [])
+    finished = [job for job in jobs if job.done()]
+    if not finished:
+        return False
+    # Keep exactly the jobs not in finished, so one that finishes in between is applied on the next poll, not lost
+    st.session_state["reconciliation_jobs"] = [job for job in jobs if job not in finished]
+
+    for job in finished:
+        try:
+            operations = job.future.result()
+        except Exception as e:
+            logging.warning("[function=apply_finished_reconciliations] [description=Reconciliation of %s failed: %s]", job.label, e)
+            add_message("assistant", f"I could not reconcile the {job.label} with your last change.")
+            continue
+        if job.target == ASSUMPTIONS:
+            updated, applied, errors = apply_assumptions_patch(st.session_state.get(ASSUMPTIONS), operations)
+        else:
+            updated, applied, errors = apply_scope_patch(st.session_state.get(SCOPE), operations)
+        if applied:
+            st.session_state[job.target] = updated
+            add_message("assistant", f"Reconciled the {job.label} with your last change ({len(applied)} change{'s' if len(applied) != 1 else ''} applied).")
+        if errors:
+            logging.info("[function=apply_finished_reconciliations] [description=Skipped %d reconciliation operations for %s: %s]", len(errors), job.label, errors)
+    return True
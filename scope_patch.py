@@ -0,0 +1,232 @@
+"""
+Patch operations for the scope of work and the assumptions and exclusions.
+
+Instead of asking the LLM to re-emit a whole dictionary for every change, the change handlers
+ask for a short list of edit operations and apply them here. Operations are validated one by
+one: a bad operation is reported and skipped without discarding the rest.
+
+Scope of work: {phase: {discipline: [items]}}
+Assumptions and exclusions: {discipline: [items]}
+"""
+
+import copy
+import json
+
+from structured_output import parse_structured
+
+SCOPE_OPERATIONS = {
+    "add_phase": ["phase"],
+    "remove_phase": ["phase"],
+    "rename_phase": ["phase", "new_name"],
+    "add_discipline": ["phase", "discipline"],
+    "remove_discipline": ["phase", "discipline"],
+    "rename_discipline": ["phase", "discipline", "new_name"],
+    "add_item": ["phase", "discipline", "item"],
+    "remove_item": ["phase", "discipline", "item"],
+    "rename_item": ["phase", "discipline", "item", "new_item"],
+    "move_item": ["phase", "discipline", "item", "to_phase", "to_discipline"],
+}
+
+ASSUMPTIONS_OPERATIONS = {
+    "add_discipline": ["discipline"],
+    "remove_discipline": ["discipline"],
+    "rename_discipline": ["discipline", "new_name"],
+    "add_item": ["discipline", "item"],
+    "remove_item": ["discipline", "item"],
+    "rename_item": ["discipline", "item", "new_item"],
+    "move_item": ["discipline", "item", "to_discipline"],
+}
+
+
+class PatchError(ValueError):
+    """Raised for a single operation that cannot be applied."""
+
+
+def describe_operations(operations: dict) -> str:
+    """Render the operation catalogue for a system prompt."""
+    lines = []
+    for op, fields in operations.items():
+        example = {"op": op, **{field: f"<{field}>" for field in fields}}
+        lines.append(json.dumps(example))
+    return "\n".join(lines)
+
+
+def _normalize(text) -> str:
+    return " ".join(str(text).split()).casefold()
+
+
+def _find_key(mapping: dict, name, label: str):
+    """Return the existing key matching name exactly, or ignoring case and whitespace."""
+    if name in mapping:
+        return name
+    wanted = _normalize(name)
+    for key in mapping:
+        if _normalize(key) == wanted:
+            return key
+    raise PatchError(f"{label} {name!r} does not exist")
+
+
+def _has_key(mapping: dict, name) -> bool:
+    try:
+        _find_key(mapping, name, "key")
+        return True
+    except PatchError:
+        return False
+
+
+def _get_or_create(mapping: dict, name, default):
+    """Return the existing key matching name, creating it with default if missing."""
+    try:
+        return _find_key(mapping, name, "key")
+    except PatchError:
+        mapping[name.strip()] = default
+        return name.strip()
+
+
+def _find_item(items: list, item) -> int:
+    """Return the index of item in items, matching exactly or ignoring case and whitespace."""
+    if item in items:
+        return items.index(item)
+    wanted = _normalize(item)
+    for index, existing in enumerate(items):
+        if _normalize(existing) == wanted:
+            return index
+    raise PatchError(f"item {item!r} does not exist")
+
+
+def _rename_key(mapping: dict, old_key, new_key, label: str) -> dict:
+    """Return a copy of mapping with old_key renamed, keeping key order. Refuses to overwrite another key."""
+    if any(key != old_key and _normalize(key) == _normalize(new_key) for key in mapping):
+        raise PatchError(f"{label} {new_key!r} already exists")
+    return {new_key if key == old_key else key: value for key, value in mapping.items()}
+
+
+def _check_fields(operation, operations: dict):
+    if not isinstance(operation, dict):
+        raise PatchError(f"operation must be an object, got {operation!r}")
+    op = operation.get("op")
+    if op not in operations:
+        raise PatchError(f"unknown operation {op!r}")
+    for field in operations[op]:
+        value = operation.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise PatchError(f"{op} requires a non-empty string {field!r}")
+    return op
+
+
+def _apply_item_op(op, operation, items_by_discipline: dict, get_target_items):
+    """Item operations shared by both document types. items_by_discipline maps discipline -> items."""
+    if op == "add_item":
+        items = items_by_discipline[_get_or_create(items_by_discipline, operation["discipline"], [])]
+        if any(_normalize(existing) == _normalize(operation["item"]) for existing in items):
+            raise PatchError(f"item {operation['item']!r} already exists")
+        items.append(operation["item"].strip())
+        return
+
+    discipline = _find_key(items_by_discipline, operation["discipline"], "discipline")
+    items = items_by_discipline[discipline]
+    index = _find_item(items, operation["item"])
+    if op == "remove_item":
+        items.pop(index)
+    elif op == "rename_item":
+        new_item = operation["new_item"].strip()
+        if any(i != index and _normalize(existing) == _normalize(new_item) for i, existing in enumerate(items)):
+            raise PatchError(f"item {new_item!r} already exists")
+        items[index] = new_item
+    elif op == "move_item":
+        target_items = get_target_items(operation)
+        item = items.pop(index)
+        if item not in target_items:
+            target_items.append(item)
+
+
+def apply_scope_patch(scope_of_work: dict, operations: list):
+    """
+    Apply edit operations to a scope of work dictionary.
+    Returns (updated_scope, applied_operations, errors). The input dictionary is not modified.
+    """
+    scope = copy.deepcopy(scope_of_work) if isinstance(scope_of_work, dict) else {}
+    applied = []
+    errors = []
+
+    for operation in operations:
+        try:
+            op = _check_fields(operation, SCOPE_OPERATIONS)
+            if op == "add_phase":
+                if _has_key(scope, operation["phase"]):
+                    raise PatchError(f"phase {operation['phase']!r} already exists")
+                scope[operation["phase"].strip()] = {}
+            elif op == "remove_phase":
+                del scope[_find_key(scope, operation["phase"], "phase")]
+            elif op == "rename_phase":
+                phase = _find_key(scope, operation["phase"], "phase")
+                scope = _rename_key(scope, phase, operation["new_name"].strip(), "phase")
+            elif op == "add_discipline":
+                phase = _get_or_create(scope, operation["phase"], {})
+                if _has_key(scope[phase], operation["discipline"]):
+                    raise PatchError(f"discipline {operation['discipline']!r} already exists in {phase!r}")
+                scope[phase][operation["discipline"].strip()] = []
+            elif op in ("remove_discipline", "rename_discipline"):
+                phase = _find_key(scope, operation["phase"], "phase")
+                discipline = _find_key(scope[phase], operation["discipline"], "discipline")
+                if op == "remove_discipline":
+                    del scope[phase][discipline]
+                else:
+                    scope[phase] = _rename_key(scope[phase], discipline, operation["new_name"].strip(), "discipline")
+            else:
+                if op == "add_item":
+                    phase = _get_or_create(scope, operation["phase"], {})
+                else:
+                    phase = _find_key(scope, operation["phase"], "phase")
+
+                def get_target_items(operation):
+                    to_phase = _get_or_create(scope, operation["to_phase"], {})
+                    return scope[to_phase][_get_or_create(scope[to_phase], operation["to_discipline"], [])]
+
+                _apply_item_op(op, operation, scope[phase], get_target_items)
+            applied.append(operation)
+        except PatchError as e:
+            errors.append(str(e))
+
+    return scope, applied, errors
+
+
+def apply_assumptions_patch(assumptions_and_exclusions: dict, operations: list):
+    """
+    Apply edit operations to an assumptions and exclusions dictionary.
+    Returns (updated_assumptions, applied_operations, errors). The input dictionary is not modified.
+    """
+    assumptions = copy.deepcopy(assumptions_and_exclusions) if isinstance(assumptions_and_exclusions, dict) else {}
+    applied = []
+    errors = []
+
+    def get_target_items(operation):
+        return assumptions[_get_or_create(assumptions, operation["to_discipline"], [])]
+
+    for operation in operations:
+        try:
+            op = _check_fields(operation, ASSUMPTIONS_OPERATIONS)
+            if op == "add_discipline":
+                if _has_key(assumptions, operation["discipline"]):
+                    raise PatchError(f"discipline {operation['discipline']!r} already exists")
+                assumptions[operation["discipline"].strip()] = []
+            elif op == "remove_discipline":
+                del assumptions[_find_key(assumptions, operation["discipline"], "discipline")]
+            elif op == "rename_discipline":
+                discipline = _find_key(assumptions, operation["discipline"], "discipline")
+                assumptions = _rename_key(assumptions, discipline, operation["new_name"].strip(), "discipline")
+            else:
+                _apply_item_op(op, operation, assumptions, get_target_items)
+            applied.append(operation)
+        except PatchError as e:
+            errors.append(str(e))
+
+    return assumptions, applied, errors
+
+
+def parse_operations(response: str) -> list:
+    """
+    Extract the list of operations from an LLM response, salvaging fenced, wrapped or truncated output.
+    Raises ValueError if there is no usable list.
+    """
+    return parse_structured(response, "operations")
@@ -0,0 +1,116 @@
+"""
+Process-wide loading of the seed datasets: the default scope of work, categories list and
+assumptions and exclusions.
+
+Each file is parsed once per process and shared by every session as an immutable value
+(tuples and read-only mappings). A file is parsed again only when its modification time
+changes, and the modification time is checked at most every CHECK_INTERVAL_SECONDS, so a
+rerun normally costs a dictionary lookup. Session documents that are edited in place are
+seeded with thaw(), which returns a plain mutable copy.
+"""
+
+import ast
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+
+SEED_DIR = os.path.dirname(os.path.abspath(__file__))
+SCOPE_OF_WORK_FILE = "default_scope_of_work.txt"
+CATEGORIES_LIST_FILE = "default_categories_list.txt"
+ASSUMPTIONS_AND_EXCLUSIONS_FILE = "default_assumptions_and_exclusions.txt"
+
+# How often a cached file's modification time is checked again
+CHECK_INTERVAL_SECONDS = 2.0
+
+
+def freeze(value):
+    """Immutable copy of a JSON-like value: dicts become read-only mappings, lists become tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Mutable copy of a frozen value: read-only mappings become dicts, tuples become lists."""
+    if isinstance(value, (dict, MappingProxyType)):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
+
+
+class _Entry:
+    __slots__ = ("mtime", "value", "checked_at")
+
+    def __init__(self, mtime, value, checked_at):
+        self.mtime = mtime
+        self.value = value
+        self.checked_at = checked_at
+
+
+class SeedLoader:
+    """Parse-once cache of Python literal files, invalidated when a file's modification time changes."""
+
+    def __init__(self, base_dir: str = SEED_DIR, check_interval: float = CHECK_INTERVAL_SECONDS):
+        self.base_dir = base_dir
+        self.check_interval = check_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+
+    def _path(self, filename: str) -> str:
+        return filename if os.path.isabs(filename) else os.path.join(self.base_dir, filename)
+
+    def load(self, filename: str):
+        """The frozen contents of a seed file, parsed on first use and again after it changes."""
+        path = self._path(filename)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and now - entry.checked_at < self.check_interval:
+                self.hits += 1
+                return entry.value
+
+            mtime = os.stat(path).st_mtime_ns
+            if entry is not None and entry.mtime == mtime:
+                entry.checked_at = now
+                self.hits += 1
+                return entry.value
+
+            with open(path, "r") as f:
+                value = freeze(ast.literal_eval(f.read()))
+            self._entries[path] = _Entry(mtime, value, now)
+            self.loads += 1
+            logging.info("[function=SeedLoader.load] [description=Parsed %s]", filename)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"files": len(self._entries), "hits": self.hits, "loads": self.loads}
+
+
+seed_loader = SeedLoader()
+
+
+def default_scope_of_work():
+    """Shared, read-only default scope of work."""
+    return seed_loader.load(SCOPE_OF_WORK_FILE)
+
+
+def default_categories_list() -> tuple:
+    """Shared tuple of every BIM model category."""
+    return seed_loader.load(CATEGORIES_LIST_FILE)
+
+
+def default_assumptions_and_exclusions():
+    """Shared, read-only default assumptions and exclusions."""
+    return seed_loader.load(ASSUMPTIONS_AND_EXCLUSIONS_FILE)
@@ -1,3 +1,3 @@
-__all__ = ["config"]
+__all__ = ["config", "mock_llm"]
 
-from . import config
\ No newline at end of file
+# Submodules are imported on use, so server.mock_llm runs without API secrets or the openai package
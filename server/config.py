@@ -1,34 +1,72 @@
 import random
-from openai import OpenAI
+import contextvars
+import threading
+from functools import lru_cache
+from typing import NamedTuple
 # from server.keys import *
 import os
-import streamlit as st
+
+# Importing this module is cheap: secrets are read, and openai, httpx and streamlit imported,
+# only when a backend is first used.
 
 # OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-CLOUDFLARE_ACCOUNT_ID = st.secrets["CLOUDFLARE_ACCOUNT_ID"]
-CLOUDFLARE_API_KEY = st.secrets["CLOUDFLARE_API_KEY"]
 
-# Mode control using getter/setter
-_mode = "cloudflare"  # default
 
-def get_mode():
-    global _mode
-    return _mode
+@lru_cache(maxsize=1)
+def cloudflare_credentials():
+    """(account id, api key) from the Streamlit secrets, read on first use."""
+    import streamlit as st
+    return st.secrets["CLOUDFLARE_ACCOUNT_ID"], st.secrets["CLOUDFLARE_API_KEY"]
 
-def set_mode(new_mode, cf_gen_model=None, cf_sml_model=None, cf_emb_model=None):
-    global _mode, client, completion_model, completion_model_sml, embedding_model
-    _mode = new_mode
-    client, completion_model, completion_model_sml, embedding_model = api_mode(_mode, cf_gen_model, cf_sml_model, cf_emb_model)
+# Offline stand-in server for development and benchmarks (see server/mock_llm.py)
+MOCK_LLM_URL = os.getenv("MOCK_LLM_URL", "http://127.0.0.1:8089/v1")
+
+DEFAULT_MODE = "cloudflare"
+
+# HTTP connection pool shared by every session using a backend
+HTTP_MAX_CONNECTIONS = 32
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 16
+HTTP_KEEPALIVE_EXPIRY = 30.0  # Seconds an idle keep-alive connection is kept open
+
+# API backends: base URL, key and timeouts (seconds). Local models are slow to generate, so they get a long read timeout.
+BACKENDS = {
+    "local": {
+        "base_url": "http://localhost:1234/v1",
+        "api_key": "lm-studio",
+        "connect_timeout": 2.0,
+        "read_timeout": 300.0,
+    },
+    "cloudflare": {
+        # base_url and api_key are filled in from the secrets by backend_settings
+        "connect_timeout": 5.0,
+        "read_timeout": 60.0,
+    },
+    "mock": {
+        "base_url": MOCK_LLM_URL,
+        "api_key": "mock",
+        "connect_timeout": 1.0,
+        "read_timeout": 30.0,
+    },
+}
+
+
+def backend_settings(mode):
+    """Base URL, API key and timeouts for a backend."""
+    if mode not in BACKENDS:
+        raise ValueError("Please specify if you want to run local or openai models")
+    settings = dict(BACKENDS[mode])
+    if mode == "cloudflare":
+        account_id, api_key = cloudflare_credentials()
+        settings["base_url"] = f"https://api.cloudflare.com/client/v4/accounts/{account_id}/ai/v1"
+        settings["api_key"] = api_key
+    return settings
 
-# API
-local_client = OpenAI(base_url="http://localhost:1234/v1", api_key="lm-studio")
-# openai_client = OpenAI(api_key=OPENAI_API_KEY)
-cloudflare_client = OpenAI(base_url = f"https://api.cloudflare.com/client/v4/accounts/{CLOUDFLARE_ACCOUNT_ID}/ai/v1", api_key = CLOUDFLARE_API_KEY)
 
 # Embedding Models
 local_embedding_model = "nomic-ai/nomic-embed-text-v1.5-GGUF"
 cloudflare_embedding_model = "@cf/baai/bge-base-en-v1.5"
 openai_embedding_model = "text-embedding-3-small"
+mock_embedding_model = "mock-embed"
 
 # Notice how this model is not running locally. It uses an OpenAI key.
 # gpt4o = [
@@ -67,22 +105,102 @@ cloudflare_model = "@cf/meta/llama-3.1-70b-instruct"
 # cloudflare_model = "@cf/meta/llama-4-scout-17b-16e-instruct"
 # cloudflare_model = "@cf/qwen/qwen3-30b-a3b-fp8"
 
+# Shared clients per backend, built on first use
+_clients = {}
+_async_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _http_settings(mode):
+    import httpx
+    backend = backend_settings(mode)
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(backend["read_timeout"], connect=backend["connect_timeout"])
+    return limits, timeout
+
+
+def get_client(mode):
+    """Shared OpenAI client for a backend, on its own pooled keep-alive HTTP client."""
+    with _clients_lock:
+        if mode not in _clients:
+            import httpx
+            from openai import OpenAI
+            settings = backend_settings(mode)
+            limits, timeout = _http_settings(mode)
+            _clients[mode] = OpenAI(
+                base_url=settings["base_url"],
+                api_key=settings["api_key"],
+                timeout=timeout,
+                http_client=httpx.Client(limits=limits, timeout=timeout),
+            )
+        return _clients[mode]
+
+
+def get_async_client(mode):
+    """Shared AsyncOpenAI client for a backend, used by the asyncio LLM path (see llm_async.py)."""
+    with _clients_lock:
+        if mode not in _async_clients:
+            import httpx
+            from openai import AsyncOpenAI
+            settings = backend_settings(mode)
+            limits, timeout = _http_settings(mode)
+            _async_clients[mode] = AsyncOpenAI(
+                base_url=settings["base_url"],
+                api_key=settings["api_key"],
+                timeout=timeout,
+                http_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+            )
+        return _async_clients[mode]
+
+
+class RuntimeConfig(NamedTuple):
+    """
+    Immutable backend and model selection for one session or request.
+    Clients are not stored here; they are shared per backend and looked up by mode.
+    """
+    mode: str
+    completion_model: str
+    completion_model_sml: str
+    embedding_model: str
+
+    @property
+    def client(self):
+        return get_client(self.mode)
+
+    @property
+    def async_client(self):
+        return get_async_client(self.mode)
+
+    @property
+    def base_url(self):
+        return backend_settings(self.mode)["base_url"]
+
+    @property
+    def api_key(self):
+        return backend_settings(self.mode)["api_key"]
+
+
 # Define what models to use according to chosen "mode"
 def api_mode (mode, cf_gen_model=None, cf_sml_model=None, cf_emb_model=None):
     if mode == "local":
-        client = local_client
         completion_model = llama3[0]['model']
         completion_model_sml = 'mradermacher/Apriel-5B-Instruct-llamafied.i1'
         embedding_model = local_embedding_model
-        return client, completion_model, completion_model_sml, embedding_model
-    
+        return RuntimeConfig(mode, completion_model, completion_model_sml, embedding_model)
+
     if mode == "cloudflare":
-        client = cloudflare_client
         completion_model = cf_gen_model if cf_gen_model else cloudflare_model
         completion_model_sml = cf_sml_model if cf_sml_model else cloudflare_model
         embedding_model = cf_emb_model if cf_emb_model else cloudflare_embedding_model
-        return client, completion_model, completion_model_sml, embedding_model
-    
+        return RuntimeConfig(mode, completion_model, completion_model_sml, embedding_model)
+
+    if mode == "mock":
+        return RuntimeConfig(mode, "mock-large", "mock-small", mock_embedding_model)
+
     # elif mode == "openai":
     #     client = openai_client
     #     completion_model = gpt4o[0]['model']
@@ -93,4 +211,70 @@ def api_mode (mode, cf_gen_model=None, cf_sml_model=None, cf_emb_model=None):
     else:
         raise ValueError("Please specify if you want to run local or openai models")
 
-client, completion_model, completion_model_sml, embedding_model = api_mode(_mode)
\ No newline at end of file
+
+# Configuration resolution: the request's context, else the process default.
+# Streamlit sessions keep theirs in session state and activate it at the start of every run.
+SESSION_KEY = "runtime_config"
+_default_config = api_mode(DEFAULT_MODE)
+_current_config = contextvars.ContextVar("runtime_config", default=None)
+
+
+def _session_state():
+    """The Streamlit session state if called from a script run, otherwise None."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None
+    if get_script_run_ctx() is None:
+        return None
+    import streamlit as st
+    return st.session_state
+
+
+def get_runtime_config():
+    """Configuration for the current request: the activated session's, else the process default."""
+    return _current_config.get() or _default_config
+
+
+def use_runtime_config(runtime_config):
+    """
+    Make runtime_config current for this context. Worker threads started with
+    contextvars.copy_context and tasks on the LLM event loop inherit it.
+    Returns a token for _current_config.reset.
+    """
+    return _current_config.set(runtime_config)
+
+
+def activate_session_config():
+    """Make the current Streamlit session's configuration current for this script run."""
+    session_state = _session_state()
+    runtime_config = session_state.setdefault(SESSION_KEY, _default_config) if session_state is not None else _default_config
+    use_runtime_config(runtime_config)
+    return runtime_config
+
+
+def get_mode():
+    return get_runtime_config().mode
+
+
+def set_mode(new_mode, cf_gen_model=None, cf_sml_model=None, cf_emb_model=None):
+    """
+    Switch backend and models for the current session, or for the whole process when called
+    outside a Streamlit session. Other sessions are not affected.
+    """
+    global _default_config
+    runtime_config = api_mode(new_mode, cf_gen_model, cf_sml_model, cf_emb_model)
+    session_state = _session_state()
+    if session_state is not None:
+        session_state[SESSION_KEY] = runtime_config
+    else:
+        _default_config = runtime_config
+    use_runtime_config(runtime_config)
+    return runtime_config
+
+
+def __getattr__(name):
+    # Backwards compatible module attributes (config.client, config.completion_model, ...) resolve per request
+    if name in ("client", "async_client", "completion_model", "completion_model_sml", "embedding_model"):
+        return getattr(get_runtime_config(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,374 @@
+"""
+Offline stand-in for an OpenAI-compatible LLM server.
+
+Implements the endpoints server/config.py targets (chat completions, with and without
+streaming, embeddings and the model list) so run_llm_query, the router, rag_utils and
+bdg_utils can run without Cloudflare or LM Studio. Responses come from a script of
+regex rules; latency is drawn from a configurable distribution with a seeded RNG; 429 and
+5xx errors (with Retry-After) can be injected at a fixed rate or for the next N requests;
+usage is accounted per model and exposed at /mock/usage.
+
+Run standalone:
+    python -m server.mock_llm --port 8089 --latency lognormal:0.4,0.5 --rate-429 0.05
+then select it with config.set_mode("mock"), or set MOCK_LLM_URL to point elsewhere.
+
+Or in-process, e.g. from a benchmark:
+    server = start_mock_server(port=0, latency="fixed:0.05")
+    ... server.base_url ...
+    server.shutdown()
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 8089
+EMBEDDING_DIMENSIONS = 768
+DEFAULT_COMPLETION_TOKENS = 120
+
+# Default script: canned answers for the structured calls the app makes, matched against the system prompt
+DEFAULT_RULES = [
+    {
+        "match": r"request router",
+        "response": '{"prompt_type": "scope_of_work_question", "confidence": 0.9, "data_sources": {"knowledge_base": 0.2, "project_cost_data": 0.1}, "parameters": {}}',
+    },
+    {"match": r"JSON list of (the )?edit operations", "response": "[]"},
+    {"match": r"JSON list of section numbers", "response": "[4, 6]"},
+    {"match": r"list of the selected categories", "response": '["Walls", "Floors", "Roofs"]'},
+    {"match": r"maintain a running summary", "response": "The user and assistant have been refining the project's scope of work."},
+]
+
+WORDS = (
+    "the architect shall provide services for the project in accordance with the scope of work "
+    "including design development construction documents coordination review and administration"
+).split()
+
+
+def estimate_tokens(text) -> int:
+    """Approximate token count, ~4 characters per token."""
+    return len(str(text)) // 4 + 1
+
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution spec into a function of a random.Random returning seconds.
+    Specs: "fixed:S", "uniform:LO,HI", "normal:MEAN,SD", "lognormal:MEDIAN,SIGMA". None or "" means no delay.
+    """
+    if not spec:
+        return lambda rng: 0.0
+    if callable(spec):
+        return spec
+    if isinstance(spec, (int, float)):
+        return lambda rng: float(spec)
+    kind, _, args = str(spec).partition(":")
+    values = [float(value) for value in args.split(",") if value.strip()]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec!r}")
+
+
+def hashed_embedding(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> list:
+    """
+    Deterministic bag-of-words embedding: texts that share words have a higher cosine similarity,
+    which is enough to exercise the embedding router and category index.
+    """
+    vector = [0.0] * dimensions
+    for word in re.findall(r"[a-z0-9]+", str(text).lower()):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % dimensions
+        vector[index] += 1.0 if digest[4] % 2 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class MockState:
+    """Script, latency and failure settings plus usage counters, shared by all request handlers."""
+
+    def __init__(self, rules=None, latency=None, token_latency=None, embedding_latency=None,
+                 rate_429=0.0, rate_5xx=0.0, retry_after=1.0, seed=0, completion_tokens=DEFAULT_COMPLETION_TOKENS):
+        self.rules = [(re.compile(rule["match"], re.IGNORECASE), rule["response"]) for rule in (DEFAULT_RULES if rules is None else rules)]
+        self.latency = parse_latency(latency)
+        self.token_latency = parse_latency(token_latency)
+        self.embedding_latency = parse_latency(embedding_latency)
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self.completion_tokens = completion_tokens
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.scripted_failures = []
+        self.reset_usage()
+
+    def reset_usage(self):
+        with self.lock:
+            self.usage = {"requests": 0, "errors": {}, "models": {}}
+
+    def fail_next(self, count: int, status: int = 429):
+        """Fail the next count requests with status, before any random injection."""
+        with self.lock:
+            self.scripted_failures.extend([status] * count)
+
+    def sample(self, distribution) -> float:
+        with self.lock:
+            return distribution(self.rng)
+
+    def injected_failure(self):
+        """Return the status code to fail this request with, or None."""
+        with self.lock:
+            if self.scripted_failures:
+                return self.scripted_failures.pop(0)
+            roll = self.rng.random()
+        if roll < self.rate_429:
+            return 429
+        if roll < self.rate_429 + self.rate_5xx:
+            return 503
+        return None
+
+    def respond(self, messages: list, max_tokens: int) -> str:
+        """Pick the scripted response for a conversation, or generate filler text."""
+        system = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+        user = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "user")
+        for pattern, response in self.rules:
+            if pattern.search(system) or pattern.search(user):
+                return response
+        # Deterministic per input so cached and uncached runs see the same text
+        rng = random.Random(hashlib.sha1((system + user).encode("utf-8")).hexdigest())
+        count = min(self.completion_tokens, max_tokens or self.completion_tokens)
+        return " ".join(rng.choice(WORDS) for _ in range(count))
+
+    def record(self, model: str, prompt_tokens: int, completion_tokens: int, status: int = 200):
+        with self.lock:
+            self.usage["requests"] += 1
+            if status != 200:
+                self.usage["errors"][str(status)] = self.usage["errors"].get(str(status), 0) + 1
+                return
+            model_usage = self.usage["models"].setdefault(model, {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            model_usage["requests"] += 1
+            model_usage["prompt_tokens"] += prompt_tokens
+            model_usage["completion_tokens"] += completion_tokens
+
+    def usage_snapshot(self) -> dict:
+        with self.lock:
+            return json.loads(json.dumps(self.usage))
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Request handler; the server's MockState is at self.server.state."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _fail(self, status: int, model: str):
+        state = self.server.state
+        state.record(model, 0, 0, status=status)
+        headers = {}
+        if status == 429:
+            headers = {"retry-after": f"{state.retry_after:g}", "retry-after-ms": str(int(state.retry_after * 1000))}
+            error = {"message": "Rate limit exceeded (injected by mock server)", "type": "rate_limit_exceeded", "code": "rate_limit_exceeded"}
+        else:
+            error = {"message": "Service unavailable (injected by mock server)", "type": "server_error", "code": None}
+        self._send_json(status, {"error": error}, headers)
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        if path.endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock-large", "object": "model"}, {"id": "mock-small", "object": "model"}, {"id": "mock-embed", "object": "model"}]})
+        elif path == "/mock/usage":
+            self._send_json(200, self.server.state.usage_snapshot())
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        try:
+            body = self._read_json()
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+            return
+        if path.endswith("/chat/completions"):
+            self._chat_completions(body)
+        elif path.endswith("/embeddings"):
+            self._embeddings(body)
+        elif path == "/mock/reset":
+            self.server.state.reset_usage()
+            self._send_json(200, {"ok": True})
+        elif path == "/mock/fail":
+            self.server.state.fail_next(int(body.get("count", 1)), int(body.get("status", 429)))
+            self._send_json(200, {"ok": True})
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _chat_completions(self, body: dict):
+        state = self.server.state
+        model = body.get("model", "mock")
+        failure = state.injected_failure()
+        if failure:
+            self._fail(failure, model)
+            return
+
+        messages = body.get("messages", [])
+        text = state.respond(messages, body.get("max_tokens"))
+        prompt_tokens = sum(estimate_tokens(m.get("content", "")) for m in messages)
+        completion_tokens = estimate_tokens(text)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        # Time to first token
+        time.sleep(state.sample(state.latency))
+        if not body.get("stream"):
+            state.record(model, prompt_tokens, completion_tokens)
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        # Server-sent events; HTTP/1.0 closes the connection to end the stream
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        def send_chunk(delta, finish_reason=None, chunk_usage=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+            }
+            if chunk_usage is not None:
+                chunk["usage"] = chunk_usage
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            send_chunk({"role": "assistant", "content": ""})
+            for token in re.findall(r"\S+\s*", text):
+                send_chunk({"content": token})
+                time.sleep(state.sample(state.token_latency))
+            send_chunk({}, finish_reason="stop")
+            if (body.get("stream_options") or {}).get("include_usage"):
+                send_chunk(None, chunk_usage=usage)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading
+            pass
+        state.record(model, prompt_tokens, completion_tokens)
+
+    def _embeddings(self, body: dict):
+        state = self.server.state
+        model = body.get("model", "mock-embed")
+        failure = state.injected_failure()
+        if failure:
+            self._fail(failure, model)
+            return
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        time.sleep(state.sample(state.embedding_latency))
+        prompt_tokens = sum(estimate_tokens(text) for text in inputs)
+        state.record(model, prompt_tokens, 0)
+        self._send_json(200, {
+            "object": "list",
+            "model": model,
+            "data": [{"object": "embedding", "index": i, "embedding": hashed_embedding(text)} for i, text in enumerate(inputs)],
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        })
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, state: MockState):
+        super().__init__(address, MockHandler)
+        self.state = state
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def load_rules(path: str) -> list:
+    """Read a script file: {"rules": [{"match": "<regex>", "response": "<text>"}, ...]}."""
+    with open(path, "r") as f:
+        return json.load(f)["rules"]
+
+
+def start_mock_server(host: str = "127.0.0.1", port: int = DEFAULT_PORT, **options) -> MockLLMServer:
+    """Start the mock server on a daemon thread and return it. Use port=0 for a free port."""
+    server = MockLLMServer((host, port), MockState(**options))
+    threading.Thread(target=server.serve_forever, name="mock-llm-server", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline OpenAI-compatible LLM server for development and benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--script", help="JSON file with response rules")
+    parser.add_argument("--latency", default="fixed:0.2", help="Time to first token, e.g. fixed:0.2, uniform:0.1,0.5, lognormal:0.4,0.5")
+    parser.add_argument("--token-latency", default="fixed:0.01", help="Delay between streamed tokens")
+    parser.add_argument("--embedding-latency", default="fixed:0.02")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests rejected with 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="Fraction of requests rejected with 503")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    state = MockState(
+        rules=load_rules(args.script) if args.script else None,
+        latency=args.latency,
+        token_latency=args.token_latency,
+        embedding_latency=args.embedding_latency,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    server = MockLLMServer((args.host, args.port), state)
+    print(f"Mock LLM server listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
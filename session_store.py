@@ -0,0 +1,332 @@
+"""
+Durable session persistence in SQLite.
+
+Each session's documents (the scope of work and the assumptions and exclusions) are stored
+as numbered, zlib-compressed JSON snapshots, written only when their content changes, next
+to the session's message log. Resuming a session reads its newest snapshot and its messages
+by primary key, so nothing is regenerated. Any earlier version can be restored (restoring
+writes it again as the newest version, so no version is lost) and old versions are pruned.
+
+Sessions are named by the ?session= query parameter, so a refreshed or bookmarked URL resumes
+the same work after a browser refresh or a redeploy.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+import zlib
+from array import array
+
+from llm_cache import CACHE_DIR, content_hash
+from message_store import MessageStore, get_message_store
+
+SESSION_DB_FILE = "sessions.sqlite3"
+
+DOCUMENT_KEYS = ("scope_of_work", "ASSUMPTIONS_AND_EXCLUSIONS")
+KEEP_VERSIONS = 50  # Snapshots kept per session when pruning
+PRUNE_EVERY_N_SNAPSHOTS = 20
+SESSION_TTL_SECONDS = 30 * 24 * 60 * 60  # Sessions untouched for longer than this are deleted when pruning
+
+QUERY_PARAM = "session"
+SESSION_ID_KEY = "session_id"  # Streamlit session state key of the current session's id
+
+
+def compress(documents: dict) -> bytes:
+    return zlib.compress(json.dumps(documents, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def decompress(data: bytes) -> dict:
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+class _Persisted:
+    """
+    How much of one MessageStore is persisted. Messages get session-wide ids when they are saved,
+    so two tabs open on the same session append to its log instead of overwriting each other.
+    """
+
+    __slots__ = ("session_id", "message_ids", "history")
+
+    def __init__(self, session_id, message_ids=(), history=0):
+        self.session_id = session_id
+        self.message_ids = array("q", message_ids)  # Database id of each persisted message, by store id
+        self.history = history
+
+
+class SessionStore:
+    """
+    SQLite store of versioned document snapshots and message logs per session.
+    Safe to share between threads. If the database is unavailable, sessions are simply not persisted.
+    """
+
+    def __init__(self, path=None, keep_versions=KEEP_VERSIONS, ttl_seconds=SESSION_TTL_SECONDS):
+        self.path = path or os.path.join(CACHE_DIR, SESSION_DB_FILE)
+        self.keep_versions = keep_versions
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disabled = False
+        self._digests = {}  # session id -> digest of the newest snapshot
+        self._persisted = weakref.WeakKeyDictionary()  # MessageStore -> _Persisted
+        self._snapshots_since_prune = 0
+
+        self.snapshots = 0
+        self.resumes = 0
+
+    def _connect(self):
+        """Open the SQLite database on first use. Returns None if it is unavailable."""
+        if self._conn is not None or self._disabled:
+            return self._conn
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                "session_id TEXT NOT NULL, version INTEGER NOT NULL, created_at REAL NOT NULL, "
+                "digest TEXT NOT NULL, data BLOB NOT NULL, "
+                "PRIMARY KEY (session_id, version)) WITHOUT ROWID"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "session_id TEXT NOT NULL, message_id INTEGER NOT NULL, role TEXT NOT NULL, "
+                "content TEXT NOT NULL, tokens INTEGER NOT NULL, history_position INTEGER, "
+                "PRIMARY KEY (session_id, message_id)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at)")
+            conn.commit()
+            self._conn = conn
+        except (sqlite3.Error, OSError) as e:
+            logging.warning(f"[function=SessionStore._connect] [description=Session store unavailable, sessions will not be persisted: {e}]")
+            self._disabled = True
+        return self._conn
+
+    def _saved_digest(self, conn, session_id):
+        if session_id not in self._digests:
+            row = conn.execute(
+                "SELECT digest FROM snapshots WHERE session_id = ? ORDER BY version DESC LIMIT 1", (session_id,)
+            ).fetchone()
+            self._digests[session_id] = row[0] if row else None
+        return self._digests[session_id]
+
+    def save(self, session_id: str, documents: dict, message_store: MessageStore):
+        """Persist a new snapshot if the documents changed, and any new messages. Returns the new version or None."""
+        digest = content_hash(documents)
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            try:
+                saved_digest = self._saved_digest(conn, session_id)
+                persisted = self._persisted.get(message_store)
+                if persisted is None or persisted.session_id != session_id:
+                    persisted = _Persisted(session_id)
+                new_messages = message_store.rows(len(persisted.message_ids))
+                new_history = message_store.history_ids(persisted.history)
+                if digest == saved_digest and not new_messages and not new_history:
+                    return None
+
+                now = time.time()
+                version = None
+                conn.execute(
+                    "INSERT INTO sessions (session_id, created_at, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (session_id) DO UPDATE SET updated_at = excluded.updated_at",
+                    (session_id, now, now),
+                )
+                if digest != saved_digest:
+                    row = conn.execute("SELECT MAX(version) FROM snapshots WHERE session_id = ?", (session_id,)).fetchone()
+                    version = (row[0] or 0) + 1
+                    conn.execute(
+                        "INSERT INTO snapshots (session_id, version, created_at, digest, data) VALUES (?, ?, ?, ?, ?)",
+                        (session_id, version, now, digest, compress(documents)),
+                    )
+                # Ids and history positions continue the session's log, whichever tab wrote it
+                next_id, next_position = conn.execute(
+                    "SELECT COALESCE(MAX(message_id), -1) + 1, COALESCE(MAX(history_position), -1) + 1 "
+                    "FROM messages WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                message_ids = persisted.message_ids + array("q", range(next_id, next_id + len(new_messages)))
+                conn.executemany(
+                    "INSERT INTO messages (session_id, message_id, role, content, tokens) VALUES (?, ?, ?, ?, ?)",
+                    [(session_id, message_ids[store_id], role, content, tokens) for store_id, role, content, tokens in new_messages],
+                )
+                conn.executemany(
+                    "UPDATE messages SET history_position = ? WHERE session_id = ? AND message_id = ?",
+                    [(position, session_id, message_ids[store_id]) for position, store_id in enumerate(new_history, next_position)],
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                conn.rollback()
+                logging.warning(f"[function=SessionStore.save] [description=Saving session {session_id} failed: {e}]")
+                return None
+
+            self._digests[session_id] = digest
+            persisted.message_ids = message_ids
+            persisted.history += len(new_history)
+            self._persisted[message_store] = persisted
+            if version is not None:
+                self.snapshots += 1
+                self._snapshots_since_prune += 1
+                if self._snapshots_since_prune >= PRUNE_EVERY_N_SNAPSHOTS:
+                    self._prune(conn, now)
+            return version
+
+    def load(self, session_id: str):
+        """Return (documents, message_store) of a saved session, or None if it is unknown."""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            try:
+                snapshot = conn.execute(
+                    "SELECT digest, data FROM snapshots WHERE session_id = ? ORDER BY version DESC LIMIT 1", (session_id,)
+                ).fetchone()
+                rows = conn.execute(
+                    "SELECT role, content, tokens, history_position, message_id FROM messages WHERE session_id = ? ORDER BY message_id",
+                    (session_id,),
+                ).fetchall()
+            except sqlite3.Error as e:
+                logging.warning(f"[function=SessionStore.load] [description=Loading session {session_id} failed: {e}]")
+                return None
+            if snapshot is None and not rows:
+                return None
+
+            history = sorted((row[3], store_id) for store_id, row in enumerate(rows) if row[3] is not None)
+            message_store = MessageStore.restore([row[:3] for row in rows], [store_id for _, store_id in history])
+            self._digests[session_id] = snapshot[0] if snapshot else None
+            self._persisted[message_store] = _Persisted(session_id, [row[4] for row in rows], len(history))
+            self.resumes += 1
+            return (decompress(snapshot[1]) if snapshot else None), message_store
+
+    def versions(self, session_id: str) -> list:
+        """(version, created_at) of a session's snapshots, newest first."""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return []
+            return conn.execute(
+                "SELECT version, created_at FROM snapshots WHERE session_id = ? ORDER BY version DESC", (session_id,)
+            ).fetchall()
+
+    def load_version(self, session_id: str, version: int):
+        """The documents of one snapshot, or None."""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            row = conn.execute(
+                "SELECT data FROM snapshots WHERE session_id = ? AND version = ?", (session_id, version)
+            ).fetchone()
+            return decompress(row[0]) if row else None
+
+    def _prune(self, conn, now):
+        """Keep the newest keep_versions snapshots of every session and delete expired sessions."""
+        self._snapshots_since_prune = 0
+        try:
+            expired = [row[0] for row in conn.execute(
+                "SELECT session_id FROM sessions WHERE updated_at < ?", (now - self.ttl_seconds,)
+            ).fetchall()]
+            for session_id in expired:
+                self._delete(conn, session_id)
+            conn.execute(
+                "DELETE FROM snapshots WHERE (session_id, version) IN ("
+                "SELECT session_id, version FROM ("
+                "SELECT session_id, version, ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY version DESC) AS rank "
+                "FROM snapshots) WHERE rank > ?)",
+                (self.keep_versions,),
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"[function=SessionStore._prune] [description=Pruning sessions failed: {e}]")
+
+    def prune(self):
+        """Prune old versions and expired sessions now."""
+        with self._lock:
+            conn = self._connect()
+            if conn is not None:
+                self._prune(conn, time.time())
+
+    def _delete(self, conn, session_id):
+        for table in ("snapshots", "messages", "sessions"):
+            conn.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+        self._digests.pop(session_id, None)
+        # Stores of a deleted session are written again in full by their next save
+        for message_store, persisted in list(self._persisted.items()):
+            if persisted.session_id == session_id:
+                del self._persisted[message_store]
+
+    def delete(self, session_id: str):
+        with self._lock:
+            conn = self._connect()
+            if conn is not None:
+                self._delete(conn, session_id)
+                conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"snapshots_written": self.snapshots, "resumes": self.resumes, "sessions_tracked": len(self._digests)}
+
+
+session_store = SessionStore()
+
+
+def session_documents(session_state) -> dict:
+    return {key: session_state.get(key) for key in DOCUMENT_KEYS}
+
+
+def open_session():
+    """
+    Resume the session named in the URL, or name a new one. Runs once per Streamlit session,
+    before the documents are seeded with their defaults. Returns the session id.
+    """
+    import streamlit as st
+    if SESSION_ID_KEY in st.session_state:
+        return st.session_state[SESSION_ID_KEY]
+
+    session_id = st.query_params.get(QUERY_PARAM)
+    saved = session_store.load(session_id) if session_id else None
+    if saved is not None:
+        documents, message_store = saved
+        for key, value in (documents or {}).items():
+            if value is not None:
+                st.session_state[key] = value
+        st.session_state["message_store"] = message_store
+        logging.info(f"[function=open_session] [description=Resumed session {session_id}]")
+    elif not session_id:
+        session_id = uuid.uuid4().hex
+        st.query_params[QUERY_PARAM] = session_id
+    st.session_state[SESSION_ID_KEY] = session_id
+    return session_id
+
+
+def save_session():
+    """Persist the current Streamlit session's documents and messages if they changed."""
+    import streamlit as st
+    session_id = st.session_state.get(SESSION_ID_KEY)
+    if session_id is not None:
+        session_store.save(session_id, session_documents(st.session_state), get_message_store())
+
+
+def restore_version(version: int) -> bool:
+    """Make one of the current session's snapshots the current documents. Saved again as the newest version on the next save."""
+    import streamlit as st
+    documents = session_store.load_version(st.session_state.get(SESSION_ID_KEY), version)
+    if documents is None:
+        return False
+    for key, value in documents.items():
+        if value is not None:
+            st.session_state[key] = value
+    return True
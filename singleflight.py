@@ -0,0 +1,168 @@
+"""
+Single-flight coalescing of identical in-flight requests.
+
+When several sessions or reruns make the same deterministic request at the same time, the
+first caller (the leader) makes the upstream call and every other caller with the same key
+waits for it and receives the same result, or the same exception. Only requests that are in
+flight at the same time are coalesced; completed results are the response cache's job.
+"""
+
+import asyncio
+import copy
+import functools
+import threading
+
+import server.config as config
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key, for threads (do) and for the LLM event loop (do_async)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """
+        Run fn() unless a call with the same key is already in flight, in which case wait for its result.
+        Returns (result, leader) where leader is False if the result was shared.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, True
+
+    async def do_async(self, key, coro_fn):
+        """
+        Await coro_fn() unless a call with the same key is already in flight on this loop, in which case await its result.
+        Returns (result, leader) where leader is False if the result was shared.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            future = self._async_calls.get((loop, key))
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                future = self._async_calls[(loop, key)] = loop.create_future()
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            # Shielded, so a cancelled follower does not cancel the result for everyone else
+            return await asyncio.shield(future), False
+
+        try:
+            result = await coro_fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                del self._async_calls[(loop, key)]
+        return result, True
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._async_calls)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.leaders + self.coalesced
+            return {
+                "calls": total,
+                "upstream_calls": self.leaders,
+                "coalesced": self.coalesced,
+                "coalesce_rate": self.coalesced / total if total else 0.0,
+                "in_flight": len(self._calls) + len(self._async_calls),
+            }
+
+
+# Shared by run_llm_query and run_llm_query_async, keyed by the response cache key
+llm_flight = SingleFlight("llm")
+# Shared by the classifier and routing functions, keyed by function and arguments
+classifier_flight = SingleFlight("classifier")
+
+
+def _coalesce_key(func, args, kwargs, ignore):
+    return (
+        func.__qualname__,
+        config.get_runtime_config(),
+        repr(args),
+        repr(sorted((k, v) for k, v in kwargs.items() if k not in ignore)),
+    )
+
+
+def coalesce(flight: SingleFlight, ignore=("request_id",)):
+    """
+    Decorator: coalesce concurrent calls of a function with equal arguments.
+    Arguments named in ignore (e.g. request_id) are not part of the key. The caller's runtime
+    configuration is, so sessions on different backends or models never share a result. Callers
+    that shared a result receive a deep copy, so they can modify it without affecting each other.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = _coalesce_key(func, args, kwargs, ignore)
+            result, leader = flight.do(key, lambda: func(*args, **kwargs))
+            return result if leader else copy.deepcopy(result)
+        return wrapper
+    return decorator
+
+
+def coalesce_async(flight: SingleFlight, ignore=("request_id",)):
+    """Decorator: coalesce for coroutine functions, see coalesce."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = _coalesce_key(func, args, kwargs, ignore)
+            result, leader = await flight.do_async(key, lambda: func(*args, **kwargs))
+            return result if leader else copy.deepcopy(result)
+        return wrapper
+    return decorator
+
+
+def singleflight_stats() -> dict:
+    return {"llm": llm_flight.stats(), "classifier": classifier_flight.stats()}
@@ -0,0 +1,212 @@
+"""
+Tolerant parsing of structured LLM outputs.
+
+Models wrap JSON in code fences, add a sentence before or after it, emit Python literals
+instead of JSON, or stop mid-list when they hit max_tokens. parse_structured salvages all of
+these locally: it strips fences and reasoning blocks, extracts the first JSON/Python value,
+closes whatever the truncation left open (dropping a half-written trailing element), and
+validates the result against the schema for its output type.
+"""
+
+import ast
+import json
+import logging
+import re
+import threading
+
+FENCE = re.compile(r"```[a-zA-Z]*\s*\n?(.*?)(?:```|$)", re.DOTALL)
+THINK_BLOCK = re.compile(r"<think>.*?(?:</think>|$)", re.DOTALL)
+
+# Give up repairing after trying this many cut points
+MAX_REPAIR_ATTEMPTS = 50
+
+_stats = {"clean": 0, "repaired": 0, "failed": 0}
+_stats_lock = threading.Lock()
+
+
+class StructuredOutputError(ValueError):
+    """Raised when a response cannot be salvaged into the expected structure."""
+
+
+def _record(outcome: str):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def parse_stats() -> dict:
+    """Return how many responses parsed cleanly, needed repair, or could not be salvaged."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def strip_wrappers(text: str) -> str:
+    """Remove reasoning blocks and code fences, keeping the content of the first fence."""
+    text = THINK_BLOCK.sub("", str(text or ""))
+    match = FENCE.search(text)
+    if match and match.group(1).strip():
+        return match.group(1)
+    return text
+
+
+def _scan(text: str, start: int):
+    """
+    Walk text from the opening bracket at start, tracking strings and nesting.
+    Returns (end, stack, cut_points, in_string): end is the index after the matching close
+    bracket or None if the value is truncated, stack holds the brackets still open at the end
+    of text, and cut_points are (offset from start, stack) pairs recorded at every comma.
+    """
+    closing = {"[": "]", "{": "}"}
+    stack = []
+    cut_points = []
+    quote = None
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+            continue
+        if char in "\"'":
+            quote = char
+        elif char in closing:
+            stack.append(closing[char])
+        elif char in "]}":
+            if stack and stack[-1] == char:
+                stack.pop()
+            if not stack:
+                return i + 1, [], cut_points, False
+        elif char == ",":
+            cut_points.append((i - start, list(stack)))
+    return None, stack, cut_points, quote is not None
+
+
+def _load(candidate: str):
+    """Parse a candidate as JSON, falling back to a Python literal."""
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return ast.literal_eval(candidate)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        raise StructuredOutputError("not a JSON or Python literal")
+
+
+def _close(fragment: str, stack: list) -> str:
+    return fragment.rstrip().rstrip(",") + "".join(reversed(stack))
+
+
+def _find_opener(text: str, openers: str, begin: int = 0) -> int:
+    """Index of the first of the opening brackets in openers at or after begin, or -1."""
+    found = [index for index in (text.find(opener, begin) for opener in openers) if index != -1]
+    return min(found) if found else -1
+
+
+def extract_value(text: str, opener: str):
+    """
+    Extract and load the first value starting with opener ("[" or "{", or "[{" for either) from text.
+    Returns (value, repaired). Raises StructuredOutputError if nothing can be salvaged.
+    """
+    text = strip_wrappers(text)
+    start = _find_opener(text, opener)
+    if start == -1:
+        raise StructuredOutputError(f"no {opener!r} in response")
+
+    # Prose may contain brackets too ("the [phase] names"), so try each complete value in turn
+    while start != -1:
+        end, stack, cut_points, in_string = _scan(text, start)
+        if end is None:
+            return _repair(text[start:], text[start], stack, cut_points, in_string), True
+        try:
+            return _load(text[start:end]), False
+        except StructuredOutputError:
+            start = _find_opener(text, opener, start + 1)
+    raise StructuredOutputError(f"no valid value starting with {opener!r} in response")
+
+
+def _repair(fragment: str, opener: str, stack: list, cut_points: list, in_string: bool):
+    """Close a truncated value, trying the longest candidate first."""
+    # A half-written string is dropped rather than closed, so a truncated item never looks like a complete one
+    candidates = []
+    if not in_string:
+        candidates.append(_close(fragment, stack))
+    for index, stack_at_cut in reversed(cut_points[-MAX_REPAIR_ATTEMPTS:]):
+        candidates.append(_close(fragment[:index], stack_at_cut))
+    # Nothing complete yet: an empty container
+    candidates.append(opener + {"[": "]", "{": "}"}[opener])
+    for candidate in candidates:
+        try:
+            return _load(candidate)
+        except StructuredOutputError:
+            continue
+    raise StructuredOutputError("response is truncated beyond repair")
+
+
+def _string_list(value, label: str) -> list:
+    if not isinstance(value, list):
+        raise StructuredOutputError(f"{label} must be a list")
+    return [str(item).strip() for item in value if isinstance(item, (str, int, float)) and str(item).strip()]
+
+
+def validate_string_list(value) -> list:
+    return _string_list(value, "response")
+
+
+def validate_number_list(value) -> list:
+    if not isinstance(value, list):
+        raise StructuredOutputError("response must be a list")
+    numbers = []
+    for item in value:
+        try:
+            numbers.append(int(item))
+        except (TypeError, ValueError):
+            continue
+    return numbers
+
+
+def validate_operations(value) -> list:
+    """A list of operation objects; each operation is checked when it is applied (see scope_patch)."""
+    if isinstance(value, dict):
+        # A single operation without the surrounding list
+        value = [value]
+    if not isinstance(value, list):
+        raise StructuredOutputError("operations must be a list")
+    return [operation for operation in value if isinstance(operation, dict)]
+
+
+def validate_object(value) -> dict:
+    if not isinstance(value, dict):
+        raise StructuredOutputError("response must be an object")
+    return value
+
+
+# Output type -> (opening brackets accepted, validator)
+SCHEMAS = {
+    "categories": ("[", validate_string_list),
+    "section_numbers": ("[", validate_number_list),
+    "operations": ("[{", validate_operations),
+    "route": ("{", validate_object),
+}
+
+
+def parse_structured(text: str, kind: str):
+    """
+    Parse an LLM response into the structure for kind (a key of SCHEMAS).
+    Raises StructuredOutputError if the response cannot be salvaged.
+    """
+    opener, validate = SCHEMAS[kind]
+    try:
+        value, repaired = extract_value(text, opener)
+        value = validate(value)
+    except StructuredOutputError as e:
+        _record("failed")
+        raise StructuredOutputError(f"could not parse {kind}: {e}")
+    if repaired:
+        logging.info("[function=parse_structured] [description=Repaired truncated %s response]", kind)
+    _record("repaired" if repaired else "clean")
+    return value
+
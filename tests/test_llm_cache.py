@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from llm_cache import ResponseCache, content_hash, make_cache_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(path=str(tmp_path / "responses.sqlite3"), memory_capacity=2)
+
+
+def test_make_cache_key_depends_on_every_input():
+    base = make_cache_key("model", "system", [], "question", 0.0, 100)
+    assert base == make_cache_key("model", "system", None, "question", 0.0, 100)
+    assert base != make_cache_key("other", "system", [], "question", 0.0, 100)
+    assert base != make_cache_key("model", "system", [{"role": "user", "content": "hi"}], "question", 0.0, 100)
+    assert base != make_cache_key("model", "system", [], "question", 0.0, 200)
+
+
+def test_content_hash_ignores_key_order():
+    assert content_hash({"a": 1, "b": [1, 2]}) == content_hash({"b": [1, 2], "a": 1})
+    assert content_hash({"a": 1}) != content_hash({"a": 2})
+
+
+def test_get_returns_stored_value(cache):
+    assert cache.get("key") is None
+    cache.set("key", "response")
+    assert cache.get("key") == "response"
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_evicted_entries_are_served_from_disk(cache):
+    for key in ("a", "b", "c"):
+        cache.set(key, key.upper())
+    assert cache.stats()["memory_size"] == 2
+    assert cache.get("a") == "A"
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    ResponseCache(path=path).set("key", "response")
+    assert ResponseCache(path=path).get("key") == "response"
+
+
+def test_expired_entries_are_misses(cache):
+    cache.set("key", "response")
+    cache.ttl_seconds = 0
+    time.sleep(0.01)
+    assert cache.get("key") is None
+
+
+def test_clear_empties_both_tiers(cache):
+    cache.set("key", "response")
+    cache.clear()
+    assert cache.get("key") is None
+
+
+def test_unavailable_disk_tier_falls_back_to_memory(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    cache = ResponseCache(path=str(blocker / "responses.sqlite3"))
+    cache.set("key", "response")
+    assert cache.get("key") == "response"
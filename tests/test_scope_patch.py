@@ -0,0 +1,105 @@
+from scope_patch import apply_assumptions_patch, apply_scope_patch, parse_operations
+
+
+def make_scope():
+    return {
+        "Schematic Design": {"Architecture": ["Site plan", "Floor plans"], "Structural": ["Framing concept"]},
+        "Design Development": {"Architecture": ["Wall sections"]},
+    }
+
+
+def test_input_is_not_modified():
+    scope = make_scope()
+    apply_scope_patch(scope, [{"op": "remove_phase", "phase": "Schematic Design"}])
+    assert scope == make_scope()
+
+
+def test_names_match_ignoring_case_and_whitespace():
+    updated, applied, errors = apply_scope_patch(
+        make_scope(), [{"op": "add_item", "phase": "schematic  design", "discipline": "ARCHITECTURE", "item": "Elevations"}]
+    )
+    assert errors == []
+    assert updated["Schematic Design"]["Architecture"] == ["Site plan", "Floor plans", "Elevations"]
+
+
+def test_rename_phase_keeps_order():
+    updated, _, errors = apply_scope_patch(make_scope(), [{"op": "rename_phase", "phase": "Schematic Design", "new_name": "Concept"}])
+    assert errors == []
+    assert list(updated) == ["Concept", "Design Development"]
+
+
+def test_rename_phase_does_not_overwrite_an_existing_phase():
+    updated, applied, errors = apply_scope_patch(
+        make_scope(), [{"op": "rename_phase", "phase": "Schematic Design", "new_name": "design development"}]
+    )
+    assert applied == []
+    assert errors == ["phase 'design development' already exists"]
+    assert updated == make_scope()
+
+
+def test_rename_phase_may_change_case_only():
+    updated, _, errors = apply_scope_patch(make_scope(), [{"op": "rename_phase", "phase": "Schematic Design", "new_name": "schematic design"}])
+    assert errors == []
+    assert "schematic design" in updated
+
+
+def test_rename_discipline_does_not_overwrite_an_existing_discipline():
+    updated, _, errors = apply_scope_patch(
+        make_scope(), [{"op": "rename_discipline", "phase": "Schematic Design", "discipline": "Structural", "new_name": "Architecture"}]
+    )
+    assert errors == ["discipline 'Architecture' already exists"]
+    assert updated == make_scope()
+
+
+def test_rename_item_does_not_duplicate_an_existing_item():
+    updated, _, errors = apply_scope_patch(
+        make_scope(),
+        [{"op": "rename_item", "phase": "Schematic Design", "discipline": "Architecture", "item": "Site plan", "new_item": "floor plans"}],
+    )
+    assert errors == ["item 'floor plans' already exists"]
+    assert updated == make_scope()
+
+
+def test_move_item_creates_the_target():
+    updated, _, errors = apply_scope_patch(
+        make_scope(),
+        [{"op": "move_item", "phase": "Schematic Design", "discipline": "Structural", "item": "Framing concept",
+          "to_phase": "Design Development", "to_discipline": "Structural"}],
+    )
+    assert errors == []
+    assert updated["Schematic Design"]["Structural"] == []
+    assert updated["Design Development"]["Structural"] == ["Framing concept"]
+
+
+def test_bad_operations_are_reported_and_skipped():
+    operations = [
+        {"op": "explode"},
+        {"op": "remove_phase", "phase": "Construction"},
+        {"op": "add_phase", "phase": ""},
+        {"op": "add_phase", "phase": "Construction Administration"},
+    ]
+    updated, applied, errors = apply_scope_patch(make_scope(), operations)
+    assert applied == [operations[3]]
+    assert len(errors) == 3
+    assert "Construction Administration" in updated
+
+
+def test_assumptions_rename_discipline_does_not_overwrite():
+    assumptions = {"General": ["Owner provides survey"], "MEP": ["No commissioning"]}
+    updated, _, errors = apply_assumptions_patch(assumptions, [{"op": "rename_discipline", "discipline": "MEP", "new_name": "general"}])
+    assert errors == ["discipline 'general' already exists"]
+    assert updated == assumptions
+
+
+def test_assumptions_rename_item_does_not_duplicate():
+    assumptions = {"General": ["Owner provides survey", "No hazardous materials"]}
+    updated, _, errors = apply_assumptions_patch(
+        assumptions, [{"op": "rename_item", "discipline": "General", "item": "Owner provides survey", "new_item": "No hazardous materials"}]
+    )
+    assert errors == ["item 'No hazardous materials' already exists"]
+    assert updated == assumptions
+
+
+def test_parse_operations_salvages_fenced_output():
+    response = 'Here are the edits:\n```json\n[{"op": "add_phase", "phase": "Bidding"}]\n```'
+    assert parse_operations(response) == [{"op": "add_phase", "phase": "Bidding"}]
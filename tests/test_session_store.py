@@ -0,0 +1,121 @@
+import pytest
+
+import session_store as session_store_module
+from message_store import MessageStore
+from session_store import SessionStore, compress, decompress
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(path=str(tmp_path / "sessions.sqlite3"), keep_versions=3)
+
+
+def documents(item="Site plan"):
+    return {
+        "scope_of_work": {"Schematic Design": {"Architecture": [item]}},
+        "ASSUMPTIONS_AND_EXCLUSIONS": {"General": ["Owner provides survey"]},
+    }
+
+
+def messages():
+    message_store = MessageStore()
+    message_store.append("assistant", "Hello!")
+    prompt_id = message_store.append("user", "Add a site plan")
+    message_store.add_to_history(prompt_id)
+    message_store.append("assistant", "Done.", in_history=True)
+    return message_store
+
+
+def test_compress_round_trip():
+    assert decompress(compress(documents())) == documents()
+
+
+def test_unknown_session_loads_none(store):
+    assert store.load("missing") is None
+
+
+def test_save_and_load(store):
+    assert store.save("session", documents(), messages()) == 1
+    loaded_documents, message_store = store.load("session")
+    assert loaded_documents == documents()
+    assert [message for _, message in message_store.window(10)] == [message for _, message in messages().window(10)]
+    assert message_store.history() == [{"role": "user", "content": "Add a site plan"}, {"role": "assistant", "content": "Done."}]
+
+
+def test_unchanged_documents_write_no_version(store):
+    message_store = messages()
+    assert store.save("session", documents(), message_store) == 1
+    assert store.save("session", documents(), message_store) is None
+    message_store.append("user", "Thanks", in_history=True)
+    assert store.save("session", documents(), message_store) is None
+    assert store.versions("session")[0][0] == 1
+    assert len(store.load("session")[1]) == 4
+
+
+def test_each_change_is_a_version(store):
+    message_store = messages()
+    store.save("session", documents("Site plan"), message_store)
+    store.save("session", documents("Floor plans"), message_store)
+    assert [version for version, _ in store.versions("session")] == [2, 1]
+    assert store.load_version("session", 1) == documents("Site plan")
+    assert store.load_version("session", 3) is None
+
+
+def test_new_instance_continues_the_session(store):
+    message_store = messages()
+    store.save("session", documents("Site plan"), message_store)
+    reopened = SessionStore(path=store.path)
+    _, restored_messages = reopened.load("session")
+    restored_messages.append("user", "One more")
+    assert reopened.save("session", documents("Floor plans"), restored_messages) == 2
+    assert len(reopened.load("session")[1]) == 4
+
+
+def test_two_tabs_on_one_session_both_append(store):
+    store.save("session", documents(), messages())
+    _, first_tab = store.load("session")
+    _, second_tab = store.load("session")
+    first_tab.append("user", "From the first tab", in_history=True)
+    second_tab.append("user", "From the second tab", in_history=True)
+    store.save("session", documents(), first_tab)
+    store.save("session", documents(), second_tab)
+
+    _, resumed = store.load("session")
+    contents = [message["content"] for _, message in resumed.window(10)]
+    assert contents[3:] == ["From the first tab", "From the second tab"]
+    assert [message["content"] for message in resumed.history()][2:] == ["From the first tab", "From the second tab"]
+
+
+def test_prune_keeps_the_newest_versions(store):
+    message_store = messages()
+    for index in range(5):
+        store.save("session", documents(f"Item {index}"), message_store)
+    store.prune()
+    assert [version for version, _ in store.versions("session")] == [5, 4, 3]
+
+
+def test_prune_deletes_expired_sessions(store):
+    store.save("session", documents(), messages())
+    store.ttl_seconds = -1
+    store.prune()
+    assert store.load("session") is None
+
+
+def test_delete(store):
+    store.save("session", documents(), messages())
+    store.delete("session")
+    assert store.load("session") is None
+    assert store.versions("session") == []
+
+
+def test_unavailable_database_disables_persistence(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    store = SessionStore(path=str(blocker / "sessions.sqlite3"))
+    assert store.save("session", documents(), messages()) is None
+    assert store.load("session") is None
+
+
+def test_session_documents_reads_only_the_document_keys():
+    state = {**documents(), "messages": []}
+    assert session_store_module.session_documents(state) == documents()
@@ -0,0 +1,54 @@
+import pytest
+
+from structured_output import StructuredOutputError, extract_value, parse_structured, strip_wrappers
+
+
+def test_strip_wrappers_removes_fences_and_reasoning():
+    text = "<think>pondering</think>Here you go:\n```json\n[\"a\"]\n```\nDone."
+    assert strip_wrappers(text).strip() == '["a"]'
+
+
+def test_clean_json_is_not_repaired():
+    assert extract_value('["a", "b"]', "[") == (["a", "b"], False)
+
+
+def test_python_literals_are_accepted():
+    assert parse_structured("['a', 'b']", "categories") == ["a", "b"]
+
+
+def test_prose_around_the_value_is_ignored():
+    response = "The [phase] names are below.\n[1, 2, 3]\nLet me know if you need more."
+    assert parse_structured(response, "section_numbers") == [1, 2, 3]
+
+
+def test_truncated_list_drops_the_half_written_item():
+    assert extract_value('["first", "second", "thi', "[") == (["first", "second"], True)
+
+
+def test_truncated_nested_value_is_closed():
+    value, repaired = extract_value('{"op": "add_item", "items": [1, 2', "{")
+    assert repaired
+    assert value["op"] == "add_item"
+
+
+def test_single_operation_is_wrapped_in_a_list():
+    assert parse_structured('{"op": "add_phase", "phase": "Design"}', "operations") == [{"op": "add_phase", "phase": "Design"}]
+
+
+def test_number_list_skips_non_numbers():
+    assert parse_structured('[1, "2", "three"]', "section_numbers") == [1, 2]
+
+
+def test_unparseable_response_raises():
+    with pytest.raises(StructuredOutputError):
+        parse_structured("I could not find any categories.", "categories")
+
+
+def test_wrong_type_raises():
+    with pytest.raises(StructuredOutputError):
+        parse_structured("[1, 2]", "route")
+
+
+def test_truncated_operation_list_keeps_complete_operations():
+    response = '[{"op": "remove_phase", "phase": "Bidding"}, {"op": "add_pha'
+    assert parse_structured(response, "operations") == [{"op": "remove_phase", "phase": "Bidding"}]
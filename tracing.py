@@ -0,0 +1,227 @@
+"""
+Lightweight tracing spans for LLM and retrieval calls.
+
+Spans nest through a context variable, so they follow the call stack across threads
+and asyncio tasks. Finished spans go to an in-memory ring buffer and are appended to
+a JSONL file by a background thread, keeping file I/O off the request path. The file is
+rotated like a logging.handlers.RotatingFileHandler, so it never outgrows TRACE_MAX_BYTES.
+"""
+
+import atexit
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+from logger_setup import get_request_id
+
+TRACE_DIR = "logs"
+TRACE_FILE = "traces.jsonl"
+TRACE_MAX_BYTES = 10 * 1024 * 1024  # Rotate the trace file once it would grow past this
+TRACE_BACKUP_COUNT = 3  # Rotated files kept: traces.jsonl.1 (newest) to traces.jsonl.3
+FLUSH_INTERVAL_SECONDS = 2.0
+RECENT_SPANS_CAPACITY = 1000
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+_pending = deque()  # Finished spans waiting to be written
+_recent = deque(maxlen=RECENT_SPANS_CAPACITY)
+_writer_thread = None
+_writer_lock = threading.Lock()
+_flush_lock = threading.Lock()
+
+
+# Modules whose frames are skipped when naming the caller (decorator wrappers such as singleflight.coalesce)
+TRANSPARENT_MODULES = {"singleflight"}
+
+
+def get_caller(depth=2):
+    """
+    Name of the function depth frames up the stack, skipping decorator wrapper frames.
+    Uses sys._getframe, which is far cheaper than inspect.stack().
+    """
+    try:
+        frame = sys._getframe(depth)
+    except ValueError:
+        return None
+    while frame is not None and frame.f_globals.get("__name__") in TRANSPARENT_MODULES:
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else None
+
+
+class Span:
+    """
+    A timed operation with attributes. Use as a context manager to make it the current span,
+    or call finish() explicitly for spans that outlive the function that started them (streams).
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "request_id", "caller", "thread",
+                 "start_time", "start", "end", "attributes", "error", "_token")
+
+    def __init__(self, name, caller=None, request_id=None, parent=None, **attributes):
+        parent = parent if parent is not None else _current_span.get()
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent else None
+        self.request_id = request_id or (parent.request_id if parent else None) or get_request_id()
+        self.caller = caller
+        self.thread = threading.get_ident()
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+        self.attributes = attributes
+        self.error = None
+        self._token = None
+
+    def set(self, **attributes):
+        """Attach or overwrite attributes on the span."""
+        self.attributes.update(attributes)
+        return self
+
+    def mark(self, attribute):
+        """Record the seconds elapsed since the span started under the given attribute name."""
+        self.attributes[attribute] = time.perf_counter() - self.start
+        return self
+
+    @property
+    def duration(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+    def finish(self, error=None):
+        """End the span and queue it for export. Calling finish twice has no effect."""
+        if self.end is not None:
+            return
+        self.end = time.perf_counter()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        _record(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "request_id": self.request_id,
+            "caller": self.caller,
+            "thread": self.thread,
+            "start_time": self.start_time,
+            "duration": self.duration,
+            "error": self.error,
+            **self.attributes,
+        }
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._token is not None:
+            _current_span.reset(self._token)
+            self._token = None
+        self.finish(error=exc)
+        return False
+
+
+def start_span(name, caller=None, request_id=None, **attributes) -> Span:
+    """Start a span as a child of the current span (if any)."""
+    return Span(name, caller=caller, request_id=request_id, **attributes)
+
+
+def current_span():
+    """Return the innermost active span, or None."""
+    return _current_span.get()
+
+
+def _record(span):
+    _recent.append(span)
+    _pending.append(span)
+    _ensure_writer()
+
+
+def _ensure_writer():
+    global _writer_thread
+    if _writer_thread is not None:
+        return
+    with _writer_lock:
+        if _writer_thread is None:
+            _writer_thread = threading.Thread(target=_writer_loop, name="trace-writer", daemon=True)
+            _writer_thread.start()
+
+
+def _writer_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL_SECONDS)
+        flush()
+
+
+def _rotate(path):
+    """Shift path to path.1, path.1 to path.2 and so on, dropping the oldest."""
+    for index in range(TRACE_BACKUP_COUNT - 1, 0, -1):
+        source = f"{path}.{index}"
+        if os.path.exists(source):
+            os.replace(source, f"{path}.{index + 1}")
+    if TRACE_BACKUP_COUNT > 0:
+        os.replace(path, f"{path}.1")
+    else:
+        os.remove(path)
+
+
+def flush():
+    """Write every pending span to the JSONL trace file."""
+    with _flush_lock:
+        if not _pending:
+            return
+        lines = []
+        while _pending:
+            lines.append(json.dumps(_pending.popleft().to_dict(), default=str))
+        data = "\n".join(lines) + "\n"
+        path = os.path.join(TRACE_DIR, TRACE_FILE)
+        try:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            if os.path.exists(path) and os.path.getsize(path) + len(data.encode("utf-8")) > TRACE_MAX_BYTES:
+                _rotate(path)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(data)
+        except OSError:
+            # Tracing must never break a request; drop the batch
+            pass
+
+
+def recent_spans(num_spans=50, request_id=None) -> list:
+    """Return the most recent finished spans as dictionaries, optionally for one request only."""
+    spans = list(_recent)
+    if request_id:
+        spans = [span for span in spans if span.request_id == request_id]
+    return [span.to_dict() for span in spans[-num_spans:]]
+
+
+def span_stats(name, group_by=None) -> dict:
+    """
+    Duration statistics in seconds (count, median, p95, max) of the recent finished spans with
+    this name, grouped by the value of the group_by attribute if given.
+    """
+    groups = {}
+    for span in list(_recent):
+        if span.name == name:
+            key = span.attributes.get(group_by) if group_by else name
+            groups.setdefault(key, []).append(span.duration)
+    stats = {}
+    for key, durations in groups.items():
+        durations.sort()
+        stats[key] = {
+            "count": len(durations),
+            "median": durations[len(durations) // 2],
+            "p95": durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+            "max": durations[-1],
+        }
+    return stats
+
+
+atexit.register(flush)
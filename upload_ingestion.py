@@ -0,0 +1,163 @@
+"""
+Background ingestion of uploaded reference documents.
+
+Files uploaded in the sidebar are read with the readers in populate_database.py, split into
+the same overlapping chunks and embedded into a vector collection of their own per session, by
+a small worker pool. The script thread only queues the files and polls their progress, so a
+large upload never blocks the chat. Retrieval (see rag_utils.get_rag_context_from_query)
+searches the session's collection next to the shared one, including while it is still filling.
+"""
+
+import contextvars
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import server.config as config
+from project_utils.rag_utils import UPLOAD_COLLECTION_PREFIX
+from session_store import SESSION_ID_KEY
+from tracing import start_span
+
+MAX_INGEST_WORKERS = 2
+EMBED_BATCH_SIZE = 32  # Chunks embedded and added per request, so progress advances steadily
+INGEST_POLL_SECONDS = 1.0
+JOBS_KEY = "ingestion_jobs"
+
+_ingest_executor = ThreadPoolExecutor(max_workers=MAX_INGEST_WORKERS, thread_name_prefix="ingest")
+
+# The session whose uploads retrieval searches, set on the script thread and inherited by the
+# context provider threads (see activate_session_uploads)
+_upload_session = contextvars.ContextVar("upload_session", default=None)
+
+
+def upload_collection_name(session_id: str, mode: str) -> str:
+    """Collection of a session's uploads. Embeddings depend on the backend, so each mode has its own."""
+    digest = hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:24]
+    return f"{UPLOAD_COLLECTION_PREFIX}{digest}-{mode}"
+
+
+class IngestionJob:
+    """One uploaded file being read, chunked and embedded. Updated by the worker, read by the script thread."""
+
+    def __init__(self, file_name: str, size: int):
+        self.file_name = file_name
+        self.size = size
+        self.status = "queued"  # queued, reading, embedding, done or failed
+        self.chunks_total = 0
+        self.chunks_done = 0
+        self.error = None
+        self.future = None
+        self.started_at = time.time()
+
+    @property
+    def progress(self) -> float:
+        if self.status == "done":
+            return 1.0
+        return self.chunks_done / self.chunks_total if self.chunks_total else 0.0
+
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+
+def _ingest(job: IngestionJob, uploaded_file, collection_name: str, mode: str):
+    # The readers and chromadb are heavy imports, so they are loaded here rather than on the script thread
+    from populate_database import read_document, split_text
+    from project_utils.rag_utils import get_upload_collection
+
+    with start_span("ingest_upload", file=job.file_name, size=job.size) as span:
+        job.status = "reading"
+        # read_document picks the reader by extension, so the temporary file keeps it
+        extension = os.path.splitext(job.file_name)[1].lower()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, f"upload{extension}")
+            with open(path, "wb") as f:
+                f.write(uploaded_file.getvalue())
+            text = read_document(path)
+        if not text.strip():
+            raise ValueError("No text could be extracted")
+
+        chunks, chunk_ids, metadata_list = split_text(text, job.file_name)
+        job.chunks_total = len(chunks)
+        job.status = "embedding"
+        collection = get_upload_collection(collection_name, mode)
+        # Replace the chunks of an earlier upload of a file with the same name
+        collection.delete(where={"source": job.file_name})
+        for i in range(0, len(chunks), EMBED_BATCH_SIZE):
+            end_idx = min(i + EMBED_BATCH_SIZE, len(chunks))
+            collection.add(
+                documents=chunks[i:end_idx],
+                ids=chunk_ids[i:end_idx],
+                metadatas=metadata_list[i:end_idx]
+            )
+            job.chunks_done = end_idx
+        span.set(chunks=len(chunks))
+    job.status = "done"
+
+
+def _run_job(job: IngestionJob, uploaded_file, collection_name: str, mode: str):
+    try:
+        _ingest(job, uploaded_file, collection_name, mode)
+    except Exception as e:
+        logging.warning("[function=ingest_upload] [description=Ingesting %s failed: %s]", job.file_name, e)
+        job.error = str(e) or type(e).__name__
+        job.status = "failed"
+
+
+def queue_uploads(uploaded_files) -> list:
+    """
+    Start ingesting the uploaded files that are not already queued for this session.
+    Returns the newly queued jobs. Runs on the script thread and does not wait for them.
+    """
+    import streamlit as st
+    jobs = st.session_state.setdefault(JOBS_KEY, {})
+    session_id = st.session_state.get(SESSION_ID_KEY)
+    if session_id is None:
+        return []
+    mode = config.get_mode()
+    collection_name = upload_collection_name(session_id, mode)
+
+    queued = []
+    for uploaded_file in uploaded_files or []:
+        key = getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+        if key in jobs:
+            continue
+        job = IngestionJob(uploaded_file.name, uploaded_file.size)
+        # Run with the caller's context so the ingestion span and backend follow the session
+        job.future = _ingest_executor.submit(
+            contextvars.copy_context().run, _run_job, job, uploaded_file, collection_name, mode
+        )
+        jobs[key] = job
+        queued.append(job)
+    return queued
+
+
+def ingestion_jobs() -> list:
+    """The current session's ingestion jobs, in upload order."""
+    import streamlit as st
+    return list(st.session_state.get(JOBS_KEY, {}).values())
+
+
+def pending_ingestions() -> list:
+    return [job for job in ingestion_jobs() if not job.done()]
+
+
+def activate_session_uploads():
+    """Make the current Streamlit session's uploads searchable by retrieval during this script run."""
+    import streamlit as st
+    _upload_session.set(st.session_state.get(SESSION_ID_KEY))
+
+
+def session_upload_collection(mode: str):
+    """The active session's collection of uploads for a mode, or None if it has none."""
+    from project_utils.rag_utils import get_upload_collection
+
+    session_id = _upload_session.get()
+    if session_id is None:
+        return None
+    try:
+        return get_upload_collection(upload_collection_name(session_id, mode), mode, create=False)
+    except Exception:
+        return None